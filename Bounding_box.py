@@ -1,12 +1,23 @@
 import os
 import cv2
-import numpy as np
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 from PIL import Image, ImageTk
-
-class BoundingBoxLabeler:
-    def __init__(self, root, project_folder):
+from catalog import open_catalog
+from image_session import FAST_INTERPOLATION, fit_scale, idle_interpolation, open_session
+from annotation_store import AnnotationStore, has_store, store_path
+from active_learning import UncertaintyScorer
+from thumbnails import ThumbnailBrowser
+from render_scheduler import RenderScheduler
+from input_trace import open_trace
+from perf_hud import PerfHud, open_perf
+from label_core import BoxAnnotator, BoxArray, read_classes_file, write_classes_file
+from prelabel import PreLabelWorker, PROPOSALS_FOLDER, PREDICTIONS_FOLDER, make_yolo_detector
+
+
+class BoundingBoxLabeler(BoxAnnotator):
+    def __init__(self, root, project_folder, model_path=None):
+        super().__init__()
         self.root = root
         self.root.title("Bounding Box Labeling Tool")
         try:
@@ -18,32 +29,25 @@ class BoundingBoxLabeler:
         self.project_folder = project_folder
         self.image_folder = os.path.join(project_folder, "images")
         self.labels_folder = os.path.join(project_folder, "Box_labels")
+        self.proposals_folder = os.path.join(project_folder, PROPOSALS_FOLDER)
+        self.predictions_folder = os.path.join(project_folder, PREDICTIONS_FOLDER)
         os.makedirs(self.labels_folder, exist_ok=True)
+        # single-file label store replaces Box_labels/*.txt when the project has one
+        self.store = AnnotationStore(store_path(project_folder)) if has_store(project_folder) else None
 
         # file lists
-        self.image_files = sorted([f for f in os.listdir(self.image_folder)
-                                   if f.lower().endswith((".png", ".jpg", ".jpeg", ".bmp"))])
+        self.catalog = open_catalog(self.image_folder)
+        self.image_files = list(self.catalog.files)
         self.image_index = 0
 
-        # classes: keep ordered list + color map (to preserve indices)
-        self.class_names = []              # list of class names in order -> index
-        self.class_colors = {}             # class_name -> (r,g,b)
-        self.current_class = None
-        self.bboxes = []
+        # model-assisted pre-labeling
+        self.prelabel_worker = None
 
-        # selection / interaction state
-        self.selected_box = None
-        self.drawing = False
-        self.dragging = False
-        self.resizing = False
-        self.resize_corner = None  # 'tl','tr','bl','br'
-        self.start_x_image = self.start_y_image = None
-        self.prev_mouse_x = self.prev_mouse_y = None
-
-        # view transform (image -> canvas)
-        self.scale = 1.0
-        self.offset_x = 0
-        self.offset_y = 0
+        # active learning: unlabeled images ordered by model uncertainty
+        self.uncertainty_scorer = None
+        self.uncertainty_order = tk.BooleanVar(value=False)
+        self.ranked_version = None
+        self.uncertainty_after = None
 
         # UI elements placeholders
         self.canvas = None
@@ -51,11 +55,10 @@ class BoundingBoxLabeler:
         self.class_entry = None
         self.class_dropdown = None
         self.tk_image = None
-        self.original_image = None
-        self.cv_image = None
 
         # build UI + bindings
         self.setup_ui()
+        self.trace = open_trace("box", project_folder, self.canvas)
         self.load_classes()   # load classes.txt if exists (populates class_names & class_colors)
 
         if self.image_files:
@@ -63,6 +66,9 @@ class BoundingBoxLabeler:
         else:
             messagebox.showinfo("Info", "No images found in project images folder.")
 
+        if model_path:
+            self.start_prelabeling(model_path)
+
     # ---------------- UI setup ----------------
     def setup_ui(self):
      # Main area on the left
@@ -104,6 +110,11 @@ class BoundingBoxLabeler:
 
      self.canvas = tk.Canvas(canvas_frame, bg="black", cursor="cross")
      self.canvas.grid(row=0, column=0, sticky="nsew")
+     # stage timings and the F3 overlay; free unless turned on
+     self.perf = open_perf()
+     self.hud = PerfHud(self.perf, self.root, self.canvas, "Bounding box view")
+     # mouse handlers only mark the view dirty; redraws are coalesced to one per frame
+     self.renderer = RenderScheduler(self.canvas, self.display_image, name="Bounding box view", hud=self.hud)
 
      # Scrollbars
      x_scroll = tk.Scrollbar(canvas_frame, orient="horizontal", command=self.canvas.xview)
@@ -136,6 +147,14 @@ class BoundingBoxLabeler:
 
      self.image_listbox.config(yscrollcommand=scrollbar.set)
      self.image_listbox.bind("<<ListboxSelect>>", self.on_image_select)
+     tk.Button(sidebar, text="Browse Thumbnails", command=self.browse_thumbnails).pack(fill="x", pady=(4, 0))
+
+     # ==== Pre-labeling ====
+     tk.Button(sidebar, text="Pre-label with Model", command=self.choose_prelabel_model).pack(fill="x", pady=(8, 2))
+     self.prelabel_label = tk.Label(sidebar, text="Pre-label: off", justify="left", anchor="w")
+     self.prelabel_label.pack(anchor="w")
+     tk.Checkbutton(sidebar, text="Most uncertain first", variable=self.uncertainty_order,
+                    command=self.toggle_uncertainty_order).pack(anchor="w", pady=(4, 0))
 
      # Load image list initially
      self.refresh_image_list()
@@ -162,20 +181,7 @@ class BoundingBoxLabeler:
         return os.path.join(self.project_folder, "classes.txt")
 
     def load_classes(self):
-        self.class_names = []
-        self.class_colors = {}
-        path = self.classes_file_path()
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) >= 5:
-                        # format: idx cls_name r g b
-                        idx = parts[0]  # ignore index, use order from file
-                        cls_name = " ".join(parts[1:-3])
-                        r,g,b = map(int, parts[-3:])
-                        self.class_names.append(cls_name)
-                        self.class_colors[cls_name] = (r,g,b)
+        self.class_names, self.class_colors = read_classes_file(self.classes_file_path())
         # update dropdown
         self.class_dropdown['values'] = self.class_names
         if self.class_names and not self.current_class:
@@ -183,21 +189,18 @@ class BoundingBoxLabeler:
             self.class_dropdown.set(self.current_class)
 
     def save_classes(self):
-        path = self.classes_file_path()
-        with open(path, "w", encoding="utf-8") as f:
-            for idx, cls_name in enumerate(self.class_names):
-                r,g,b = self.class_colors.get(cls_name, (0,255,0))
-                f.write(f"{idx} {cls_name} {r} {g} {b}\n")
+        write_classes_file(self.classes_file_path(), self.class_names, self.class_colors)
 
     def on_class_selected(self, event=None):
         sel = self.class_dropdown.get()
         if sel:
+            self.trace.record("class", name=sel)
             self.current_class = sel
             # if a box selected, optionally update it immediately
             if self.selected_box is not None:
-                self.bboxes[self.selected_box] = (sel, *self.bboxes[self.selected_box][1:])
+                self.set_box_class(self.selected_box, sel)
                 self.save_boxes()
-                self.display_image()
+                self.renderer.request()
 
     # ---------------- image & labels load/save ----------------
     def load_image(self):
@@ -205,80 +208,121 @@ class BoundingBoxLabeler:
         self.load_classes()
 
         img_path = os.path.join(self.image_folder, self.image_files[self.image_index])
-        self.cv_image = cv2.imread(img_path)
-        if self.cv_image is None:
+        # very large images open as a tiled session (the first open converts them once);
+        # large JPEGs paint from a reduced decode while full resolution loads
+        self.root.config(cursor="watch")
+        self.root.update_idletasks()
+        view = self.view_size()
+        self.trace.record("image", name=self.image_files[self.image_index], view=list(view))
+        with self.perf.stage("decode"):
+            session = open_session(img_path, fit=view)
+        self.root.config(cursor="")
+        if not session.loaded:
             messagebox.showerror("Error", f"Cannot open image: {img_path}")
             return
-        self.original_image = self.cv_image.copy()
-        self.bboxes = []
+        self.session = session
+        self.bboxes = BoxArray()
         self.selected_box = None
 
-        # reset view (center)
-        self.scale = 1.0
+        # reset view: fit images larger than the canvas, 1:1 otherwise
+        h, w = session.shape[:2]
+        self.scale = fit_scale((w, h), view)
         self.offset_x = 0
         self.offset_y = 0
 
-        # load label YOLO format if exists
-        label_path = os.path.join(self.labels_folder, f"{os.path.splitext(self.image_files[self.image_index])[0]}.txt")
-        if os.path.exists(label_path):
-            h, w = self.cv_image.shape[:2]
-            with open(label_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) == 5:
-                        cls_idx = int(parts[0])
-                        cx, cy, bw, bh = map(float, parts[1:])
-                        x1 = int((cx - bw/2) * w)
-                        y1 = int((cy - bh/2) * h)
-                        x2 = int((cx + bw/2) * w)
-                        y2 = int((cy + bh/2) * h)
-                        # map index -> class name if available
-                        if 0 <= cls_idx < len(self.class_names):
-                            cname = self.class_names[cls_idx]
-                        else:
-                            cname = f"class_{cls_idx}"
-                            if cname not in self.class_names:
-                                self.class_names.append(cname)
-                                self.class_colors.setdefault(cname, (0,255,0))
-                        self.bboxes.append((cname, x1, y1, x2, y2))
+        with self.perf.stage("labels"):
+            self.load_labels()
 
         # update listbox selection
         self.image_listbox.select_clear(0, tk.END)
         self.image_listbox.select_set(self.image_index)
         self.image_listbox.see(self.image_index)
         # repaint
-        self.display_image()
+        self.renderer.render_now()
+        self.report_first_paint()
+        if not session.full_ready.is_set():
+            self.root.after(30, self.poll_full_resolution, session)
+
+    def view_size(self):
+        w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if w < 2 or h < 2:  # not laid out yet
+            w, h = int(self.root.winfo_screenwidth() * 0.75), int(self.root.winfo_screenheight() * 0.75)
+        return w, h
+
+    def report_first_paint(self):
+        self.canvas.update_idletasks()
+        self.session.mark_first_paint()
+        self.update_title()
+
+    def update_title(self):
+        self.root.title(f"Bounding Box Labeling Tool - {self.image_files[self.image_index]} "
+                        f"(first paint {self.session.first_paint_ms:.0f} ms{self.session.loading_note()})")
+
+    def poll_full_resolution(self, session):
+        if session is not self.session:
+            return  # moved on to another image
+        self.update_title()  # conversion progress of very large images
+        if session.full_ready.is_set():
+            self.renderer.render_now()
+        else:
+            self.root.after(30, self.poll_full_resolution, session)
+
+    def load_labels(self):
+        """Load boxes for the current image: confirmed labels, else unconfirmed model proposals."""
+        self.bboxes = BoxArray()
+        self.showing_proposals = False
+        stem = os.path.splitext(self.image_files[self.image_index])[0]
+        text = self.read_label_text(stem)
+        if text is None:
+            proposal_path = os.path.join(self.proposals_folder, f"{stem}.txt")
+            if not os.path.exists(proposal_path):
+                return
+            with open(proposal_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            self.showing_proposals = True
+
+        self.parse_labels(text)
+
+    def read_label_text(self, stem):
+        """Confirmed YOLO label text for an image (annotation store or Box_labels), or None."""
+        if self.store is not None:
+            return self.store.get(stem)
+        label_path = os.path.join(self.labels_folder, f"{stem}.txt")
+        if not os.path.exists(label_path):
+            return None
+        with open(label_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def write_label_text(self, stem, text):
+        if self.store is not None:
+            self.store.put(stem, text)
+            return
+        os.makedirs(self.labels_folder, exist_ok=True)
+        with open(os.path.join(self.labels_folder, f"{stem}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def labeled_stems(self):
+        if self.store is not None:
+            return self.store.labeled_stems()
+        return {os.path.splitext(f)[0] for f in os.listdir(self.labels_folder) if f.endswith(".txt")}
 
     def save_boxes(self):
-     if self.cv_image is None:
+     if self.session is None:
         return
-     os.makedirs(self.labels_folder, exist_ok=True)
-     save_path = os.path.join(
-        self.labels_folder,
-        f"{os.path.splitext(self.image_files[self.image_index])[0]}.txt")
-     h, w = self.cv_image.shape[:2]
-     with open(save_path, "w", encoding="utf-8") as f:
-        for cls_name, x1, y1, x2, y2 in self.bboxes:
-            # clamp bbox
-            x1c = max(0, min(x1, w - 1))
-            x2c = max(0, min(x2, w - 1))
-            y1c = max(0, min(y1, h - 1))
-            y2c = max(0, min(y2, h - 1))
-            if x2c <= x1c or y2c <= y1c:
-                continue
-            cx = ((x1c + x2c) / 2) / w
-            cy = ((y1c + y2c) / 2) / h
-            bw = (x2c - x1c) / w
-            bh = (y2c - y1c) / h
-            # find class index
-            if cls_name in self.class_names:
-                cls_idx = self.class_names.index(cls_name)
-            else:
-                # append unknown class at end
-                self.class_names.append(cls_name)
-                self.class_colors.setdefault(cls_name, (0, 255, 0))
-                self.save_classes()
-            f.write(f"{cls_idx} {cx:.6f} {cy:.6f} {bw:.6f} {bh:.6f}\n")
+     stem = os.path.splitext(self.image_files[self.image_index])[0]
+     with self.perf.stage("labels"):
+        text, added_classes = self.format_labels()
+        if added_classes:
+           self.save_classes()
+        self.write_label_text(stem, text)
+
+     # saved boxes are confirmed; drop the model proposal for this image
+     proposal_path = os.path.join(self.proposals_folder, f"{stem}.txt")
+     if os.path.exists(proposal_path):
+        os.remove(proposal_path)
+     self.showing_proposals = False
+     if self.prelabel_worker is not None:
+        self.prelabel_worker.mark_labeled(self.image_files[self.image_index])
 
      # ✅ Update current listbox row with ✔
      self.image_listbox.delete(self.image_index)
@@ -291,21 +335,18 @@ class BoundingBoxLabeler:
 
 
     def update_labeled_count(self):
-     labeled_count = 0
-     for fname in self.image_files:
-        label_path = os.path.join(self.labels_folder, f"{os.path.splitext(fname)[0]}.txt")
-        if os.path.exists(label_path):
-            labeled_count += 1
+     labeled = self.labeled_stems()
+     labeled_count = sum(1 for fname in self.image_files if os.path.splitext(fname)[0] in labeled)
      self.labeled_count_label.config(
          text=f"Labeled: {labeled_count} / {len(self.image_files)}")
 
     def refresh_image_list(self):
      self.image_listbox.delete(0, tk.END)
      labeled_count = 0
+     labeled = self.labeled_stems()
 
      for idx, fname in enumerate(self.image_files):
-        label_path = os.path.join(self.labels_folder, f"{os.path.splitext(fname)[0]}.txt")
-        if os.path.exists(label_path):
+        if os.path.splitext(fname)[0] in labeled:
             display_name = f"✔ {fname}"  # mark labeled
             labeled_count += 1
         else:
@@ -315,193 +356,56 @@ class BoundingBoxLabeler:
      self.labeled_count_label.config(
         text=f"Labeled: {labeled_count} / {len(self.image_files)}")
 
-    # ---------------- coordinate transforms ----------------
-    def canvas_to_image(self, cx, cy):
-        """Canvas coords -> image pixel coords (ints)."""
-        ix = int((cx - self.offset_x) / self.scale)
-        iy = int((cy - self.offset_y) / self.scale)
-        return ix, iy
-
-    def image_to_canvas(self, ix, iy):
-        """Image pixel -> canvas coords (ints)."""
-        cx = int(ix * self.scale + self.offset_x)
-        cy = int(iy * self.scale + self.offset_y)
-        return cx, cy
-
     # ---------------- display ----------------
     def display_image(self):
-     image = self.original_image.copy()
-
-     # Draw boxes
-     for idx, (cls_name, x1, y1, x2, y2) in enumerate(self.bboxes):
-        color = self.class_colors.get(cls_name, (0, 255, 0))
-        if idx == self.selected_box:
-            overlay = image.copy()
-            cv2.rectangle(overlay, (x1, y1), (x2, y2), color, -1)
-            cv2.addWeighted(overlay, 0.3, image, 0.7, 0, image)
-            cv2.rectangle(image, (x1, y1), (x2, y2), color, 1)
-        else:
-            cv2.rectangle(image, (x1, y1), (x2, y2), color, 1)
-
-     # Apply zoom
-     resized = cv2.resize(image, None, fx=self.scale, fy=self.scale,
-                         interpolation=cv2.INTER_LINEAR)
-     self.tk_image = ImageTk.PhotoImage(
-        Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)))
-
+     # Cheap filter while the user drags or zooms, full quality once the view settles
+     view_x, view_y = self.canvas.canvasx(0), self.canvas.canvasy(0)
+     interpolation = FAST_INTERPOLATION if self.renderer.interacting else idle_interpolation(self.scale)
+     view = self.render(view_x, view_y, max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height()),
+                        interpolation)
      self.canvas.delete("all")
-     self.canvas.create_image(self.offset_x, self.offset_y, anchor="nw", image=self.tk_image)
-
+     H, W = self.session.shape[:2]
      # Set scroll region to the image's size
-     self.canvas.config(scrollregion=(0, 0, resized.shape[1], resized.shape[0]))
+     self.canvas.config(scrollregion=(0, 0, int(W * self.scale), int(H * self.scale)))
+     if view is None:
+        return
+     resized, view_cx, view_cy = view
+     with self.perf.stage("photo"):
+        self.tk_image = ImageTk.PhotoImage(
+            Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)))
+     self.canvas.create_image(view_cx, view_cy, anchor="nw", image=self.tk_image)
 
 
     # ---------------- mouse handling ----------------
-    def find_box_at(self, ix, iy):
-        """Return topmost box index containing point (image coords) or (None, corner) if near corner."""
-        # iterate reverse to prefer topmost (last drawn)
-        for i in range(len(self.bboxes)-1, -1, -1):
-            cls, x1,y1,x2,y2 = self.bboxes[i]
-            # check corner proximity
-            corner = self.get_near_corner(ix, iy, x1,y1,x2,y2, th=1)
-            if corner:
-                return i, corner
-            if x1 <= ix <= x2 and y1 <= iy <= y2:
-                return i, None
-        return None, None
-
-    def get_near_corner(self, x, y, x1,y1,x2,y2, th=1):
-        """Return corner name if (x,y) near any corner (in image pixels)"""
-        corners = {"tl":(x1,y1), "tr":(x2,y1), "bl":(x1,y2), "br":(x2,y2)}
-        for name,(cx,cy) in corners.items():
-            if abs(x-cx) <= th and abs(y-cy) <= th:
-                return name
-        return None
-
     def on_left_press(self, event):
-        ix, iy = self.canvas_to_image(event.x, event.y)
-        # detect if clicking on a box corner or inside box
-        idx, corner = self.find_box_at(ix, iy)
-        if idx is not None:
-            # select that box
-            self.selected_box = idx
-            if corner:
-                # start resizing
-                self.resizing = True
-                self.resize_corner = corner
-            else:
-                # start dragging
-                self.dragging = True
-            self.prev_mouse_x, self.prev_mouse_y = ix, iy
-            self.display_image()
-            return
-
-        # otherwise start drawing a new box
-        if not self.current_class and not self.class_names:
+        # clicking a box corner resizes it, inside a box moves it; elsewhere draws a new box
+        if not self.pointer_press(event.x, event.y):
             messagebox.showwarning("Warning", "No class defined. Add a class first.")
             return
-        if not self.current_class:
-            # if no explicit selection, pick first class
-            self.current_class = self.class_names[0]
+        if self.current_class:
             self.class_dropdown.set(self.current_class)
-
-        self.drawing = True
-        self.start_x_image, self.start_y_image = ix, iy
-        self.end_x_image, self.end_y_image = ix, iy
-        # clear selection
-        self.selected_box = None
-        self.display_image()
+        self.renderer.request()
 
     def on_left_drag(self, event):
-        ix, iy = self.canvas_to_image(event.x, event.y)
-        if self.drawing:
-            self.end_x_image, self.end_y_image = ix, iy
-            self.display_image()
-            return
-        if self.dragging and self.selected_box is not None and self.prev_mouse_x is not None:
-            dx = ix - self.prev_mouse_x
-            dy = iy - self.prev_mouse_y
-            cls, x1,y1,x2,y2 = self.bboxes[self.selected_box]
-            nx1, ny1, nx2, ny2 = x1+dx, y1+dy, x2+dx, y2+dy
-            # clamp
-            H,W = self.original_image.shape[:2]
-            nx1, ny1 = max(0,int(nx1)), max(0,int(ny1))
-            nx2, ny2 = min(W-1,int(nx2)), min(H-1,int(ny2))
-            self.bboxes[self.selected_box] = (cls, nx1, ny1, nx2, ny2)
-            self.prev_mouse_x, self.prev_mouse_y = ix, iy
-            self.display_image()
-            return
-        if self.resizing and self.selected_box is not None:
-            cls, x1,y1,x2,y2 = self.bboxes[self.selected_box]
-            sx1, sy1, sx2, sy2 = x1,y1,x2,y2
-            if self.resize_corner == "tl":
-                nx1, ny1 = ix, iy
-                nx2, ny2 = sx2, sy2
-            elif self.resize_corner == "tr":
-                nx1, ny1 = sx1, iy
-                nx2, ny2 = ix, sy2
-            elif self.resize_corner == "bl":
-                nx1, ny1 = ix, sy1
-                nx2, ny2 = sx2, iy
-            else:  # br
-                nx1, ny1 = sx1, sy1
-                nx2, ny2 = ix, iy
-            # normalize
-            nx1, nx2 = min(nx1,nx2), max(nx1,nx2)
-            ny1, ny2 = min(ny1,ny2), max(ny1,ny2)
-            H,W = self.original_image.shape[:2]
-            nx1, ny1 = max(0,int(nx1)), max(0,int(ny1))
-            nx2, ny2 = min(W-1,int(nx2)), min(H-1,int(ny2))
-            self.bboxes[self.selected_box] = (cls, nx1, ny1, nx2, ny2)
-            self.display_image()
-            return
+        if self.pointer_drag(event.x, event.y):
+            self.renderer.request(interactive=True)
 
     def on_left_release(self, event):
-        ix, iy = self.canvas_to_image(event.x, event.y)
-        if self.drawing:
-            x1, y1 = self.start_x_image, self.start_y_image
-            x2, y2 = ix, iy
-            x1, x2 = sorted([int(x1), int(x2)])
-            y1, y2 = sorted([int(y1), int(y2)])
-            # ignore tiny
-            if abs(x2-x1) > 5 and abs(y2-y1) > 5:
-                self.bboxes.append((self.current_class, x1, y1, x2, y2))
-                self.selected_box = len(self.bboxes) - 1
-                self.save_boxes()
-            self.drawing = False
-            self.start_x_image = self.start_y_image = self.end_x_image = self.end_y_image = None
-            self.display_image()
-            return
-
-        if self.dragging:
-            self.dragging = False
-            self.prev_mouse_x = self.prev_mouse_y = None
-            self.save_boxes()
-            self.display_image()
-            return
-
-        if self.resizing:
-            self.resizing = False
-            self.resize_corner = None
+        if self.pointer_release(event.x, event.y):
             self.save_boxes()
-            self.display_image()
-            return
+        self.renderer.request()
 
     # ---------------- right click / context menu ----------------
     def on_right_press(self, event):
-        ix, iy = self.canvas_to_image(event.x, event.y)
-        idx, corner = self.find_box_at(ix, iy)
-        if idx is not None:
-            self.selected_box = idx
+        if self.select_at(event.x, event.y):
             # show context menu
             menu = tk.Menu(self.root, tearoff=0)
             menu.add_command(label="Change Class", command=self.change_selected_box_class)
             menu.add_command(label="Delete Box", command=self.delete_selected_box)
             menu.post(event.x_root, event.y_root)
         else:
-            # clear selection if clicked outside
-            self.selected_box = None
-            self.display_image()
+            # clicked outside: the selection was cleared
+            self.renderer.request()
 
     def change_selected_box_class(self):
      if self.selected_box is None:
@@ -516,30 +420,28 @@ class BoundingBoxLabeler:
      top.geometry("300x100")
      tk.Label(top, text="Select Class:").pack(pady=5)
 
-     cls_var = tk.StringVar(value=self.bboxes[self.selected_box][0])
+     cls_var = tk.StringVar(value=self.box_class_name(self.selected_box))
      cb = ttk.Combobox(top, textvariable=cls_var, state="readonly", values=self.class_names)
      cb.pack(pady=5)
 
      def apply_change():
         new_cls = cls_var.get()
         if new_cls:
-            cls, x1, y1, x2, y2 = self.bboxes[self.selected_box]
-            self.bboxes[self.selected_box] = (new_cls, x1, y1, x2, y2)
+            self.trace.record("box_class", name=new_cls)
+            self.set_box_class(self.selected_box, new_cls)
             self.save_boxes()
-            self.display_image()
+            self.renderer.request()
         top.destroy()
 
      tk.Button(top, text="OK", command=apply_change).pack(pady=5)
 
 
     def delete_selected_box(self):
-        if self.selected_box is None:
+        self.trace.record("delete")
+        if not self.delete_selected():
             return
-        del self.bboxes[self.selected_box]
-        # normalize selection
-        self.selected_box = None
         self.save_boxes()
-        self.display_image()
+        self.renderer.request()
 
     # ---------------- listbox & navigation ----------------
     def on_image_select(self, event):
@@ -558,6 +460,15 @@ class BoundingBoxLabeler:
         self.image_listbox.itemconfig(idx, foreground="white", background="blue")
         self.load_image()
 
+    def browse_thumbnails(self):
+        ThumbnailBrowser(self.root, self.image_folder, self.image_files, self.jump_to_file,
+                         current=self.image_files[self.image_index] if self.image_files else None)
+
+    def jump_to_file(self, fname):
+        # look the name up now: the order may have changed while the browser was open
+        if fname in self.image_files:
+            self.set_selected_image_index(self.image_files.index(fname))
+
     def prev_image(self):
         if self.image_index > 0:
             self.set_selected_image_index(self.image_index - 1)
@@ -569,18 +480,8 @@ class BoundingBoxLabeler:
     # ---------------- pan & zoom ----------------
     def on_mouse_wheel(self, event):
         # zoom towards mouse pointer
-        mx, my = event.x, event.y
-        ix, iy = self.canvas_to_image(mx, my)
-        if event.delta > 0:
-            factor = 1.15
-        else:
-            factor = 1/1.15
-        old_scale = self.scale
-        self.scale *= factor
-        # maintain focus point under mouse
-        self.offset_x = mx - int(ix * self.scale)
-        self.offset_y = my - int(iy * self.scale)
-        self.display_image()
+        self.zoom_at(event.x, event.y, event.delta > 0)
+        self.renderer.request(interactive=True)
 
     def on_middle_press(self, event):
         self.pan_start = (event.x, event.y)
@@ -588,28 +489,106 @@ class BoundingBoxLabeler:
     def on_middle_drag(self, event):
         if getattr(self, "pan_start", None) is None:
             return
-        dx = event.x - self.pan_start[0]
-        dy = event.y - self.pan_start[1]
-        self.offset_x += dx
-        self.offset_y += dy
+        self.pan_by(event.x - self.pan_start[0], event.y - self.pan_start[1])
         self.pan_start = (event.x, event.y)
-        self.display_image()
-
-    # ---------------- utilities ----------------
-    def canvas_to_image(self, cx, cy):
-        ix = int(round((cx - self.offset_x) / self.scale))
-        iy = int(round((cy - self.offset_y) / self.scale))
-        # clamp
-        if self.original_image is not None:
-            H,W = self.original_image.shape[:2]
-            ix = max(0, min(W-1, ix))
-            iy = max(0, min(H-1, iy))
-        return ix, iy
+        self.renderer.request(interactive=True)
+
+    # ---------------- model-assisted pre-labeling ----------------
+    def choose_prelabel_model(self):
+        path = filedialog.askopenfilename(title="Select YOLOv5 Model", filetypes=[("PyTorch model", "*.pt")])
+        if path:
+            self.start_prelabeling(path)
+
+    def start_prelabeling(self, model_path):
+        if self.prelabel_worker is not None:
+            self.prelabel_worker.stop()
+        self.prelabel_worker = PreLabelWorker(
+            self.image_folder, self.labels_folder, self.proposals_folder,
+            get_files=lambda: self.image_files,
+            get_index=lambda: self.image_index,
+            get_class_names=lambda: list(self.class_names),
+            detector_factory=lambda: make_yolo_detector(model_path),
+            predictions_folder=self.predictions_folder,
+            labeled=self.labeled_stems(),
+            is_labeled=lambda stem: self.read_label_text(stem) is not None)
+        self.prelabel_worker.start()
+        self.update_prelabel_status()
+
+    def update_prelabel_status(self):
+        worker = self.prelabel_worker
+        if worker is None:
+            return
+        text = (f"Pre-label: {worker.status}\n"
+                f"Queue: {worker.queue_depth}  Done: {worker.processed}\n"
+                f"Speed: {worker.throughput:.1f} img/s")
+        if worker.error:
+            text += f"\n{worker.error}"
+        self.prelabel_label.config(text=text)
+
+        # proposal for the image on screen just arrived: show it if nothing is there yet
+        if (worker.last_proposed == self.image_files[self.image_index] and not self.bboxes
+                and not (self.drawing or self.dragging or self.resizing)
+                and self.session is not None):
+            self.load_labels()
+            if self.bboxes:
+                self.renderer.request()
+
+        if worker.is_alive():
+            self.root.after(500, self.update_prelabel_status)
+
+    # ---------------- active learning order ----------------
+    def toggle_uncertainty_order(self):
+        if self.uncertainty_after is not None:
+            self.root.after_cancel(self.uncertainty_after)
+            self.uncertainty_after = None
+        if self.uncertainty_order.get():
+            if self.uncertainty_scorer is None:
+                self.uncertainty_scorer = UncertaintyScorer(self.predictions_folder, self.labels_folder,
+                                                            get_labeled=self.labeled_stems)
+                self.uncertainty_scorer.start()
+            self.ranked_version = None
+            self.update_uncertainty_order()
+        else:
+            self.reorder_image_files(sorted(self.image_files))
+
+    def update_uncertainty_order(self):
+        self.uncertainty_after = None
+        if not self.uncertainty_order.get() or self.uncertainty_scorer is None:
+            return
+        version = self.uncertainty_scorer.version
+        if version != self.ranked_version:
+            self.ranked_version = version
+            # images up to the current one keep their place; everything after is re-ranked
+            head = self.image_files[:self.image_index + 1]
+            tail = self.uncertainty_scorer.rank(self.image_files[self.image_index + 1:])
+            if head + tail != self.image_files:
+                self.reorder_image_files(head + tail)
+        self.uncertainty_after = self.root.after(2000, self.update_uncertainty_order)
+
+    def reorder_image_files(self, files):
+        """Switch to a new order of the same files, rewriting only the listbox rows that moved."""
+        current = self.image_files[self.image_index] if self.image_files else None
+        old_files, self.image_files = self.image_files, files
+        if current is not None:
+            self.image_index = self.image_files.index(current)
+        moved = [i for i, (old, new) in enumerate(zip(old_files, files)) if old != new]
+        if moved:
+            labeled = self.labeled_stems()
+            for i in moved:
+                fname = files[i]
+                self.image_listbox.delete(i)
+                self.image_listbox.insert(i, f"✔ {fname}" if os.path.splitext(fname)[0] in labeled else f"    {fname}")
+            if self.image_index in moved:
+                self.image_listbox.itemconfig(self.image_index, foreground="white", background="blue")
+        if self.image_files:
+            self.image_listbox.select_clear(0, tk.END)
+            self.image_listbox.select_set(self.image_index)
+            self.image_listbox.see(self.image_index)
 
 # ---------------- runnable functions ----------------
-def run_bounding_box(project_folder):
+def run_bounding_box(project_folder, model_path=None):
     root = tk.Tk()
-    app = BoundingBoxLabeler(root, project_folder)
+    app = BoundingBoxLabeler(root, project_folder, model_path)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -1,7 +1,12 @@
 # main.py
 
+from startup import TIMER
+
+TIMER.mark("main_start")
 from login_page import App
+TIMER.mark("login_page_imported")
 
 if __name__ == "__main__":
     app = App()
     app.mainloop()
+    TIMER.write_report()
@@ -7,39 +7,36 @@ from PIL import Image, ImageTk
 import cv2
 import os
 import numpy as np
-
-class SegmentationLabeler:
+from catalog import open_catalog
+from image_session import FAST_INTERPOLATION, fit_scale, idle_interpolation, open_session
+from mask_tiles import MaskSaver, has_tiles, load_mask, tiles_path
+from superpixels import SuperpixelCache
+from thumbnails import ThumbnailBrowser
+from render_scheduler import RenderScheduler
+from input_trace import open_trace
+from perf_hud import PerfHud, open_perf
+from label_core import MaskAnnotator
+
+class SegmentationLabeler(MaskAnnotator):
     def __init__(self, root, selected_folder):
+        super().__init__()
         self.root = root
         self.root.title("Segmentation Labeling Tool")
         self.root.geometry("1280x720")
         self.root.state("zoomed")
 
         self.image_folder = selected_folder
-        self.image_files = [f for f in os.listdir(selected_folder)
-                            if f.lower().endswith((".png", ".jpg", ".jpeg", ".bmp"))]
+        self.catalog = open_catalog(selected_folder)
+        self.image_files = list(self.catalog.files)
         self.image_index = 0
 
-        self.class_colors = {}
-        self.current_class = None
-        self.drawing_mode = "pen"
-        self.drawing = False
-        self.pen_thickness = 2
-
-        self.scale = 1.0
-        self.offset_x = 0
-        self.offset_y = 0
-
         self.pan_start = None
-
-        self.start_x = self.start_y = self.end_x = self.end_y = None
-        self.polygon_points = []
-
-
-        self.mask = None
-        self.display_mask = None
+        self.mask_folder = os.path.join(self.image_folder, "Segment_labels")
+        self.saver = MaskSaver()
+        self.superpixels = SuperpixelCache()
 
         self.setup_ui()
+        self.trace = open_trace("segment", selected_folder, self.canvas)
         self.load_image()
 
     def setup_ui(self):
@@ -49,6 +46,11 @@ class SegmentationLabeler:
 
         self.canvas = tk.Canvas(self.root, bg="black", cursor="cross")
         self.canvas.grid(row=0, column=0, sticky="nsew")
+        # stage timings and the F3 overlay; free unless turned on
+        self.perf = open_perf()
+        self.hud = PerfHud(self.perf, self.root, self.canvas, "Segmentation view")
+        # mouse handlers only mark the view dirty; redraws are coalesced to one per frame
+        self.renderer = RenderScheduler(self.canvas, self.display_image, name="Segmentation view", hud=self.hud)
 
         self.sidebar = tk.Frame(self.root, bg="#f0f0f0", padx=10, pady=10)
         self.sidebar.grid(row=0, column=1, sticky="nsew")
@@ -67,6 +69,13 @@ class SegmentationLabeler:
         tk.Button(self.sidebar, text="Pen Mode", command=lambda: self.set_mode("pen")).pack(fill="x", pady=2)
         tk.Button(self.sidebar, text="Erase Mode", command=lambda: self.set_mode("erase")).pack(fill="x", pady=2)
         tk.Button(self.sidebar, text="Rect Mode", command=lambda: self.set_mode("rect")).pack(fill="x", pady=2)
+        tk.Button(self.sidebar, text="Superpixel Click Fill", command=lambda: self.set_mode("sp_click")).pack(fill="x", pady=2)
+        tk.Button(self.sidebar, text="Superpixel Rect Fill", command=lambda: self.set_mode("sp_rect")).pack(fill="x", pady=2)
+
+        tk.Button(self.sidebar, text="Undo (Ctrl+Z)", command=self.undo).pack(fill="x", pady=2)
+        tk.Button(self.sidebar, text="Redo (Ctrl+Y)", command=self.redo).pack(fill="x", pady=2)
+        self.history_label = tk.Label(self.sidebar, text="", bg="#f0f0f0", anchor="w")
+        self.history_label.pack(fill="x")
 
         tk.Label(self.sidebar, text="Navigation:").pack(anchor="w", pady=(10, 2))
         tk.Button(self.sidebar, text="Previous Image", command=self.prev_image).pack(fill="x", pady=2)
@@ -82,6 +91,7 @@ class SegmentationLabeler:
         for idx, img in enumerate(self.image_files):
             self.image_listbox.insert(idx, img)
         self.image_listbox.bind("<<ListboxSelect>>", self.on_image_select)
+        tk.Button(self.sidebar, text="Browse Thumbnails", command=self.browse_thumbnails).pack(fill="x", pady=2)
 
         self.canvas.bind("<ButtonPress-1>", self.on_mouse_press)
         self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
@@ -90,6 +100,8 @@ class SegmentationLabeler:
         self.canvas.bind("<ButtonPress-3>", self.start_pan)
         self.canvas.bind("<B3-Motion>", self.do_pan)
         self.canvas.bind("<Double-Button-1>", self.finish_polygon)
+        self.root.bind("<Control-z>", lambda e: self.undo())
+        self.root.bind("<Control-y>", lambda e: self.redo())
 
     def on_image_select(self, event):
         selection = event.widget.curselection()
@@ -103,12 +115,14 @@ class SegmentationLabeler:
             messagebox.showwarning("Warning", "Please enter a class name.")
             return
         if name in self.class_colors:
+            self.trace.record("class", name=name)
             self.class_dropdown.set(name)
             self.current_class = name
             return
 
         color = tuple(np.random.randint(0, 256, 3).tolist())
         self.class_colors[name] = color
+        self.trace.record("add_class", name=name, color=list(color))
         self.class_dropdown["values"] = list(self.class_colors.keys())
         self.class_dropdown.set(name)
         self.current_class = name
@@ -116,132 +130,166 @@ class SegmentationLabeler:
 
     def select_class(self, event):
         self.current_class = self.class_dropdown.get()
+        self.trace.record("class", name=self.current_class)
 
     def set_mode(self, mode):
+        self.trace.record("mode", name=mode)
         self.drawing_mode = mode
         self.polygon_points.clear()
-        self.display_image()
+        self.renderer.request()
 
     def load_image(self):
         image_path = os.path.join(self.image_folder, self.image_files[self.image_index])
-        self.cv_image = cv2.imread(image_path)
-        self.original_image = self.cv_image.copy()
-        self.mask = np.zeros(self.cv_image.shape[:2], dtype=np.uint8)
-
-        mask_folder = os.path.join(self.image_folder, "labels")
-        label_path = os.path.join(mask_folder, f"{os.path.splitext(self.image_files[self.image_index])[0]}.txt")
-        if os.path.exists(label_path):
-            self.mask = np.loadtxt(label_path, dtype=np.uint8)
-            if self.mask.shape != self.cv_image.shape[:2]:
-                self.mask = np.zeros(self.cv_image.shape[:2], dtype=np.uint8)
-        self.display_mask = self.mask.copy()
-        self.scale = 1.0
+        # one read-only buffer (or a tiled session for very large images, converted once on
+        # first open); the mask below is the only other full-size array
+        self.root.config(cursor="watch")
+        self.root.update_idletasks()
+        view = self.view_size()
+        self.trace.record("image", name=self.image_files[self.image_index], view=list(view))
+        with self.perf.stage("decode"):
+            self.session = open_session(image_path, fit=view)
+        self.root.config(cursor="")
+        if not self.session.loaded:
+            messagebox.showerror("Error", f"Cannot open image: {image_path}")
+            return
+        # segment this image first, then the next one so paging forward is instant
+        self.superpixels.request(image_path, self.session)
+        if self.image_index + 1 < len(self.image_files):
+            self.superpixels.request(os.path.join(self.image_folder, self.image_files[self.image_index + 1]))
+        stem = os.path.splitext(self.image_files[self.image_index])[0]
+        self.saver.flush()  # a save of this image may still be in flight
+        # legacy .txt masks and unsaved images are written out in full on their first save
+        with self.perf.stage("labels"):
+            self.set_mask(load_mask(self.mask_folder, stem, self.session.shape), has_tiles(self.mask_folder, stem))
+        self.update_history_label()
+        h, w = self.session.shape[:2]
+        self.scale = fit_scale((w, h), view)
         self.offset_x = 0
         self.offset_y = 0
-        self.display_image()
+        self.renderer.render_now()
+        self.report_first_paint()
+        if not self.session.full_ready.is_set():
+            self.root.after(30, self.poll_full_resolution, self.session)
         self.image_listbox.select_clear(0, tk.END)
         self.image_listbox.select_set(self.image_index)
         self.image_listbox.see(self.image_index)
 
-    def display_image(self):
-        overlay = self.original_image.copy()
-        for idx, cls in enumerate(self.class_colors.keys(), 1):
-            overlay[self.display_mask == idx] = self.class_colors[cls]
+    def view_size(self):
+        w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if w < 2 or h < 2:  # not laid out yet
+            w, h = int(self.root.winfo_screenwidth() * 0.75), int(self.root.winfo_screenheight() * 0.75)
+        return w, h
+
+    def report_first_paint(self):
+        self.canvas.update_idletasks()
+        self.session.mark_first_paint()
+        self.update_title()
 
-        if self.drawing_mode == "rect" and self.drawing and self.start_x and self.start_y and self.end_x and self.end_y:
-            cv2.rectangle(overlay, (self.start_x, self.start_y), (self.end_x, self.end_y), (0, 255, 255), 1)
+    def update_title(self):
+        self.root.title(f"Segmentation Labeling Tool - {self.image_files[self.image_index]} "
+                        f"(first paint {self.session.first_paint_ms:.0f} ms{self.session.loading_note()})")
 
-        resized = cv2.resize(overlay, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_NEAREST)
-        self.tk_image = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)))
+    def poll_full_resolution(self, session):
+        if session is not self.session:
+            return
+        self.update_title()  # conversion progress of very large images
+        if session.full_ready.is_set():
+            self.renderer.render_now()
+        else:
+            self.root.after(30, self.poll_full_resolution, session)
+
+    def display_image(self):
+        # cheap filter while drawing, zooming or panning, full quality once the view settles
+        interpolation = FAST_INTERPOLATION if self.renderer.interacting else idle_interpolation(self.scale)
+        view = self.render(self.canvas.winfo_width(), self.canvas.winfo_height(), interpolation)
         self.canvas.delete("all")
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
-        self.offset_x = (canvas_width - resized.shape[1]) // 2 if self.offset_x == 0 else self.offset_x
-        self.offset_y = (canvas_height - resized.shape[0]) // 2 if self.offset_y == 0 else self.offset_y
-        self.canvas.create_image(self.offset_x, self.offset_y, anchor="nw", image=self.tk_image)
+        if view is not None:
+            resized, view_x, view_y = view
+            with self.perf.stage("photo"):
+                self.tk_image = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)))
+            self.canvas.create_image(view_x, view_y, anchor="nw", image=self.tk_image)
 
         if self.drawing_mode in ["pen", "erase"] and len(self.polygon_points) > 1:
             scaled_points = [((x * self.scale) + self.offset_x, (y * self.scale) + self.offset_y)
                              for x, y in self.polygon_points]
             self.canvas.create_line(scaled_points, fill="red", width=2)
 
-    def canvas_to_image_coords(self, x, y):
-        return int((x - self.offset_x) / self.scale), int((y - self.offset_y) / self.scale)
-
     def on_mouse_press(self, event):
-        if not self.current_class and self.drawing_mode != "erase":
+        if not self.can_paint():
             messagebox.showwarning("Warning", "Please select a class first.")
             return
-        x, y = self.canvas_to_image_coords(event.x, event.y)
-        if self.drawing_mode in ["pen", "erase"]:
-            self.polygon_points = [(x, y)]
-        elif self.drawing_mode == "rect":
-            self.start_x, self.start_y = x, y
-            self.drawing = True
+        index = None
+        if self.drawing_mode == "sp_click":
+            index = self.current_superpixels()
+            if index is None:
+                return
+        self.pointer_press(event.x, event.y, index)
 
     def on_mouse_drag(self, event):
-        x, y = self.canvas_to_image_coords(event.x, event.y)
-        if self.drawing_mode in ["pen", "erase"]:
-            self.polygon_points.append((x, y))
-            cv2.line(self.display_mask,
-                     self.polygon_points[-2],
-                     self.polygon_points[-1],
-                     0 if self.drawing_mode == "erase" else list(self.class_colors.keys()).index(self.current_class) + 1,
-                     thickness=self.pen_thickness)
-        elif self.drawing_mode == "rect" and self.drawing:
-            self.end_x, self.end_y = x, y
-        self.display_image()
+        self.pointer_drag(event.x, event.y)
+        self.renderer.request(interactive=True)
 
     def on_mouse_release(self, event):
-        if self.drawing_mode == "rect" and self.drawing:
-            x1, y1 = self.start_x, self.start_y
-            x2, y2 = self.canvas_to_image_coords(event.x, event.y)
-            x1, x2 = sorted((x1, x2))
-            y1, y2 = sorted((y1, y2))
-            gray = cv2.cvtColor(self.original_image[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
-            _, binary = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)
-            class_idx = list(self.class_colors.keys()).index(self.current_class) + 1
-            self.display_mask[y1:y2, x1:x2][binary == 0] = class_idx  # Inverse binary
-        self.drawing = False
-        self.polygon_points.clear()
-        self.display_image()
+        index = self.current_superpixels() if self.drawing_mode == "sp_rect" and self.drawing else None
+        if self.pointer_release(event.x, event.y, index):
+            self.update_history_label()
+        self.renderer.request()
+
+    def current_superpixels(self):
+        index = self.superpixels.get(os.path.join(self.image_folder, self.image_files[self.image_index]))
+        if index is None:
+            messagebox.showinfo("Please wait", "Superpixels for this image are still being computed.")
+        return index
 
     def finish_polygon(self, event):
         self.on_mouse_release(event)
 
+    def undo(self):
+        self.trace.record("undo")
+        self.undo_step()
+        self.update_history_label()
+        self.renderer.request()
+
+    def redo(self):
+        self.trace.record("redo")
+        self.redo_step()
+        self.update_history_label()
+        self.renderer.request()
+
+    def update_history_label(self):
+        self.history_label.config(text=self.history.describe())
+
     def on_mouse_wheel(self, event):
-        cx = self.canvas.winfo_width() // 2
-        cy = self.canvas.winfo_height() // 2
-        image_x, image_y = self.canvas_to_image_coords(cx, cy)
-        if event.delta > 0:
-            self.scale *= 1.1
-        else:
-            self.scale /= 1.1
-        new_image_x, new_image_y = image_x * self.scale, image_y * self.scale
-        self.offset_x = cx - int(new_image_x)
-        self.offset_y = cy - int(new_image_y)
-        self.display_image()
+        self.zoom_about(self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2, event.delta > 0)
+        self.renderer.request(interactive=True)
 
     def start_pan(self, event):
         self.pan_start = (event.x, event.y)
 
     def do_pan(self, event):
         if self.pan_start:
-            dx = event.x - self.pan_start[0]
-            dy = event.y - self.pan_start[1]
-            self.offset_x += dx
-            self.offset_y += dy
+            self.pan_by(event.x - self.pan_start[0], event.y - self.pan_start[1])
             self.pan_start = (event.x, event.y)
-            self.display_image()
+            self.renderer.request(interactive=True)
 
     def save_mask(self):
-        self.mask = self.display_mask.copy()
+        if self.saver.error:
+            messagebox.showerror("Error", f"An earlier save failed: {self.saver.error}")
+            self.saver.error = None
         base = os.path.splitext(self.image_files[self.image_index])[0]
-        mask_folder = os.path.join(self.image_folder, "Segment_labels")
-        os.makedirs(mask_folder, exist_ok=True)
-        save_path = os.path.join(mask_folder, f"{base}.txt")
-        np.savetxt(save_path, self.mask, fmt="%d")
-        messagebox.showinfo("Saved", f"Mask saved to {save_path}")
+        self.trace.record("save")
+        # copy just the touched tiles here; compression and writing happen on the saver thread
+        with self.perf.stage("labels"):
+            self.saver.save(self.mask_folder, base, self.display_mask.shape, self.tiles_to_save())
+        messagebox.showinfo("Saved", f"Mask saved to {tiles_path(self.mask_folder, base)}")
+
+    def browse_thumbnails(self):
+        ThumbnailBrowser(self.root, self.image_folder, self.image_files, self.jump_to_file,
+                         current=self.image_files[self.image_index] if self.image_files else None)
+
+    def jump_to_file(self, fname):
+        self.image_index = self.image_files.index(fname)
+        self.load_image()
 
     def prev_image(self):
         if self.image_index > 0:
@@ -258,3 +306,4 @@ def run_segment_label(folder):
     root = tk.Tk()
     app = SegmentationLabeler(root, folder)
     root.mainloop()
+    app.saver.flush()
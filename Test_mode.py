@@ -6,57 +6,193 @@ import cv2
 import shutil
 import torch
 from torchvision.ops import nms
-from pathlib import Path
 import json
-
-
-def run_yolo_detection(model_path, image_source, conf_thres=0.3, iou_thres=0.4):
+import sys
+import threading
+import time
+from catalog import open_catalog, IMAGE_EXTS
+from image_session import FAST_INTERPOLATION, fit_scale, idle_interpolation, open_session
+from render_scheduler import RenderScheduler
+from perf_hud import PerfHud, open_perf
+from pipeline_metrics import busy_of, metrics_dir, stage_of, start_metrics
+
+
+COLOR_MAP = {
+    0: (0, 255, 0),    # Normal
+    1: (0, 0, 255),    # Defect
+    2: (255, 0, 0),    # Blue
+    3: (0, 255, 255),  # Yellow
+    4: (255, 0, 255),  # Magenta
+}
+
+
+def load_yolo_model(model_path, conf_thres=0.3, iou_thres=0.4):
     model = torch.hub.load('ultralytics/yolov5', 'custom', path=model_path, force_reload=False)
     model.conf = conf_thres
     model.iou = iou_thres
+    return model
 
-    color_map = {
-        0: (0, 255, 0),    # Normal
-        1: (0, 0, 255),    # Defect
-        2: (255, 0, 0),    # Blue
-        3: (0, 255, 255),  # Yellow
-        4: (255, 0, 255),  # Magenta
-    }
 
-    output_images = {}  # filename -> processed image
+def settings_file_path():
+    base = os.environ.get("PROGRAMDATA", os.path.expanduser("~"))
+    return os.path.join(base, "ImageLabeler", "test_mode.json")
 
-    image_list = []
-    if os.path.isdir(image_source):
-        image_formats = ('.jpg', '.jpeg', '.png', '.bmp')
-        image_list = [str(p) for p in Path(image_source).rglob("*") if p.suffix.lower() in image_formats]
-    else:
-        image_list = [image_source]
 
-    for image_path in image_list:
+def last_model_path():
+    try:
+        with open(settings_file_path(), "r", encoding="utf-8") as f:
+            path = json.load(f).get("last_model")
+    except (OSError, ValueError):
+        return None
+    return path if path and os.path.exists(path) else None
+
+
+def remember_model_path(model_path):
+    try:
+        os.makedirs(os.path.dirname(settings_file_path()), exist_ok=True)
+        with open(settings_file_path(), "w", encoding="utf-8") as f:
+            json.dump({"last_model": model_path}, f, indent=4)
+    except OSError as e:
+        print(f"Could not save model setting: {e}")
+
+
+class ModelPreloader(threading.Thread):
+    """Loads a model on a background thread; get() waits for it."""
+
+    def __init__(self, model_path, conf_thres=0.3, iou_thres=0.4):
+        super().__init__(daemon=True)
+        self.model_path = model_path
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        self.model = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.model = load_yolo_model(self.model_path, self.conf_thres, self.iou_thres)
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        if self.ident is None:
+            self.run()  # never started: load on the calling thread
+        else:
+            self.join()
+        if self.error is not None:
+            raise self.error
+        return self.model
+
+
+def preload_last_model():
+    path = last_model_path()
+    if not path:
+        return None
+    preloader = ModelPreloader(path)
+    preloader.start()
+    return preloader
+
+
+def detect_image(model, image_path, iou_thres=0.4, draw=True, metrics=None):
+    """Run one image through a loaded model.
+
+    Returns (annotated BGR image, list of (x1, y1, x2, y2, conf, class_id, label))
+    or (None, []) if the image cannot be read. Stage times go to metrics (a
+    PipelineMetrics) when one is given.
+    """
+    with stage_of(metrics, "decode"):
         img = cv2.imread(image_path)
-        if img is None:
-            continue
+    if img is None:
+        return None, []
 
-        results = model(image_path)
-        names = results.names
-        pred = results.xyxy[0]
+    started = time.perf_counter()
+    results = model(image_path)
+    if metrics is not None:
+        model_seconds = time.perf_counter() - started
+        # YOLOv5 hub models report their own per-image (preprocess, inference, NMS) milliseconds
+        split = getattr(results, "t", None)
+        if split is not None and len(split) == 3 and sum(split) > 0:
+            for name, share in zip(("preprocess", "forward", "nms"), split):
+                metrics.add_time(name, model_seconds * share / sum(split))
+        else:
+            metrics.add_time("forward", model_seconds)
+    names = results.names
+    pred = results.xyxy[0]
 
-        if pred is not None and len(pred):
+    detections = []
+    if pred is not None and len(pred):
+        with stage_of(metrics, "nms"):
             boxes = pred[:, :4]
             scores = pred[:, 4]
             keep = nms(boxes, scores, iou_thres)
             filtered_preds = pred[keep]
 
+        with stage_of(metrics, "draw"):
             for *xyxy, conf, cls_id in filtered_preds:
                 x1, y1, x2, y2 = map(int, xyxy)
                 class_id = int(cls_id)
-                color = color_map.get(class_id, (255, 255, 255))
+                color = COLOR_MAP.get(class_id, (255, 255, 255))
                 label = names[class_id]
-                cv2.rectangle(img, (x1, y1), (x2, y2), color, 1)
-                #cv2.putText(img, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+                if draw:
+                    cv2.rectangle(img, (x1, y1), (x2, y2), color, 1)
+                    #cv2.putText(img, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+                detections.append((x1, y1, x2, y2, float(conf), class_id, label))
+
+    return img, detections
+
+
+def save_prediction_labels(label_path, detections, img_shape):
+    """Write detections as YOLO txt lines with a trailing confidence: cls cx cy w h conf."""
+    h, w = img_shape[:2]
+    with open(label_path, "w", encoding="utf-8") as f:
+        for x1, y1, x2, y2, conf, class_id, _ in detections:
+            cx = ((x1 + x2) / 2) / w
+            cy = ((y1 + y2) / 2) / h
+            bw = (x2 - x1) / w
+            bh = (y2 - y1) / h
+            f.write(f"{class_id} {cx:.6f} {cy:.6f} {bw:.6f} {bh:.6f} {conf:.5f}\n")
+
+
+def run_yolo_detection(model_path, image_source, conf_thres=0.3, iou_thres=0.4, labels_dir=None, model=None,
+                       metrics_folder=None):
+    """Detect every image in image_source; returns {filename: annotated image}.
+
+    With metrics_folder (or DETECTION_METRICS_DIR set), per-stage timings,
+    queue depth and utilization are written there while the run goes.
+    """
+    if model is None:
+        model = load_yolo_model(model_path, conf_thres, iou_thres)
+    if labels_dir:
+        os.makedirs(labels_dir, exist_ok=True)
+
+    output_images = {}  # filename -> processed image
+
+    image_list = []
+    if os.path.isdir(image_source):
+        image_list = open_catalog(image_source).paths()
+    else:
+        image_list = [image_source]
 
-        filename = os.path.basename(image_path)
-        output_images[filename] = img
+    metrics, writer = start_metrics(metrics_dir(metrics_folder))
+    if metrics is not None:
+        metrics.set_queue(images=len(image_list))
+    try:
+        for image_path in image_list:
+            with busy_of(metrics):
+                img, detections = detect_image(model, image_path, iou_thres, metrics=metrics)
+                if img is not None and labels_dir:
+                    stem = os.path.splitext(os.path.basename(image_path))[0]
+                    with stage_of(metrics, "write"):
+                        save_prediction_labels(os.path.join(labels_dir, f"{stem}.txt"), detections, img.shape)
+            if metrics is not None:
+                metrics.image_done(None if img is None else len(detections))
+            if img is None:
+                continue
+
+            filename = os.path.basename(image_path)
+            output_images[filename] = img
+    finally:
+        if writer is not None:
+            writer.stop()
 
     return output_images  # dictionary of filename: annotated image
 
@@ -103,11 +239,14 @@ def run_yolo_detection_single(model_path, image_path, conf_thres=0.3, iou_thres=
 
 class YOLOApp:
 
-    def __init__(self, root):
+    def __init__(self, root, image_folder=None, preloader=None, on_close=None):
         self.root = root
         self.root.title("Testify")
+        self.on_close = on_close
 
-        self.model_path = None
+        # a preloader may already be loading (or have loaded) the last-used model
+        self.preloader = preloader
+        self.model_path = preloader.model_path if preloader else None
         self.image_folder = None
         self.image_list = []
         self.selected_image = None
@@ -121,6 +260,9 @@ class YOLOApp:
         self.current_displayed_file = None
 
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        if image_folder:
+            self.load_folder(image_folder)
 
     def setup_ui(self):
      # Top buttons frame with background color
@@ -144,7 +286,7 @@ class YOLOApp:
      tk.Button(top_frame, text="Save Images", bg="#8CA58C", command=self.save_classified_results, **button_style).pack(side=tk.LEFT, padx=5)
      tk.Button(top_frame, text="Refresh", bg="#8CA58C", command=self.refresh_display, **button_style).pack(side=tk.LEFT, padx=5)
      tk.Button(top_frame, text="Refresh All", bg="#8CA58C", command=self.refresh_all_images, **button_style).pack(side=tk.LEFT, padx=5)
-     tk.Button(top_frame, text="Close", bg="#582A2A", command=self.root.quit, **button_style).pack(side=tk.RIGHT, padx=5)
+     tk.Button(top_frame, text="Close", bg="#582A2A", command=self.close, **button_style).pack(side=tk.RIGHT, padx=5)
 
      # Main layout
      main_frame = tk.Frame(self.root)
@@ -162,25 +304,48 @@ class YOLOApp:
 
      self.canvas = tk.Canvas(main_frame, bg="black")
      self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+     # stage timings and the F3 overlay; free unless turned on
+     self.perf = open_perf()
+     self.hud = PerfHud(self.perf, self.root, self.canvas, "Test mode view")
+     # zoom and pan only mark the view dirty; redraws are coalesced to one per frame
+     self.renderer = RenderScheduler(self.canvas, self.render_image, name="Test mode view", hud=self.hud)
 
      self.canvas.bind("<MouseWheel>", self.zoom)
      self.canvas.bind("<ButtonPress-1>", self.start_pan)
      self.canvas.bind("<B1-Motion>", self.do_pan)
 
 
+    def close(self):
+        self.root.destroy()
+        if self.on_close:
+            self.on_close()
+
     def load_model(self):
         path = filedialog.askopenfilename(title="Select YOLOv5 Model", filetypes=[("PyTorch model", "*.pt")])
         if path:
             self.model_path = path
+            remember_model_path(path)
+            # load in the background; get_model() waits only if it is needed before then
+            self.preloader = ModelPreloader(path)
+            self.preloader.start()
             messagebox.showinfo("Loaded", f"Model loaded:\n{path}")
 
-    def load_folder(self):
-        folder = filedialog.askdirectory(title="Select Folder with Images")
+    def get_model(self):
+        if self.preloader is None or self.preloader.model_path != self.model_path:
+            self.preloader = ModelPreloader(self.model_path)
+        try:
+            return self.preloader.get()
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not load model:\n{e}")
+            return None
+
+    def load_folder(self, folder=None):
+        folder = folder or filedialog.askdirectory(title="Select Folder with Images")
         if folder:
             self.image_folder = folder
             self.output_dir = os.path.join(folder, "output")
             os.makedirs(self.output_dir, exist_ok=True)
-            self.image_list = [f for f in os.listdir(folder) if f.lower().endswith(('.jpg', '.png', '.bmp'))]
+            self.image_list = list(open_catalog(folder).files)
             self.listbox.delete(0, tk.END)
             for img in self.image_list:
                 self.listbox.insert(tk.END, img)
@@ -198,23 +363,49 @@ class YOLOApp:
                 self.show_image(self.selected_image)
 
     def show_image(self, image_path):
-        img = cv2.imread(image_path)
-        if img is None:
+        view = (max(2, self.canvas.winfo_width()), max(2, self.canvas.winfo_height()))
+        with self.perf.stage("decode"):
+            session = open_session(image_path, fit=view)
+        if not session.loaded:
             return
 
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        self.original_image = Image.fromarray(img)
-        self.zoom_factor = 1.0
+        # keep only the decoded BGR buffer; colour conversion happens on the zoomed copy
+        self.session = session
+        h, w = session.shape[:2]
+        self.zoom_factor = fit_scale((w, h), view)
         self.canvas_offset = [0, 0]
-        self.render_image()
+        self.renderer.render_now()
+        self.canvas.update_idletasks()
+        session.mark_first_paint()
+        self.update_title()
+        if not session.full_ready.is_set():
+            self.root.after(30, self.poll_full_resolution, session)
+
+    def update_title(self):
+        session = self.session
+        self.root.title(f"Testify - {os.path.basename(session.path)} "
+                        f"(first paint {session.first_paint_ms:.0f} ms{session.loading_note()})")
+
+    def poll_full_resolution(self, session):
+        if session is not self.session:
+            return
+        self.update_title()  # conversion progress of very large images
+        if session.full_ready.is_set():
+            self.renderer.render_now()
+        else:
+            self.root.after(30, self.poll_full_resolution, session)
 
     def render_image(self):
-        if not hasattr(self, "original_image"):
+        if getattr(self, "session", None) is None:
             return
 
-        w, h = self.original_image.size
-        zoomed = self.original_image.resize((int(w * self.zoom_factor), int(h * self.zoom_factor)))
-        self.imgtk = ImageTk.PhotoImage(zoomed)
+        # cheap filter while zooming or panning, full quality once the view settles
+        interpolation = FAST_INTERPOLATION if self.renderer.interacting else idle_interpolation(self.zoom_factor)
+        with self.perf.stage("resize"):
+            scaled = self.session.scaled(self.zoom_factor, interpolation)
+        with self.perf.stage("photo"):
+            zoomed = Image.fromarray(cv2.cvtColor(scaled, cv2.COLOR_BGR2RGB))
+            self.imgtk = ImageTk.PhotoImage(zoomed)
 
         self.canvas.delete("all")
         canvas_w = self.canvas.winfo_width()
@@ -230,7 +421,7 @@ class YOLOApp:
         new_zoom = self.zoom_factor + delta
         if 0.1 < new_zoom < 5.0:
             self.zoom_factor = new_zoom
-            self.render_image()
+            self.renderer.request(interactive=True)
 
     def start_pan(self, event):
         self.pan_start = (event.x, event.y)
@@ -242,7 +433,7 @@ class YOLOApp:
             self.canvas_offset[0] += dx
             self.canvas_offset[1] += dy
             self.pan_start = (event.x, event.y)
-            self.render_image()
+            self.renderer.request(interactive=True)
 
     def test_single_image(self):
         if not self.model_path:
@@ -255,7 +446,10 @@ class YOLOApp:
         index = self.listbox.curselection()[0]
         filename = self.image_list[index]
         input_path = os.path.join(self.image_folder, filename)
-        result = run_yolo_detection_single(self.model_path, input_path)
+        model = self.get_model()
+        if model is None:
+            return
+        result, _ = detect_image(model, input_path)
         if result is not None:
             save_path = os.path.join(self.output_dir, filename)
             cv2.imwrite(save_path, result)
@@ -266,7 +460,11 @@ class YOLOApp:
             messagebox.showerror("Error", "Model and folder required.")
             return
 
-        result_dict = run_yolo_detection(self.model_path, self.image_folder)
+        model = self.get_model()
+        if model is None:
+            return
+        result_dict = run_yolo_detection(self.model_path, self.image_folder,
+                                         labels_dir=os.path.join(self.output_dir, "labels"), model=model)
         for filename, img in result_dict.items():
             save_path = os.path.join(self.output_dir, filename)
             cv2.imwrite(save_path, img)
@@ -315,7 +513,7 @@ class YOLOApp:
         os.makedirs(save_dir, exist_ok=True)
 
         for img in os.listdir(self.output_dir):
-            if img.lower().endswith(('.jpg', '.png', '.bmp')):
+            if img.lower().endswith(IMAGE_EXTS):
                 src = os.path.join(self.output_dir, img)
                 dst = os.path.join(save_dir, img)
                 shutil.copy(src, dst)
@@ -325,5 +523,6 @@ class YOLOApp:
 if __name__ == "__main__":
     root = tk.Tk()
     root.geometry("1000x700")
-    app = YOLOApp(root)
+    folder = sys.argv[1] if len(sys.argv) > 1 and os.path.isdir(sys.argv[1]) else None
+    app = YOLOApp(root, image_folder=folder, preloader=preload_last_model())
     root.mainloop()
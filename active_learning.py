@@ -0,0 +1,114 @@
+"""Uncertainty ranking of unlabeled images from cached model predictions.
+
+Predictions are read from ``<project>/Predictions`` (``cls cx cy w h conf``
+per line, written by the pre-labeling worker or copied from Test_mode's
+``output/labels``). Every unlabeled image that has a prediction file gets a
+score; higher means the model is less sure and the image should be labeled
+sooner: the highest binary entropy of any box confidence in the image, with
+a small tie-break towards images that have more uncertain boxes.
+
+The cached predictions keep only the winning class's confidence per box, so
+a top-1/top-2 class margin cannot be computed from them.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from evaluation import load_label_dir
+
+def score_predictions(pred, num_images):
+    """Per-image uncertainty from a load_label_dir array (column 0 image index, last column conf).
+
+    An image with no predictions gets the maximal entropy of 1: the model
+    found nothing there, which is no evidence the image is easy.
+    """
+    image_idx = pred[:, 0].astype(np.int64)
+    conf = np.clip(pred[:, -1], 1e-6, 1 - 1e-6)
+    box_scores = -(conf * np.log2(conf) + (1 - conf) * np.log2(1 - conf))
+
+    scores = np.zeros(num_images)
+    np.maximum.at(scores, image_idx, box_scores)
+    # small tie-break towards images with more uncertain boxes
+    scores += 1e-4 * np.bincount(image_idx, weights=box_scores, minlength=num_images)
+    scores[np.bincount(image_idx, minlength=num_images) == 0] = 1.0
+    return scores
+
+
+class UncertaintyScorer(threading.Thread):
+    """Background job that keeps ``scores`` (stem -> float) current.
+
+    Each pass lists the predictions and labels folders once, scores only
+    prediction files that are new or changed since the last pass (in batches),
+    and drops images that have been labeled. ``version`` increments whenever
+    the scores change so the UI can tell when to re-rank.
+    """
+
+    def __init__(self, predictions_folder, labels_folder,
+                 batch_size=4096, interval=3.0, get_labeled=None):
+        super().__init__(daemon=True)
+        self.predictions_folder = predictions_folder
+        self.labels_folder = labels_folder
+        self.get_labeled = get_labeled  # e.g. an annotation store's labeled_stems
+        self.batch_size = batch_size
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.scores = {}
+        self.mtimes = {}
+        self.version = 0
+
+    def _scan(self, folder):
+        entries = {}
+        if os.path.isdir(folder):
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.name.endswith(".txt"):
+                        entries[entry.name[:-4]] = entry.stat().st_mtime
+        return entries
+
+    def refresh(self):
+        predictions = self._scan(self.predictions_folder)
+        labeled = self.get_labeled() if self.get_labeled else self._scan(self.labels_folder)
+        changed = [stem for stem, mtime in predictions.items()
+                   if stem not in labeled and self.mtimes.get(stem) != mtime]
+
+        new_scores = {}
+        for start in range(0, len(changed), self.batch_size):
+            batch = changed[start:start + self.batch_size]
+            pred = load_label_dir(self.predictions_folder, batch, 6)
+            batch_scores = score_predictions(pred, len(batch))
+            new_scores.update(zip(batch, batch_scores.tolist()))
+            if self.stop_event.is_set():
+                break
+
+        with self.lock:
+            stale = [stem for stem in self.scores if stem in labeled or stem not in predictions]
+            for stem in stale:
+                del self.scores[stem]
+            self.scores.update(new_scores)
+            for stem in new_scores:
+                self.mtimes[stem] = predictions[stem]
+            if new_scores or stale:
+                self.version += 1
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Uncertainty scoring failed: {e}")
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def rank(self, files):
+        """Most uncertain scored images first, then unscored ones in their given order."""
+        with self.lock:
+            scores = dict(self.scores)
+        scored = [f for f in files if os.path.splitext(f)[0] in scores]
+        unscored = [f for f in files if os.path.splitext(f)[0] not in scores]
+        scored.sort(key=lambda f: -scores[os.path.splitext(f)[0]])
+        return scored + unscored
@@ -0,0 +1,152 @@
+"""Optional single-file annotation store for detection projects.
+
+Instead of one ``Box_labels/<name>.txt`` per image, a project can keep all
+boxes in ``<project>/annotations.db`` (SQLite in WAL mode). Each row holds
+the image stem and the exact YOLO txt content that would otherwise be on
+disk, so the labeler's parse/format code is unchanged and exporting back to
+the txt layout for training is a straight copy.
+
+The labeler uses the store automatically when ``annotations.db`` exists.
+
+Usage::
+
+    python annotation_store.py import PROJECT_FOLDER   # Box_labels/*.txt -> annotations.db
+    python annotation_store.py export PROJECT_FOLDER   # annotations.db -> Box_labels/*.txt
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+STORE_NAME = "annotations.db"
+
+
+def store_path(project_folder):
+    return os.path.join(project_folder, STORE_NAME)
+
+
+def has_store(project_folder):
+    return os.path.exists(store_path(project_folder))
+
+
+class AnnotationStore:
+    """Image stem -> YOLO label text. Safe to share between the UI and worker threads."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            " image TEXT PRIMARY KEY,"
+            " content TEXT NOT NULL,"
+            " updated REAL NOT NULL)")
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get(self, stem):
+        with self.lock:
+            row = self.conn.execute("SELECT content FROM labels WHERE image = ?", (stem,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, stem, content):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO labels (image, content, updated) VALUES (?, ?, ?)"
+                " ON CONFLICT(image) DO UPDATE SET content = excluded.content, updated = excluded.updated",
+                (stem, content, time.time()))
+            self.conn.commit()
+
+    def delete(self, stem):
+        with self.lock:
+            self.conn.execute("DELETE FROM labels WHERE image = ?", (stem,))
+            self.conn.commit()
+
+    def contains(self, stem):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM labels WHERE image = ?", (stem,)).fetchone() is not None
+
+    def labeled_stems(self):
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT image FROM labels")}
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+
+    def items(self, batch_size=10000):
+        """Yield (stem, content) for every labeled image without loading them all at once."""
+        last = ""
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT image, content FROM labels WHERE image > ? ORDER BY image LIMIT ?",
+                    (last, batch_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    # ---------------- YOLO txt layout ----------------
+    def import_txt(self, labels_folder, batch_size=5000):
+        """Load every <stem>.txt under labels_folder into the store. Returns the count."""
+        count = 0
+        batch = []
+        now = time.time()
+        with os.scandir(labels_folder) as it:
+            for entry in it:
+                if not entry.name.endswith(".txt"):
+                    continue
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    batch.append((entry.name[:-4], f.read(), now))
+                if len(batch) >= batch_size:
+                    count += self._insert_many(batch)
+                    batch = []
+        if batch:
+            count += self._insert_many(batch)
+        return count
+
+    def _insert_many(self, rows):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO labels (image, content, updated) VALUES (?, ?, ?)"
+                " ON CONFLICT(image) DO UPDATE SET content = excluded.content, updated = excluded.updated",
+                rows)
+            self.conn.commit()
+        return len(rows)
+
+    def export_txt(self, labels_folder):
+        """Write every stored label back out as <stem>.txt. Returns the count."""
+        os.makedirs(labels_folder, exist_ok=True)
+        count = 0
+        for stem, content in self.items():
+            with open(os.path.join(labels_folder, f"{stem}.txt"), "w", encoding="utf-8") as f:
+                f.write(content)
+            count += 1
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between Box_labels/*.txt and annotations.db")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("project_folder")
+    args = parser.parse_args()
+
+    labels_folder = os.path.join(args.project_folder, "Box_labels")
+    store = AnnotationStore(store_path(args.project_folder))
+    if args.command == "import":
+        print(f"Imported {store.import_txt(labels_folder)} label files into {store.db_path}")
+    else:
+        print(f"Exported {store.export_txt(labels_folder)} label files to {labels_folder}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""Display-free benchmarks for the labelers.
+
+Builds synthetic projects in a temporary folder and drives the same
+annotation and rendering code the labelers run (``label_core``), timing:
+
+* load: open the image, read its labels or mask, render the first frame
+* frame: render a 1600x900 view while panning, with the fast (interactive)
+  and the settled filter, at fit-to-view and 2x zoom
+* drag / stroke: move a box, or paint a pen stroke, one mouse step at a time
+  including the redraw
+* hit: ``find_box_at`` for random points
+* save: format and write the YOLO label file, or write the dirty mask tiles
+* catalog: open a project folder of many images, cold and warm
+* memory: bytes accounted to the image session
+
+Every run is written to ``benchmark_results/<timestamp>.json``. ``--compare``
+prints each metric against an earlier run and exits with status 1 if any got
+more than ``--threshold`` slower. Timings only mean something on the machine
+that produced them, so the folder is not committed: keep a baseline run
+locally and compare against that.
+
+Usage::
+
+    python benchmark.py [--quick] [--compare benchmark_results/OLD.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from catalog import CATALOG_NAME, open_catalog
+from image_session import FAST_INTERPOLATION, fit_scale, idle_interpolation, open_session, peak_rss_mb
+from label_core import BoxAnnotator, BoxArray, MaskAnnotator, write_classes_file
+from mask_tiles import TiledMaskStore, load_mask, tiles_path
+
+RESULTS_FOLDER = "benchmark_results"
+VIEW = (1600, 900)
+FRAMES = 40
+
+FULL_MATRIX = {
+    "image_sizes": [(1280, 720), (4000, 3000), (8000, 6000)],
+    "box_counts": [10, 200, 2000],
+    "class_counts": [3, 80],
+    "project_sizes": [100, 5000],
+}
+QUICK_MATRIX = {
+    "image_sizes": [(1280, 720), (4000, 3000)],
+    "box_counts": [10, 500],
+    "class_counts": [5],
+    "project_sizes": [200],
+}
+
+
+# ---------------- synthetic projects ----------------
+def synthetic_image(w, h, seed=0):
+    """Smooth gradients plus random shapes: compresses like a photo, unlike noise."""
+    rng = np.random.default_rng(seed)
+    xs = np.linspace(0, 255, w, dtype=np.float32)
+    ys = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    image = np.empty((h, w, 3), np.uint8)
+    image[..., 0] = (xs * 0.7 + ys * 0.3).astype(np.uint8)
+    image[..., 1] = (255 - xs * 0.5 - ys * 0.2).astype(np.uint8)
+    image[..., 2] = ((xs + ys) % 256).astype(np.uint8)
+    for _ in range(60):
+        x, y = int(rng.integers(0, w)), int(rng.integers(0, h))
+        r = int(rng.integers(5, max(6, min(w, h) // 8)))
+        cv2.circle(image, (x, y), r, tuple(int(c) for c in rng.integers(0, 256, 3)), -1)
+    return image
+
+
+def class_names(count):
+    return [f"class_{i}" for i in range(count)]
+
+
+def random_boxes(n, w, h, classes, rng):
+    boxes = BoxArray()
+    for _ in range(n):
+        bw, bh = rng.randint(8, max(9, w // 6)), rng.randint(8, max(9, h // 6))
+        x1, y1 = rng.randint(0, w - bw - 1), rng.randint(0, h - bh - 1)
+        boxes.append((rng.randrange(classes), x1, y1, x1 + bw, y1 + bh))
+    return boxes
+
+
+def make_project(root, size, boxes, classes, rng):
+    """Project folder with one image, its YOLO labels and classes.txt. Returns the image path."""
+    w, h = size
+    images = os.path.join(root, "images")
+    os.makedirs(images, exist_ok=True)
+    path = os.path.join(images, "img.jpg")
+    cv2.imwrite(path, synthetic_image(w, h), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    names = class_names(classes)
+    write_classes_file(os.path.join(root, "classes.txt"), names,
+                       {n: tuple(rng.randint(0, 255) for _ in range(3)) for n in names})
+    labels = os.path.join(root, "Box_labels")
+    os.makedirs(labels, exist_ok=True)
+    annotator = BoxAnnotator()
+    annotator.session = open_session(path)
+    annotator.class_names = names
+    annotator.bboxes = random_boxes(boxes, w, h, len(names), rng)
+    with open(os.path.join(labels, "img.txt"), "w", encoding="utf-8") as f:
+        f.write(annotator.format_labels()[0])
+    return path
+
+
+def make_mask(image_path, size, classes, rng):
+    """Saved tile mask for the image with blobs of every class."""
+    w, h = size
+    mask = np.zeros((h, w), np.uint8)
+    for i in range(classes * 4):
+        x, y = rng.randint(0, w - 1), rng.randint(0, h - 1)
+        cv2.circle(mask, (x, y), rng.randint(10, max(11, min(w, h) // 10)), i % classes + 1, -1)
+    folder = os.path.join(os.path.dirname(image_path), "Segment_labels")
+    store = TiledMaskStore(tiles_path(folder, "img"))
+    tile = store.tile
+    store.write(mask.shape, {(r, c): mask[r * tile:(r + 1) * tile, c * tile:(c + 1) * tile]
+                             for r in range(-(-h // tile)) for c in range(-(-w // tile))})
+    return folder
+
+
+# ---------------- timing helpers ----------------
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def summary(samples):
+    samples = np.asarray(samples)
+    return {"p50": round(float(np.percentile(samples, 50)), 3), "p95": round(float(np.percentile(samples, 95)), 3)}
+
+
+def pan_frames(annotator, render, interpolation):
+    """Render FRAMES frames while panning in a small loop; per-frame ms."""
+    times = []
+    for i in range(FRAMES):
+        annotator.pan_by(7 if (i // 10) % 2 == 0 else -7, 3)
+        times.append(timed(lambda: render(interpolation))[0])
+    return times
+
+
+def frame_metrics(metrics, annotator, render):
+    h, w = annotator.session.shape[:2]
+    annotator.session.full_ready.wait()
+    fit = fit_scale((w, h), VIEW)
+    for label, scale in (("fit", fit), ("zoom2x", fit * 2)):
+        annotator.scale, annotator.offset_x, annotator.offset_y = scale, 1, 1
+        metrics[f"frame_fast_{label}_ms"] = summary(pan_frames(annotator, render, FAST_INTERPOLATION))
+        metrics[f"frame_idle_{label}_ms"] = summary(pan_frames(annotator, render, idle_interpolation(scale)))
+    annotator.scale, annotator.offset_x, annotator.offset_y = fit, 1, 1
+
+
+# ---------------- cases ----------------
+def bench_boxes(workdir, size, boxes, classes, rng):
+    root = os.path.join(workdir, f"box_{size[0]}x{size[1]}_{boxes}_{classes}")
+    path = make_project(root, size, boxes, classes, rng)
+    annotator = BoxAnnotator()
+    render = lambda interpolation: annotator.render(0, 0, VIEW[0], VIEW[1], interpolation)
+
+    def load():
+        annotator.session = open_session(path, fit=VIEW)
+        annotator.class_names = class_names(classes)
+        annotator.scale = fit_scale(annotator.session.shape[1::-1], VIEW)
+        with open(os.path.join(root, "Box_labels", "img.txt"), "r", encoding="utf-8") as f:
+            annotator.parse_labels(f.read())
+        return render(FAST_INTERPOLATION)
+
+    metrics = {"load_ms": round(timed(load)[0], 3)}
+    frame_metrics(metrics, annotator, render)
+
+    h, w = annotator.session.shape[:2]
+    points = [(rng.randint(0, w - 1), rng.randint(0, h - 1)) for _ in range(200)]
+    metrics["hit_us"] = summary([timed(lambda: annotator.find_box_at(x, y))[0] * 1000 for x, y in points])
+
+    # drag the first box around, one mouse step per frame
+    _, x1, y1, x2, y2 = annotator.bboxes[0]
+    ix, iy = (x1 + x2) // 2, (y1 + y2) // 2
+    annotator.grab_box(ix, iy)
+    steps = []
+    for i in range(FRAMES):
+        ix, iy = ix + (3 if i < FRAMES // 2 else -3), iy + 2
+        steps.append(timed(lambda: (annotator.drag_to(ix, iy), render(FAST_INTERPOLATION)))[0])
+    annotator.finish_edit(ix, iy)
+    metrics["drag_step_ms"] = summary(steps)
+
+    label_path = os.path.join(root, "Box_labels", "img.txt")
+
+    def save():
+        text, _ = annotator.format_labels()
+        with open(label_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    metrics["save_ms"] = summary([timed(save)[0] for _ in range(20)])
+    metrics["memory_mb"] = round(sum(annotator.session.memory().values()) / 1048576, 2)
+    return metrics
+
+
+def bench_mask(workdir, size, classes, rng):
+    root = os.path.join(workdir, f"mask_{size[0]}x{size[1]}_{classes}")
+    path = make_project(root, size, 0, classes, rng)
+    mask_folder = make_mask(path, size, classes, rng)
+    annotator = MaskAnnotator()
+    annotator.class_colors = {n: tuple(rng.randint(0, 255) for _ in range(3)) for n in class_names(classes)}
+    annotator.current_class = "class_0"
+    render = lambda interpolation: annotator.render(VIEW[0], VIEW[1], interpolation)
+
+    def load():
+        annotator.session = open_session(path, fit=VIEW)
+        annotator.set_mask(load_mask(mask_folder, "img", annotator.session.shape), True)
+        annotator.scale = fit_scale(annotator.session.shape[1::-1], VIEW)
+        return render(FAST_INTERPOLATION)
+
+    metrics = {"load_ms": round(timed(load)[0], 3)}
+    frame_metrics(metrics, annotator, render)
+
+    # a pen stroke across the image, one mouse step per frame
+    h, w = annotator.session.shape[:2]
+    x, y = w // 4, h // 4
+    annotator.polygon_points = [(x, y)]
+    steps = []
+    for _ in range(FRAMES):
+        x, y = x + max(1, w // (2 * FRAMES)), y + max(1, h // (4 * FRAMES))
+        steps.append(timed(lambda: (annotator.stroke_to(x, y), render(FAST_INTERPOLATION)))[0])
+    annotator.end_step()
+    metrics["stroke_step_ms"] = summary(steps)
+
+    store = TiledMaskStore(tiles_path(mask_folder, "img"))
+    metrics["save_ms"] = round(timed(lambda: store.write(annotator.display_mask.shape,
+                                                         annotator.tiles_to_save()))[0], 3)
+    metrics["memory_mb"] = round(sum(annotator.session.memory().values()) / 1048576, 2)
+    return metrics
+
+
+def bench_catalog(workdir, count):
+    folder = os.path.join(workdir, f"catalog_{count}")
+    os.makedirs(folder)
+    ok, data = cv2.imencode(".jpg", synthetic_image(320, 240))
+    blob = data.tobytes()
+    for i in range(count):
+        with open(os.path.join(folder, f"img_{i:06d}.jpg"), "wb") as f:
+            f.write(blob)
+    cold = timed(lambda: open_catalog(folder))[0]
+    warm = timed(lambda: open_catalog(folder))[0]
+    os.remove(os.path.join(folder, CATALOG_NAME))
+    return {"open_cold_ms": round(cold, 3), "open_warm_ms": round(warm, 3)}
+
+
+# ---------------- run / compare ----------------
+def run(matrix, workdir):
+    rng = random.Random(0)
+    results = {}
+    for size in matrix["image_sizes"]:
+        tag = f"{size[0]}x{size[1]}"
+        for classes in matrix["class_counts"]:
+            for boxes in matrix["box_counts"]:
+                name = f"box/{tag}/boxes={boxes}/classes={classes}"
+                results[name] = bench_boxes(workdir, size, boxes, classes, rng)
+                print(f"{name}: {format_metrics(results[name])}")
+            name = f"mask/{tag}/classes={classes}"
+            results[name] = bench_mask(workdir, size, classes, rng)
+            print(f"{name}: {format_metrics(results[name])}")
+    for count in matrix["project_sizes"]:
+        name = f"catalog/images={count}"
+        results[name] = bench_catalog(workdir, count)
+        print(f"{name}: {format_metrics(results[name])}")
+    return results
+
+
+def format_metrics(metrics):
+    parts = []
+    for key, value in metrics.items():
+        parts.append(f"{key} {value['p50']}/{value['p95']}" if isinstance(value, dict) else f"{key} {value}")
+    return ", ".join(parts)
+
+
+def flatten(results):
+    """{case/metric: number}, using the median for distributions."""
+    flat = {}
+    for case, metrics in results.items():
+        for key, value in metrics.items():
+            flat[f"{case}/{key}"] = value["p50"] if isinstance(value, dict) else value
+    return flat
+
+
+def compare(old_path, results, threshold):
+    """Print each metric against the old run; returns the regressed metric names."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = flatten(json.load(f)["results"])
+    regressions = []
+    for key, value in flatten(results).items():
+        if key not in old or not old[key]:
+            continue
+        ratio = value / old[key]
+        # ignore sub-0.2 ms jitter on very fast metrics
+        slower = ratio > 1 + threshold and value - old[key] > 0.2
+        if slower:
+            regressions.append(key)
+        print(f"{'REGRESSION ' if slower else ''}{key}: {old[key]} -> {value} ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the labelers' rendering and annotation core")
+    parser.add_argument("--quick", action="store_true", help="small matrix for a fast check")
+    parser.add_argument("--out", default=RESULTS_FOLDER, help="folder for the results file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown ratio counted as a regression")
+    parser.add_argument("--workdir", help="where to build the synthetic projects (default: a temp folder)")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="labeler_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        results = run(QUICK_MATRIX if args.quick else FULL_MATRIX, workdir)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    record = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "matrix": "quick" if args.quick else "full",
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, time.strftime("%Y%m%d_%H%M%S") + ("_quick" if args.quick else "") + ".json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=1)
+    print(f"Results written to {out_path}")
+
+    if args.compare and compare(args.compare, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
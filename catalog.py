@@ -0,0 +1,240 @@
+"""Project image catalog shared by the labelers, Test mode and batch tools.
+
+One ``os.scandir`` pass per directory lists the images with a single
+extension filter. The result, together with file size, mtime and
+header-parsed width/height, is persisted to ``.image_catalog.json`` in the
+scanned folder (``.image_catalog_recursive.json`` for a recursive scan). On
+the next open every file is stat'ed (cheap from a scandir entry) and only
+new files, or files whose size or mtime changed, have their headers read. No
+image is ever decoded to get its size.
+
+Sizes are the displayed size: OpenCV applies the EXIF orientation when it
+decodes, so for orientations 5-8 (rotated a quarter turn) the header's width
+and height are swapped.
+"""
+
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+CATALOG_NAME = ".image_catalog.json"
+RECURSIVE_CATALOG_NAME = ".image_catalog_recursive.json"
+CATALOG_VERSION = 3
+ORIENTATION_TAG = 0x0112
+
+
+# ---------------- header parsing ----------------
+def _exif_orientation(tiff):
+    """Orientation tag of a TIFF-structured EXIF block (JPEG APP1 or PNG eXIf payload), 1 if absent."""
+    if len(tiff) < 8 or tiff[:2] not in (b"II", b"MM"):
+        return 1
+    endian = "<" if tiff[:2] == b"II" else ">"
+    offset = struct.unpack(endian + "I", tiff[4:8])[0]
+    if offset + 2 > len(tiff):
+        return 1
+    count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+    for i in range(offset + 2, min(len(tiff) - 11, offset + 2 + count * 12), 12):
+        tag, kind = struct.unpack(endian + "HH", tiff[i:i + 4])
+        if tag == ORIENTATION_TAG and kind == 3:
+            return struct.unpack(endian + "H", tiff[i + 8:i + 10])[0]
+    return 1
+
+
+def _oriented(w, h, orientation):
+    return (h, w) if 5 <= orientation <= 8 else (w, h)
+
+
+def _png_size(f, head):
+    w, h = struct.unpack(">II", head[16:24])
+    f.seek(8)
+    while True:  # an eXIf chunk, if any, comes before the image data
+        chunk = f.read(8)
+        if len(chunk) < 8 or chunk[4:8] in (b"IDAT", b"IEND"):
+            return w, h
+        length = struct.unpack(">I", chunk[:4])[0]
+        if chunk[4:8] == b"eXIf":
+            return _oriented(w, h, _exif_orientation(f.read(length)))
+        f.seek(length + 4, os.SEEK_CUR)
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    orientation = 1
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # markers without a length field
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker == 0xE1:  # APP1, where EXIF lives
+            data = f.read(length - 2)
+            if data[:6] == b"Exif\x00\x00":
+                orientation = _exif_orientation(data[6:])
+            continue
+        # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            h, w = struct.unpack(">HH", data[1:5])
+            return _oriented(w, h, orientation)
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _tiff_size(f, head):
+    endian = "<" if head[:2] == b"II" else ">"
+    big = head[2:4] in (b"+\x00", b"\x00+")
+    if big:
+        offset = struct.unpack(endian + "Q", head[8:16])[0]
+        count_fmt, entry_size, value_size = "Q", 20, 8
+    else:
+        offset = struct.unpack(endian + "I", head[4:8])[0]
+        count_fmt, entry_size, value_size = "H", 12, 4
+    f.seek(offset)
+    raw = f.read(struct.calcsize(count_fmt))
+    count = struct.unpack(endian + count_fmt, raw)[0]
+    entries = f.read(count * entry_size)
+    dims = {}
+    for i in range(0, len(entries) - entry_size + 1, entry_size):
+        tag, kind = struct.unpack(endian + "HH", entries[i:i + 4])
+        if tag in (256, 257, ORIENTATION_TAG):  # ImageWidth, ImageLength, Orientation
+            value = entries[i + entry_size - value_size:i + entry_size]
+            fmt = {3: "H", 4: "I", 16: "Q"}.get(kind)
+            if fmt:
+                dims[tag] = struct.unpack(endian + fmt, value[:struct.calcsize(fmt)])[0]
+    if 256 in dims and 257 in dims:
+        return _oriented(dims[256], dims[257], dims.get(ORIENTATION_TAG, 1))
+    return None
+
+
+def read_image_size(path):
+    """Return the displayed (width, height) from the file header, or None if the format is not recognised."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(26)
+            if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+                return _png_size(f, head)
+            if head[:2] == b"BM" and len(head) >= 26:
+                w, h = struct.unpack("<ii", head[18:26])
+                return w, abs(h)
+            if head[:2] == b"\xff\xd8":
+                return _jpeg_size(f)
+            if head[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+                return _tiff_size(f, head)
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+# ---------------- catalog ----------------
+class ImageCatalog:
+    """Cached listing of the images under ``folder``.
+
+    ``files`` is the sorted list of image paths relative to ``folder`` (plain
+    file names when ``recursive`` is False). ``size_of(name)`` returns the
+    cached (width, height) or None.
+    """
+
+    def __init__(self, folder, recursive=False, skip_dirs=(), catalog_path=None):
+        self.folder = folder
+        self.recursive = recursive
+        self.skip_dirs = set(skip_dirs)
+        self.catalog_path = catalog_path or os.path.join(
+            folder, RECURSIVE_CATALOG_NAME if recursive else CATALOG_NAME)
+        self.images = {}   # relative path -> [size, mtime_ns, width, height]
+        self.files = []
+
+    # persistence
+    def load_cached(self):
+        try:
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CATALOG_VERSION:
+            self.images = data.get("images", {})
+
+    def save(self):
+        tmp = f"{self.catalog_path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": CATALOG_VERSION, "images": self.images}, f)
+            os.replace(tmp, self.catalog_path)
+        except OSError as e:
+            print(f"Could not save image catalog: {e}")
+
+    # scanning
+    def refresh(self, full=False):
+        """Bring the catalog up to date. ``full`` re-reads every header, changed or not."""
+        new_images, to_parse = {}, []
+        pending = [""]
+        while pending:
+            rel_dir = pending.pop()
+            abs_dir = os.path.join(self.folder, rel_dir) if rel_dir else self.folder
+            try:
+                entries = list(os.scandir(abs_dir))
+            except OSError:
+                continue
+            for entry in entries:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir():
+                    if self.recursive and entry.name not in self.skip_dirs:
+                        pending.append(rel)
+                    continue
+                if not entry.name.lower().endswith(IMAGE_EXTS):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                cached = self.images.get(rel)
+                if not full and cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+                    new_images[rel] = cached
+                else:
+                    new_images[rel] = [st.st_size, st.st_mtime_ns, None, None]
+                    to_parse.append(rel)
+
+        if to_parse:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                paths = [os.path.join(self.folder, rel) for rel in to_parse]
+                for rel, size in zip(to_parse, pool.map(read_image_size, paths)):
+                    if size:
+                        new_images[rel][2], new_images[rel][3] = size
+
+        changed = to_parse or new_images.keys() != self.images.keys()
+        self.images = new_images
+        self.files = sorted(self.images)
+        if changed:
+            self.save()
+        return self
+
+    def size_of(self, name):
+        entry = self.images.get(name)
+        if entry is None or entry[2] is None:
+            return None
+        return entry[2], entry[3]
+
+    def paths(self):
+        return [os.path.join(self.folder, rel) for rel in self.files]
+
+
+def open_catalog(folder, recursive=False, skip_dirs=()):
+    """Load the cached catalog for folder and refresh it incrementally."""
+    catalog = ImageCatalog(folder, recursive=recursive, skip_dirs=skip_dirs)
+    catalog.load_cached()
+    return catalog.refresh()
+
+
+def list_images(folder, recursive=False, skip_dirs=()):
+    return open_catalog(folder, recursive, skip_dirs).files
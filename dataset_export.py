@@ -0,0 +1,294 @@
+"""Bulk export of a labeled detection project for training.
+
+Formats:
+    coco    instances_<split>.json per split (images, annotations, categories)
+    yolo    images/<split>, labels/<split> and data.yaml, images hard-linked where possible
+    shards  sequential tar shards (<split>-000000.tar ...) holding <stem>.<ext> + <stem>.txt
+
+Only labeled images are exported. Labels come from the annotation store when
+the project has one, otherwise from Box_labels. They are read in parallel,
+one chunk of images at a time, and image sizes come from the catalog's
+header parsing (EXIF-oriented, so they match the image the labeler showed
+and normalized boxes against), so memory stays bounded for multi-million-image projects.
+The train/val/test split is a stable hash of the image name, so re-exports
+put every image in the same split.
+
+Usage::
+
+    python dataset_export.py PROJECT_FOLDER OUT_FOLDER --format coco --split 0.8 0.1 0.1
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import tarfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from annotation_store import AnnotationStore, has_store, store_path
+from catalog import open_catalog
+from label_core import read_classes_file
+
+SPLITS = ("train", "val", "test")
+CHUNK_SIZE = 4096
+
+
+def split_of(stem, ratios):
+    """Stable split assignment from a hash of the image name."""
+    r = (zlib.crc32(stem.encode("utf-8")) & 0xFFFFFFFF) / 2 ** 32
+    acc = 0.0
+    for name, ratio in zip(SPLITS, ratios):
+        acc += ratio
+        if r < acc:
+            return name
+    return SPLITS[len(ratios) - 1]
+
+
+def parse_yolo(text):
+    boxes = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 5:
+            boxes.append((int(parts[0]), *map(float, parts[1:5])))
+    return boxes
+
+
+class LabelReader:
+    """Reads label text for many images at once from the store or Box_labels."""
+
+    def __init__(self, project_folder, workers=8):
+        self.labels_folder = os.path.join(project_folder, "Box_labels")
+        self.store = AnnotationStore(store_path(project_folder)) if has_store(project_folder) else None
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def labeled_stems(self):
+        if self.store is not None:
+            return self.store.labeled_stems()
+        with os.scandir(self.labels_folder) as it:
+            return {e.name[:-4] for e in it if e.name.endswith(".txt")}
+
+    def _read_file(self, stem):
+        try:
+            with open(os.path.join(self.labels_folder, f"{stem}.txt"), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def read_many(self, stems):
+        if self.store is not None:
+            return [self.store.get(stem) for stem in stems]
+        return list(self.pool.map(self._read_file, stems))
+
+    def close(self):
+        self.pool.shutdown()
+        if self.store is not None:
+            self.store.close()
+
+
+def iter_labeled(project_folder, reader):
+    """Yield (relative image name, stem, (width, height), label text) for every labeled image, chunk by chunk."""
+    images_folder = os.path.join(project_folder, "images")
+    catalog = open_catalog(images_folder)
+    labeled = reader.labeled_stems()
+    files = [f for f in catalog.files if os.path.splitext(f)[0] in labeled]
+    for start in range(0, len(files), CHUNK_SIZE):
+        chunk = files[start:start + CHUNK_SIZE]
+        stems = [os.path.splitext(f)[0] for f in chunk]
+        for fname, stem, text in zip(chunk, stems, reader.read_many(stems)):
+            if text is not None:
+                yield fname, stem, catalog.size_of(fname), text
+
+
+def _link_or_copy(src, dst):
+    if os.path.lexists(dst):
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+# ---------------- writers ----------------
+class CocoWriter:
+    """Streams one COCO file per split: images go straight to the output, annotations to a side file."""
+
+    def __init__(self, out_folder, class_names):
+        self.out_folder = out_folder
+        self.class_names = class_names
+        self.files = {}
+        self.next_image_id = 1
+        self.next_ann_id = 1
+
+    def _open(self, split):
+        if split not in self.files:
+            path = os.path.join(self.out_folder, f"instances_{split}.json")
+            main = open(path, "w", encoding="utf-8")
+            anns = open(f"{path}.annotations.tmp", "w+", encoding="utf-8")
+            main.write('{"images": [')
+            self.files[split] = [main, anns, True, True]
+        return self.files[split]
+
+    def add(self, split, fname, stem, size, text, images_folder):
+        if size is None:
+            return False
+        w, h = size
+        entry = self._open(split)
+        main, anns = entry[0], entry[1]
+        image_id = self.next_image_id
+        self.next_image_id += 1
+        main.write(("" if entry[2] else ",") + json.dumps(
+            {"id": image_id, "file_name": fname, "width": w, "height": h}))
+        entry[2] = False
+        for cls_idx, cx, cy, bw, bh in parse_yolo(text):
+            box = [round((cx - bw / 2) * w, 2), round((cy - bh / 2) * h, 2), round(bw * w, 2), round(bh * h, 2)]
+            anns.write(("" if entry[3] else ",") + json.dumps(
+                {"id": self.next_ann_id, "image_id": image_id, "category_id": cls_idx + 1,
+                 "bbox": box, "area": round(box[2] * box[3], 2), "iscrowd": 0}))
+            entry[3] = False
+            self.next_ann_id += 1
+        return True
+
+    def close(self):
+        categories = [{"id": i + 1, "name": name} for i, name in enumerate(self.class_names)]
+        for main, anns, _, _ in self.files.values():
+            main.write('], "annotations": [')
+            anns.seek(0)
+            shutil.copyfileobj(anns, main)
+            main.write('], "categories": ' + json.dumps(categories) + "}")
+            main.close()
+            anns.close()
+            os.remove(anns.name)
+
+
+class YoloWriter:
+    def __init__(self, out_folder, class_names):
+        self.out_folder = out_folder
+        self.class_names = class_names
+        self.splits = set()
+
+    def add(self, split, fname, stem, size, text, images_folder):
+        if split not in self.splits:
+            os.makedirs(os.path.join(self.out_folder, "images", split), exist_ok=True)
+            os.makedirs(os.path.join(self.out_folder, "labels", split), exist_ok=True)
+            self.splits.add(split)
+        _link_or_copy(os.path.join(images_folder, fname),
+                      os.path.join(self.out_folder, "images", split, os.path.basename(fname)))
+        with open(os.path.join(self.out_folder, "labels", split, f"{os.path.basename(stem)}.txt"),
+                  "w", encoding="utf-8") as f:
+            f.write(text)
+        return True
+
+    def close(self):
+        with open(os.path.join(self.out_folder, "data.yaml"), "w", encoding="utf-8") as f:
+            f.write(f"path: {os.path.abspath(self.out_folder)}\n")
+            for split in SPLITS:
+                if split in self.splits:
+                    f.write(f"{split}: images/{split}\n")
+            f.write(f"nc: {len(self.class_names)}\n")
+            f.write("names: " + json.dumps(self.class_names) + "\n")
+
+
+class ShardWriter:
+    """Sequential tar shards, rolled over by sample count or byte size."""
+
+    def __init__(self, out_folder, class_names, shard_samples=1000, shard_bytes=1 << 30):
+        self.out_folder = out_folder
+        self.class_names = class_names
+        self.shard_samples = shard_samples
+        self.shard_bytes = shard_bytes
+        self.open_shards = {}  # split -> [tarfile, index, samples, bytes]
+
+    def _shard(self, split):
+        state = self.open_shards.get(split)
+        if state and (state[2] >= self.shard_samples or state[3] >= self.shard_bytes):
+            state[0].close()
+            state = [None, state[1] + 1, 0, 0]
+        if state is None:
+            state = [None, 0, 0, 0]
+        if state[0] is None:
+            path = os.path.join(self.out_folder, f"{split}-{state[1]:06d}.tar")
+            state[0] = tarfile.open(path, "w")
+        self.open_shards[split] = state
+        return state
+
+    def add(self, split, fname, stem, size, text, images_folder):
+        state = self._shard(split)
+        tar = state[0]
+        key = os.path.basename(stem)
+        image_path = os.path.join(images_folder, fname)
+        tar.add(image_path, arcname=f"{key}{os.path.splitext(fname)[1].lower()}")
+        data = text.encode("utf-8")
+        info = tarfile.TarInfo(f"{key}.txt")
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+        state[2] += 1
+        state[3] += os.path.getsize(image_path) + len(data)
+        return True
+
+    def close(self):
+        for state in self.open_shards.values():
+            if state[0] is not None:
+                state[0].close()
+        with open(os.path.join(self.out_folder, "classes.txt"), "w", encoding="utf-8") as f:
+            for idx, name in enumerate(self.class_names):
+                f.write(f"{idx} {name}\n")
+
+
+WRITERS = {"coco": CocoWriter, "yolo": YoloWriter, "shards": ShardWriter}
+
+
+def export_dataset(project_folder, out_folder, fmt="coco", ratios=(0.8, 0.1, 0.1), progress=None, **writer_args):
+    """Export every labeled image. Returns {split: image count, "skipped": count}.
+
+    A writer skips an image it cannot export (COCO needs the image size); the
+    first few skipped files are printed.
+    """
+    os.makedirs(out_folder, exist_ok=True)
+    images_folder = os.path.join(project_folder, "images")
+    class_names, _ = read_classes_file(os.path.join(project_folder, "classes.txt"))
+    writer = WRITERS[fmt](out_folder, class_names, **writer_args)
+    reader = LabelReader(project_folder)
+    counts = dict.fromkeys(SPLITS, 0)
+    skipped = []
+    try:
+        for n, (fname, stem, size, text) in enumerate(iter_labeled(project_folder, reader), 1):
+            split = split_of(stem, ratios)
+            if writer.add(split, fname, stem, size, text, images_folder):
+                counts[split] += 1
+            else:
+                skipped.append(fname)
+            if progress and n % 1000 == 0:
+                progress(n)
+    finally:
+        writer.close()
+        reader.close()
+    if skipped:
+        more = f" (+{len(skipped) - 10} more)" if len(skipped) > 10 else ""
+        print(f"Skipped {len(skipped)} images with unknown size: {', '.join(skipped[:10])}{more}")
+    counts["skipped"] = len(skipped)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a labeled project for training")
+    parser.add_argument("project_folder")
+    parser.add_argument("out_folder")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="coco")
+    parser.add_argument("--split", type=float, nargs=3, default=(0.8, 0.1, 0.1), metavar=("TRAIN", "VAL", "TEST"))
+    parser.add_argument("--shard-samples", type=int, default=1000)
+    args = parser.parse_args()
+
+    writer_args = {"shard_samples": args.shard_samples} if args.format == "shards" else {}
+    total = sum(args.split)
+    counts = export_dataset(args.project_folder, args.out_folder, args.format,
+                            [r / total for r in args.split],
+                            progress=lambda n: print(f"  {n} images...", end="\r"), **writer_args)
+    print(f"Exported {sum(counts[split] for split in SPLITS)} images: "
+          + ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
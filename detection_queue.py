@@ -0,0 +1,372 @@
+"""Shared-filesystem work queue for batch detection.
+
+A coordinator splits an image folder into chunk manifests inside a queue
+directory; any number of workers (local processes or other hosts mounting the
+same share) claim chunks by atomically renaming them out of ``pending/``.
+
+Queue layout::
+
+    queue_dir/
+        queue.json           settings written by the coordinator
+        pending/<chunk>.json chunks waiting for a worker
+        leased/<chunk>.json  claimed chunks; mtime is the lease heartbeat and
+                             "owner" names the worker holding the lease
+        done/<chunk>.json    committed chunks
+        failed/<chunk>.json  chunks that ran out of attempts
+        results/<chunk>.json per-image detections of committed chunks
+
+Usage::
+
+    python detection_queue.py init QUEUE_DIR IMAGE_FOLDER [--chunk-size 500]
+    python detection_queue.py work QUEUE_DIR --model best.pt [--workers 4] [--metrics-dir DIR]
+    python detection_queue.py status QUEUE_DIR
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+
+from catalog import open_catalog
+from pipeline_metrics import METRICS_INTERVAL, busy_of, metrics_dir, stage_of, start_metrics
+
+QUEUE_STATES = ("pending", "leased", "done", "failed")
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_images(image_folder):
+    return open_catalog(image_folder, recursive=True, skip_dirs=("output",)).paths()
+
+
+# ---------------- coordinator ----------------
+def init_queue(queue_dir, image_folder, output_dir=None, chunk_size=500,
+               lease_seconds=300, max_attempts=3):
+    """Split image_folder into chunk manifests under queue_dir. Returns the chunk count."""
+    image_folder = os.path.abspath(image_folder)
+    output_dir = os.path.abspath(output_dir or os.path.join(image_folder, "output"))
+    for state in QUEUE_STATES + ("results",):
+        os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    _write_json_atomic(os.path.join(queue_dir, "queue.json"), {
+        "image_folder": image_folder,
+        "output_dir": output_dir,
+        "lease_seconds": lease_seconds,
+        "max_attempts": max_attempts,
+    })
+
+    image_list = list_images(image_folder)
+    chunk_count = 0
+    for start in range(0, len(image_list), chunk_size):
+        chunk_id = f"chunk_{chunk_count:06d}"
+        if not any(os.path.exists(os.path.join(queue_dir, state, f"{chunk_id}.json"))
+                   for state in QUEUE_STATES):
+            _write_json_atomic(os.path.join(queue_dir, "pending", f"{chunk_id}.json"), {
+                "chunk_id": chunk_id,
+                "images": image_list[start:start + chunk_size],
+                "attempts": 0,
+            })
+        chunk_count += 1
+    return chunk_count
+
+
+def reclaim_expired(queue_dir, lease_seconds=None, max_attempts=None):
+    """Move chunks whose lease heartbeat stopped back to pending (or to failed)."""
+    settings = _read_json(os.path.join(queue_dir, "queue.json"))
+    lease_seconds = lease_seconds or settings["lease_seconds"]
+    max_attempts = max_attempts or settings["max_attempts"]
+    leased_dir = os.path.join(queue_dir, "leased")
+    now = time.time()
+    reclaimed = 0
+    for fname in os.listdir(leased_dir):
+        if not fname.endswith(".json"):
+            continue
+        leased_path = os.path.join(leased_dir, fname)
+        try:
+            if now - os.path.getmtime(leased_path) < lease_seconds:
+                continue
+            # Rename first so that only one reclaimer wins the chunk
+            claim_path = f"{leased_path}.{uuid.uuid4().hex}.reclaim"
+            os.rename(leased_path, claim_path)
+        except FileNotFoundError:
+            continue
+        manifest = _read_json(claim_path)
+        manifest.pop("owner", None)
+        manifest["attempts"] = manifest.get("attempts", 0) + 1
+        state = "pending" if manifest["attempts"] < max_attempts else "failed"
+        _write_json_atomic(os.path.join(queue_dir, state, fname), manifest)
+        os.remove(claim_path)
+        reclaimed += 1
+    return reclaimed
+
+
+def queue_status(queue_dir):
+    status = {}
+    for state in QUEUE_STATES:
+        state_dir = os.path.join(queue_dir, state)
+        status[state] = len([f for f in os.listdir(state_dir) if f.endswith(".json")])
+    return status
+
+
+# ---------------- worker ----------------
+def _holds_lease(leased_path, owner):
+    """True while leased_path is still the manifest this owner claimed."""
+    try:
+        return _read_json(leased_path).get("owner") == owner
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+class _LeaseHeartbeat(threading.Thread):
+    """Keeps a lease alive by touching the leased manifest while a chunk is processed.
+
+    Once the manifest is gone or carries another owner (the chunk was
+    reclaimed and re-leased), ``lost`` is set and the heartbeat stops.
+    """
+
+    def __init__(self, leased_path, owner, interval):
+        super().__init__(daemon=True)
+        self.leased_path = leased_path
+        self.owner = owner
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            if not _holds_lease(self.leased_path, self.owner):
+                self.lost = True
+                return
+            try:
+                os.utime(self.leased_path)
+            except FileNotFoundError:
+                self.lost = True
+                return
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def claim_chunk(queue_dir, owner=None):
+    """Atomically move one pending chunk into leased/. Returns the leased path or None.
+
+    ``owner`` (unique per claim) is written into the leased manifest so the
+    holder can tell its lease apart from a later re-lease of the same chunk.
+    """
+    pending_dir = os.path.join(queue_dir, "pending")
+    for fname in sorted(os.listdir(pending_dir)):
+        if not fname.endswith(".json"):
+            continue
+        pending_path = os.path.join(pending_dir, fname)
+        leased_path = os.path.join(queue_dir, "leased", fname)
+        try:
+            # Fresh mtime before the move so the lease never looks expired
+            os.utime(pending_path)
+            os.rename(pending_path, leased_path)
+        except (FileNotFoundError, FileExistsError, PermissionError):
+            continue  # another worker got it first
+        if owner is not None:
+            try:
+                manifest = _read_json(leased_path)
+            except FileNotFoundError:
+                continue
+            manifest["owner"] = owner
+            _write_json_atomic(leased_path, manifest)
+        return leased_path
+    return None
+
+
+def output_paths(image_path, image_folder, output_dir):
+    """Return (annotated image path, label path), mirroring image_path's place under image_folder.
+
+    Images in sub-folders can share a basename, so output_dir/<rel> and
+    output_dir/labels/<rel stem>.txt keep their outputs apart.
+    """
+    rel = os.path.relpath(image_path, image_folder) if image_folder else os.path.basename(image_path)
+    label_path = os.path.join(output_dir, "labels", f"{os.path.splitext(rel)[0]}.txt")
+    return os.path.join(output_dir, rel), label_path
+
+
+def make_yolo_processor(model_path, conf_thres=0.3, iou_thres=0.4, metrics=None, image_folder=None):
+    """Build a per-image function that runs the Test_mode detector and writes the annotated image."""
+    import cv2
+    from Test_mode import load_yolo_model, detect_image, save_prediction_labels
+
+    model = load_yolo_model(model_path, conf_thres, iou_thres)
+
+    def process(image_path, output_dir):
+        img, detections = detect_image(model, image_path, iou_thres, metrics=metrics)
+        if img is None:
+            return None
+        with stage_of(metrics, "write"):
+            image_out, label_out = output_paths(image_path, image_folder, output_dir)
+            os.makedirs(os.path.dirname(image_out), exist_ok=True)
+            os.makedirs(os.path.dirname(label_out), exist_ok=True)
+            cv2.imwrite(image_out, img)
+            save_prediction_labels(label_out, detections, img.shape)
+        return detections
+
+    return process
+
+
+def run_worker(queue_dir, process, worker_id=None, poll_seconds=2.0, exit_when_empty=True, metrics=None):
+    """Claim and process chunks until the queue drains. Returns the number of chunks committed.
+
+    ``process(image_path, output_dir)`` returns a JSON-serialisable list of
+    detections, or None when the image cannot be read; an exception from it
+    is recorded under "errors" in the chunk's results. ``metrics`` (a
+    PipelineMetrics) receives queue depths, busy time and per-image counts.
+    """
+    settings = _read_json(os.path.join(queue_dir, "queue.json"))
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    output_dir = settings["output_dir"]
+    lease_seconds = settings["lease_seconds"]
+    committed = 0
+
+    while True:
+        owner = f"{worker_id}-{uuid.uuid4().hex}"
+        leased_path = claim_chunk(queue_dir, owner)
+        if leased_path is None:
+            reclaim_expired(queue_dir)
+            leased_path = claim_chunk(queue_dir, owner)
+        if leased_path is None:
+            status = queue_status(queue_dir)
+            if metrics is not None:
+                metrics.set_queue(images=0, pending_chunks=status["pending"], leased_chunks=status["leased"])
+            if exit_when_empty and status["pending"] == 0 and status["leased"] == 0:
+                return committed
+            time.sleep(poll_seconds)
+            continue
+
+        fname = os.path.basename(leased_path)
+        manifest = _read_json(leased_path)
+        heartbeat = _LeaseHeartbeat(leased_path, owner, max(lease_seconds / 3.0, 0.05))
+        heartbeat.start()
+        if metrics is not None:
+            status = queue_status(queue_dir)
+            metrics.set_queue(images=len(manifest["images"]), pending_chunks=status["pending"],
+                              leased_chunks=status["leased"])
+        results = {}
+        errors = {}
+        try:
+            for image_path in manifest["images"]:
+                with busy_of(metrics):
+                    try:
+                        results[image_path] = process(image_path, output_dir)
+                    except Exception as e:
+                        # one bad image must not cost the rest of the chunk
+                        print(f"[{worker_id}] {image_path}: {e}")
+                        results[image_path] = None
+                        errors[image_path] = str(e)
+                if metrics is not None:
+                    detections = results[image_path]
+                    metrics.image_done(None if detections is None else len(detections))
+        finally:
+            heartbeat.stop()
+
+        if heartbeat.lost or not _holds_lease(leased_path, owner):
+            # Lease expired and was reclaimed; another worker will redo the chunk
+            continue
+
+        # Commit: results first, then the manifest move marks the chunk done
+        _write_json_atomic(os.path.join(queue_dir, "results", fname), {
+            "chunk_id": manifest["chunk_id"],
+            "worker": worker_id,
+            "finished": time.time(),
+            "detections": results,
+            "errors": errors,
+        })
+        if not _holds_lease(leased_path, owner):
+            continue
+        try:
+            os.rename(leased_path, os.path.join(queue_dir, "done", fname))
+        except FileNotFoundError:
+            continue
+        committed += 1
+
+
+def _worker_main(queue_dir, model_path, conf_thres, iou_thres, metrics_folder=None,
+                 metrics_interval=METRICS_INTERVAL, slot=0):
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    # leases need a unique id; metrics files are per slot so restarts replace them
+    metrics, writer = start_metrics(metrics_folder, f"{socket.gethostname()}-worker{slot}", metrics_interval)
+    try:
+        image_folder = _read_json(os.path.join(queue_dir, "queue.json"))["image_folder"]
+        process = make_yolo_processor(model_path, conf_thres, iou_thres, metrics, image_folder)
+        committed = run_worker(queue_dir, process, worker_id, metrics=metrics)
+    finally:
+        if writer is not None:
+            writer.stop()
+    print(f"[{worker_id}] committed {committed} chunks")
+
+
+def run_local_workers(queue_dir, model_path, workers=1, conf_thres=0.3, iou_thres=0.4, metrics_folder=None,
+                      metrics_interval=METRICS_INTERVAL):
+    procs = [multiprocessing.Process(target=_worker_main,
+                                     args=(queue_dir, model_path, conf_thres, iou_thres, metrics_folder,
+                                           metrics_interval, slot))
+             for slot in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed YOLO detection over a shared folder")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_init = sub.add_parser("init", help="split an image folder into chunk manifests")
+    p_init.add_argument("queue_dir")
+    p_init.add_argument("image_folder")
+    p_init.add_argument("--output", default=None)
+    p_init.add_argument("--chunk-size", type=int, default=500)
+    p_init.add_argument("--lease-seconds", type=int, default=300)
+    p_init.add_argument("--max-attempts", type=int, default=3)
+
+    p_work = sub.add_parser("work", help="claim and process chunks")
+    p_work.add_argument("queue_dir")
+    p_work.add_argument("--model", required=True)
+    p_work.add_argument("--workers", type=int, default=1)
+    p_work.add_argument("--conf", type=float, default=0.3)
+    p_work.add_argument("--iou", type=float, default=0.4)
+    p_work.add_argument("--metrics-dir", default=None,
+                        help="write per-worker Prometheus (.prom) and CSV metrics here (default: $DETECTION_METRICS_DIR)")
+    p_work.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL)
+
+    p_status = sub.add_parser("status", help="show chunk counts per state")
+    p_status.add_argument("queue_dir")
+
+    args = parser.parse_args()
+    if args.command == "init":
+        count = init_queue(args.queue_dir, args.image_folder, args.output, args.chunk_size,
+                           args.lease_seconds, args.max_attempts)
+        print(f"Queued {count} chunks in {args.queue_dir}")
+    elif args.command == "work":
+        run_local_workers(args.queue_dir, args.model, args.workers, args.conf, args.iou,
+                          metrics_dir(args.metrics_dir), args.metrics_interval)
+    else:
+        reclaim_expired(args.queue_dir)
+        print(json.dumps(queue_status(args.queue_dir), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Offline detection evaluation: score Test_mode predictions against Box_labels.
+
+Ground truth is the YOLO txt layout written by ``BoundingBoxLabeler.save_boxes``
+(``cls cx cy w h``). Predictions are the same layout with a trailing confidence,
+as written by ``Test_mode.save_prediction_labels`` into ``output/labels``.
+Only images that have a ground-truth file are scored; a labeled image with no
+prediction file counts as having no detections.
+
+Candidate (ground truth, prediction) pairs and their IoUs are computed on
+flat arrays for the whole dataset at once. Matching then follows COCO/VOC:
+per image and class, predictions in descending confidence each take the
+highest-IoU ground truth not yet matched, at every IoU threshold.
+
+Usage::
+
+    python evaluation.py PROJECT_FOLDER PRED_LABELS_DIR [--out report.json]
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from label_core import read_classes_file
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+# ---------------- bulk loading ----------------
+def _read_texts(paths):
+    texts = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                texts.append(f.read())
+        except FileNotFoundError:
+            texts.append("")
+    return texts
+
+
+def _parse_label_text(text, ncols):
+    rows = [r.split()[:ncols] for r in text.splitlines()]
+    return np.array([r for r in rows if len(r) == ncols], dtype=np.float64).reshape(-1, ncols)
+
+
+def load_label_dir(label_dir, stems, ncols, workers=16):
+    """Load <stem>.txt for every stem into one (N, ncols + 1) array; column 0 is the image index.
+
+    Files are read on a thread pool (I/O bound) and parsed in a single numpy
+    pass over the concatenated text; per-file row counts come from newline
+    counts, with a per-file fallback if any file is not one box per line.
+    """
+    paths = [os.path.join(label_dir, f"{stem}.txt") for stem in stems]
+    workers = max(1, min(workers, os.cpu_count() or 1, len(paths) // 1024 + 1))
+    step = -(-len(paths) // workers) if paths else 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batches = pool.map(_read_texts, [paths[i:i + step] for i in range(0, len(paths), step)])
+        texts = [t for batch in batches for t in batch]
+    texts = [t if not t or t.endswith("\n") else t + "\n" for t in texts]
+    counts = np.array([t.count("\n") for t in texts], dtype=np.int64)
+    data = np.fromstring("".join(texts), dtype=np.float64, sep=" ")
+    if data.size != counts.sum() * ncols:
+        arrays = [_parse_label_text(t, ncols) for t in texts]
+        counts = np.array([len(a) for a in arrays], dtype=np.int64)
+        data = np.concatenate(arrays) if arrays else np.zeros((0, ncols))
+    data = data.reshape(-1, ncols)
+    image_idx = np.repeat(np.arange(len(stems)), counts)
+    return np.column_stack([image_idx, data])
+
+
+def _xywh_to_xyxy(xywh):
+    half = xywh[:, 2:4] / 2
+    return np.column_stack([xywh[:, 0:2] - half, xywh[:, 0:2] + half])
+
+
+# ---------------- matching ----------------
+def _candidate_pairs(gt_keys, pred_keys):
+    """All (gt, pred) index pairs with equal keys, generated without a Python loop."""
+    gt_order = np.argsort(gt_keys, kind="stable")
+    sorted_keys = gt_keys[gt_order]
+    starts = np.searchsorted(sorted_keys, pred_keys, side="left")
+    ends = np.searchsorted(sorted_keys, pred_keys, side="right")
+    counts = ends - starts
+    pred_idx = np.repeat(np.arange(len(pred_keys)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    gt_idx = gt_order[np.repeat(starts, counts) + offsets]
+    return gt_idx, pred_idx
+
+
+def _pair_iou(gt_boxes, pred_boxes):
+    lt = np.maximum(gt_boxes[:, :2], pred_boxes[:, :2])
+    rb = np.minimum(gt_boxes[:, 2:], pred_boxes[:, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=1)
+    area_gt = (gt_boxes[:, 2:] - gt_boxes[:, :2]).prod(axis=1)
+    area_pred = (pred_boxes[:, 2:] - pred_boxes[:, :2]).prod(axis=1)
+    return inter / np.maximum(area_gt + area_pred - inter, 1e-12)
+
+
+def _greedy_by_confidence(gt_idx, pred_idx, iou, conf, thresholds):
+    """COCO/VOC matching: in descending confidence, each prediction takes the highest-IoU ground truth
+    still unmatched at that threshold. Returns one (gt, pred) pair of index arrays per threshold."""
+    matched = [{} for _ in thresholds]  # per threshold: gt -> pred
+    if len(pred_idx):
+        order = np.lexsort((-iou, pred_idx, -conf[pred_idx]))
+        gts, preds, ious = gt_idx[order].tolist(), pred_idx[order].tolist(), iou[order].tolist()
+        bounds = (np.flatnonzero(np.diff(pred_idx[order])) + 1).tolist()
+        for start, end in zip([0] + bounds, bounds + [len(preds)]):
+            for thr, used in zip(thresholds, matched):
+                for k in range(start, end):
+                    if ious[k] < thr:
+                        break
+                    if gts[k] not in used:
+                        used[gts[k]] = preds[k]
+                        break
+    return [(np.fromiter(m.keys(), np.int64, len(m)), np.fromiter(m.values(), np.int64, len(m))) for m in matched]
+
+
+def match_predictions(gt, pred, num_classes):
+    """Return a (num_pred, len(IOU_THRESHOLDS)) boolean true-positive matrix."""
+    gt_keys = gt[:, 0].astype(np.int64) * num_classes + gt[:, 1].astype(np.int64)
+    pred_keys = pred[:, 0].astype(np.int64) * num_classes + pred[:, 1].astype(np.int64)
+    gt_idx, pred_idx = _candidate_pairs(gt_keys, pred_keys)
+    iou = _pair_iou(_xywh_to_xyxy(gt[gt_idx, 2:6]), _xywh_to_xyxy(pred[pred_idx, 2:6]))
+
+    tp = np.zeros((len(pred), len(IOU_THRESHOLDS)), dtype=bool)
+    matches = _greedy_by_confidence(gt_idx, pred_idx, iou, pred[:, 6], IOU_THRESHOLDS)
+    for t, (_, matched_pred) in enumerate(matches):
+        tp[matched_pred, t] = True
+    return tp
+
+
+def confusion_matrix(gt, pred, num_classes, iou_thres=0.5):
+    """(num_classes + 1)^2 counts, rows = predicted class, cols = true class; last index is background."""
+    gt_idx, pred_idx = _candidate_pairs(gt[:, 0].astype(np.int64), pred[:, 0].astype(np.int64))
+    iou = _pair_iou(_xywh_to_xyxy(gt[gt_idx, 2:6]), _xywh_to_xyxy(pred[pred_idx, 2:6]))
+    gt_idx, pred_idx = _greedy_by_confidence(gt_idx, pred_idx, iou, pred[:, 6], [iou_thres])[0]
+
+    bg = num_classes
+    matrix = np.zeros((num_classes + 1, num_classes + 1), dtype=np.int64)
+    gt_cls = np.minimum(gt[:, 1].astype(np.int64), bg)
+    pred_cls = np.minimum(pred[:, 1].astype(np.int64), bg)
+    np.add.at(matrix, (pred_cls[pred_idx], gt_cls[gt_idx]), 1)
+
+    unmatched_gt = np.ones(len(gt), dtype=bool)
+    unmatched_gt[gt_idx] = False
+    np.add.at(matrix, (bg, gt_cls[unmatched_gt]), 1)
+    unmatched_pred = np.ones(len(pred), dtype=bool)
+    unmatched_pred[pred_idx] = False
+    np.add.at(matrix, (pred_cls[unmatched_pred], bg), 1)
+    return matrix
+
+
+# ---------------- metrics ----------------
+def _average_precision(recall, precision):
+    """COCO-style 101-point interpolated AP. Returns (ap, interpolated precision curve)."""
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    grid = np.linspace(0, 1, 101)
+    idx = np.searchsorted(mrec, grid, side="left")
+    curve = np.where(idx < len(mpre), mpre[np.minimum(idx, len(mpre) - 1)], 0.0)
+    return curve.mean(), curve
+
+
+def ap_per_class(tp, conf, pred_cls, gt_cls, num_classes):
+    order = np.argsort(-conf, kind="stable")
+    tp, pred_cls = tp[order], pred_cls[order]
+    n_gt = np.bincount(gt_cls, minlength=num_classes)
+
+    ap = np.zeros((num_classes, tp.shape[1]))
+    curves = {}
+    for c in range(num_classes):
+        sel = pred_cls == c
+        if n_gt[c] == 0 or not sel.any():
+            continue
+        tpc = np.cumsum(tp[sel], axis=0)
+        fpc = np.cumsum(~tp[sel], axis=0)
+        recall = tpc / n_gt[c]
+        precision = tpc / (tpc + fpc)
+        for t in range(tp.shape[1]):
+            ap[c, t], curve = _average_precision(recall[:, t], precision[:, t])
+            if t == 0:
+                curves[c] = curve
+    return ap, n_gt, curves
+
+
+def evaluate(gt_dir, pred_dir, class_names=None, stems=None):
+    if stems is None:
+        stems = sorted(os.path.splitext(f)[0] for f in os.listdir(gt_dir) if f.endswith(".txt"))
+    gt = load_label_dir(gt_dir, stems, 5)
+    pred = load_label_dir(pred_dir, stems, 6)
+
+    max_cls = int(max(gt[:, 1].max(initial=-1), pred[:, 1].max(initial=-1))) + 1
+    num_classes = max(len(class_names or []), max_cls)
+    class_names = list(class_names or []) + [f"class_{i}" for i in range(len(class_names or []), num_classes)]
+
+    tp = match_predictions(gt, pred, num_classes)
+    gt_cls = gt[:, 1].astype(np.int64)
+    pred_cls = pred[:, 1].astype(np.int64)
+    ap, n_gt, curves = ap_per_class(tp, pred[:, 6], pred_cls, gt_cls, num_classes)
+    matrix = confusion_matrix(gt, pred, num_classes)
+
+    present = n_gt > 0
+    per_class = {}
+    for c, name in enumerate(class_names):
+        tp50 = int(tp[pred_cls == c, 0].sum())
+        n_pred = int((pred_cls == c).sum())
+        per_class[name] = {
+            "ground_truth": int(n_gt[c]),
+            "predictions": n_pred,
+            "tp": tp50,
+            "fp": n_pred - tp50,
+            "fn": int(n_gt[c]) - tp50,
+            "precision": tp50 / n_pred if n_pred else 0.0,
+            "recall": tp50 / n_gt[c] if n_gt[c] else 0.0,
+            "ap50": float(ap[c, 0]),
+            "ap50_95": float(ap[c].mean()),
+            "pr_curve": {
+                "recall": np.linspace(0, 1, 101).round(2).tolist(),
+                "precision": curves[c].round(4).tolist() if c in curves else [],
+            },
+        }
+
+    return {
+        "images": len(stems),
+        "map50": float(ap[present, 0].mean()) if present.any() else 0.0,
+        "map50_95": float(ap[present].mean()) if present.any() else 0.0,
+        "per_class": per_class,
+        "confusion_matrix": {
+            "labels": class_names + ["background"],
+            "rows_predicted_cols_true": matrix.tolist(),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score YOLO predictions against Box_labels")
+    parser.add_argument("project_folder")
+    parser.add_argument("pred_dir")
+    parser.add_argument("--out", default=None, help="write the full report as JSON")
+    args = parser.parse_args()
+
+    report = evaluate(os.path.join(args.project_folder, "Box_labels"), args.pred_dir,
+                      read_classes_file(os.path.join(args.project_folder, "classes.txt"))[0])
+    print(f"Images: {report['images']}  mAP@0.5: {report['map50']:.4f}  mAP@0.5:0.95: {report['map50_95']:.4f}")
+    for name, stats in report["per_class"].items():
+        print(f"  {name:<20} gt={stats['ground_truth']:<7} tp={stats['tp']:<7} fp={stats['fp']:<7} "
+              f"fn={stats['fn']:<7} AP50={stats['ap50']:.4f} AP50-95={stats['ap50_95']:.4f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
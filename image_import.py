@@ -0,0 +1,203 @@
+"""Image import engine for ProjectCreationPage.
+
+Images can be brought into a project's ``images`` folder by hardlink,
+symlink, reflink (copy-on-write clone, where the filesystem supports it) or
+a parallel copy. ``auto`` tries reflink, then hardlink, then copy.
+
+Each imported file is recorded in ``import_manifest.json`` with the size and
+mtime it had at the source. Re-running an import skips files whose source is
+unchanged, so a cancelled or interrupted import resumes where it stopped and
+re-importing a folder only processes new or changed images.
+"""
+
+import json
+import os
+import shutil
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog import IMAGE_EXTS as SUPPORTED_EXTS
+IMPORT_MODES = ("auto", "reflink", "hardlink", "symlink", "copy")
+MANIFEST_NAME = "import_manifest.json"
+
+_FICLONE = 0x40049409  # linux/fs.h
+
+
+def _reflink(src, dst):
+    if sys.platform.startswith("linux"):
+        import fcntl
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            except OSError:
+                fdst.close()
+                os.remove(dst)
+                raise
+        shutil.copystat(src, dst)
+    elif sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL("libc.dylib", use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            raise OSError(ctypes.get_errno(), "clonefile failed", src)
+    else:
+        raise OSError("reflink is not supported on this platform")
+
+
+def _copy(src, dst):
+    # copy under a temporary name so an interrupted copy never looks complete
+    tmp = f"{dst}.{uuid.uuid4().hex}.part"
+    try:
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _place(src, dst, mode):
+    if mode == "hardlink":
+        os.link(src, dst)
+    elif mode == "symlink":
+        os.symlink(os.path.abspath(src), dst)
+    elif mode == "reflink":
+        _reflink(src, dst)
+    else:
+        _copy(src, dst)
+
+
+class ImportJob(threading.Thread):
+    """Imports images from source_folder into images_folder on a background thread.
+
+    The UI polls ``done``, ``total``, ``skipped``, ``errors`` and ``finished``;
+    ``cancel()`` stops after the files already in flight.
+    """
+
+    def __init__(self, source_folder, images_folder, manifest_path, mode="auto", workers=8):
+        super().__init__(daemon=True)
+        self.source_folder = source_folder
+        self.images_folder = images_folder
+        self.manifest_path = manifest_path
+        self.mode = mode
+        self.workers = workers
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+        self.total = 0
+        self.done = 0
+        self.skipped = 0
+        self.imported = 0
+        self.errors = []
+        self.finished = False
+        self.cancelled = False
+        self.modes_used = {}
+
+        # auto mode falls back once per job, not once per file
+        self._auto_chain = ["reflink", "hardlink", "copy"]
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest):
+        tmp = f"{self.manifest_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def scan(self, manifest):
+        """Return [(name, size, mtime_ns)] for source images that are new or changed."""
+        todo = []
+        with os.scandir(self.source_folder) as it:
+            for entry in it:
+                if not entry.is_file() or not entry.name.lower().endswith(SUPPORTED_EXTS):
+                    continue
+                st = entry.stat()
+                self.total += 1
+                current = [st.st_size, st.st_mtime_ns]
+                dst = os.path.join(self.images_folder, entry.name)
+                if os.path.lexists(dst):
+                    known = manifest.get(entry.name)
+                    if known is None:
+                        # imported before manifests existed: trust a matching copy
+                        try:
+                            dst_st = os.stat(dst)
+                            if [dst_st.st_size, dst_st.st_mtime_ns] == current:
+                                known = manifest[entry.name] = current
+                        except OSError:
+                            pass
+                    if known == current:
+                        self.skipped += 1
+                        self.done += 1
+                        continue
+                todo.append((entry.name, st.st_size, st.st_mtime_ns))
+        return todo
+
+    def import_one(self, name):
+        src = os.path.join(self.source_folder, name)
+        dst = os.path.join(self.images_folder, name)
+        if os.path.lexists(dst):
+            os.remove(dst)  # changed at the source: replace it
+        if self.mode != "auto":
+            _place(src, dst, self.mode)
+            return self.mode
+        while True:
+            mode = self._auto_chain[0]
+            try:
+                _place(src, dst, mode)
+                return mode
+            except OSError:
+                if mode == "copy":
+                    raise
+                with self.lock:
+                    if self._auto_chain[0] == mode:
+                        self._auto_chain.pop(0)
+
+    def run(self):
+        try:
+            self.import_all()
+        except OSError as e:
+            self.errors.append(str(e))
+        finally:
+            self.cancelled = self.cancel_event.is_set()
+            self.finished = True
+
+    def import_all(self):
+        os.makedirs(self.images_folder, exist_ok=True)
+        manifest = self.load_manifest()
+        todo = self.scan(manifest)
+
+        def task(item):
+            if self.cancel_event.is_set():
+                return item, None, None
+            try:
+                return item, self.import_one(item[0]), None
+            except OSError as e:
+                return item, None, e
+
+        since_save = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for (name, size, mtime_ns), mode, error in pool.map(task, todo):
+                if mode is None and error is None:
+                    continue  # cancelled before it started
+                with self.lock:
+                    self.done += 1
+                    if error is not None:
+                        self.errors.append(f"{name}: {error}")
+                    else:
+                        self.imported += 1
+                        self.modes_used[mode] = self.modes_used.get(mode, 0) + 1
+                        manifest[name] = [size, mtime_ns]
+                since_save += 1
+                if since_save >= 500:
+                    self.save_manifest(manifest)
+                    since_save = 0
+
+        self.save_manifest(manifest)
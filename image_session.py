@@ -0,0 +1,382 @@
+"""Shared image session: one decoded, read-only buffer per open image.
+
+The labelers and Test mode used to keep the decoded image plus a full
+"original" copy, and copied it again on every render before resizing. A
+session decodes the image once and marks the array read-only, so tools hold
+views of it instead of copies and any accidental in-place drawing fails
+loudly. Renders resize first and draw overlays on the (screen-sized) result,
+so the only per-render allocation is the output.
+
+Images too large to hold in RAM are opened as tiled sessions instead (see
+tiled_image.py): same interface, but pixels come from a memory-mapped
+pyramid or a tiled TIFF. Tools should go through ``render_view()`` and
+``region()`` rather than touching ``image`` so both kinds work.
+
+JPEGs larger than the window open as a progressive session: a reduced
+decode (libjpeg DCT scaling via ``IMREAD_REDUCED_COLOR_*``) is shown first
+and full resolution is decoded on a background thread. Every session records
+its time to first paint.
+
+Plain sessions build a zoom pyramid lazily: 2x-downsampled copies of the
+image, made the first time a view zooms out far enough to use them, so
+repeated zooming resamples from the nearest level instead of the full image.
+Views render with ``FAST_INTERPOLATION`` while the user zooms or pans and
+re-render with ``idle_interpolation(scale)`` (area when shrinking, Lanczos
+when enlarging) once the view settles.
+
+Each session accounts for its own buffers: the image plus anything a tool
+registers with ``track()`` (masks, undo history, ...). ``total_memory()``
+sums all live sessions.
+
+Usage::
+
+    python image_session.py IMAGE [--scale 0.25]   # load + render, print accounting and peak RSS
+"""
+
+import argparse
+import math
+import sys
+import threading
+import time
+import weakref
+
+import cv2
+import numpy as np
+
+from catalog import read_image_size
+
+_live_sessions = weakref.WeakSet()
+
+PREVIEW_EXTS = (".jpg", ".jpeg")
+REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                        (2, cv2.IMREAD_REDUCED_COLOR_2))
+MIN_ZOOM_LEVEL_SIDE = 512
+FAST_INTERPOLATION = cv2.INTER_NEAREST
+
+
+def idle_interpolation(scale):
+    """Best filter for a settled view: area averaging when shrinking, Lanczos when enlarging."""
+    return cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LANCZOS4
+
+
+class ImageSession:
+    """Owns the decoded pixels of one image. ``image`` is a read-only BGR array, or None if decoding failed."""
+
+    def __init__(self, path, image=None, opened_at=None):
+        self.path = path
+        self.opened_at = time.perf_counter() if opened_at is None else opened_at
+        self.first_paint_ms = None
+        self.full_ready = threading.Event()
+        self.full_ready.set()
+        self.image = self.decode(path) if image is None else image
+        if self.image is not None:
+            self.image.setflags(write=False)
+        self.tracked = {}
+        self.zoom_levels = []
+        self.zoom_lock = threading.Lock()
+        _live_sessions.add(self)
+
+    def decode(self, path):
+        return cv2.imread(path)
+
+    @property
+    def loaded(self):
+        return self.image is not None
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    # ---------------- resolution levels ----------------
+    # Level 0 is the image; each further level halves it, down to
+    # MIN_ZOOM_LEVEL_SIDE. A plain session builds those levels in memory the
+    # first time they are read; tiled and progressive sessions have their own
+    # and override level_count, level_shape and read_level.
+    def level_count(self):
+        h, w = self.image.shape[:2]
+        count = 1
+        while max(h, w) > MIN_ZOOM_LEVEL_SIDE:
+            h, w = (h + 1) // 2, (w + 1) // 2
+            count += 1
+        return count
+
+    def level_shape(self, level):
+        h, w = self.image.shape[:2]
+        for _ in range(level):
+            h, w = (h + 1) // 2, (w + 1) // 2
+        return (h, w) + self.image.shape[2:]
+
+    def _zoom_level(self, level):
+        with self.zoom_lock:
+            while len(self.zoom_levels) < level:
+                source = self.zoom_levels[-1] if self.zoom_levels else self.image
+                h, w = self.level_shape(len(self.zoom_levels) + 1)[:2]
+                smaller = cv2.resize(source, (w, h), interpolation=cv2.INTER_AREA)
+                smaller.setflags(write=False)
+                self.zoom_levels.append(smaller)
+            return self.zoom_levels[level - 1]
+
+    def read_level(self, level, x1, y1, x2, y2):
+        if level == 0:
+            return self.image[y1:y2, x1:x2]
+        return self._zoom_level(level)[y1:y2, x1:x2]
+
+    def level_for_scale(self, scale):
+        """Coarsest level that still has at least as many pixels as the screen shows."""
+        full_h, full_w = self.shape[:2]
+        for level in range(self.level_count() - 1, 0, -1):
+            h, w = self.level_shape(level)[:2]
+            if w >= full_w * scale and h >= full_h * scale:
+                return level
+        return 0
+
+    def level_for_side(self, max_side):
+        """Whole smallest level whose longest side is still >= max_side (for analysis at reduced size)."""
+        for level in range(self.level_count() - 1, -1, -1):
+            h, w = self.level_shape(level)[:2]
+            if max(h, w) >= max_side or level == 0:
+                return self.read_level(level, 0, 0, w, h)
+
+    def region(self, x1, y1, x2, y2):
+        """Full-resolution pixels of a rectangle, clipped to the image (read-only)."""
+        h, w = self.shape[:2]
+        return self.read_level(0, max(0, x1), max(0, y1), min(w, x2), min(h, y2))
+
+    def render_view(self, origin_x, origin_y, view_x, view_y, view_w, view_h, scale,
+                    interpolation=cv2.INTER_LINEAR):
+        """Render only the part of the image inside a viewport.
+
+        (origin_x, origin_y) is where image pixel (0, 0) lands on the canvas and
+        (view_x, view_y, view_w, view_h) the visible canvas rectangle. Returns
+        (pixels, canvas_x, canvas_y, (x1, y1, x2, y2)) with the full-resolution
+        rectangle the pixels cover, or None if nothing is visible.
+        """
+        full_h, full_w = self.shape[:2]
+        x1 = max(0, int((view_x - origin_x) / scale))
+        y1 = max(0, int((view_y - origin_y) / scale))
+        x2 = min(full_w, int(math.ceil((view_x + view_w - origin_x) / scale)))
+        y2 = min(full_h, int(math.ceil((view_y + view_h - origin_y) / scale)))
+        if x2 <= x1 or y2 <= y1:
+            return None
+        level = self.level_for_scale(scale)
+        level_h, level_w = self.level_shape(level)[:2]
+        fx, fy = full_w / level_w, full_h / level_h
+        lx1, ly1 = int(x1 / fx), int(y1 / fy)
+        lx2 = max(lx1 + 1, min(level_w, int(math.ceil(x2 / fx))))
+        ly2 = max(ly1 + 1, min(level_h, int(math.ceil(y2 / fy))))
+        pixels = self.read_level(level, lx1, ly1, lx2, ly2)
+        # the level pixels cover this full-resolution rectangle
+        x1, y1 = int(round(lx1 * fx)), int(round(ly1 * fy))
+        x2, y2 = min(full_w, int(round(lx2 * fx))), min(full_h, int(round(ly2 * fy)))
+        size = (max(1, int(round((x2 - x1) * scale))), max(1, int(round((y2 - y1) * scale))))
+        pixels = cv2.resize(pixels, size, interpolation=interpolation)
+        return pixels, int(round(origin_x + x1 * scale)), int(round(origin_y + y1 * scale)), (x1, y1, x2, y2)
+
+    def scaled(self, scale, interpolation=cv2.INTER_LINEAR):
+        """New writable array at the given zoom; overlays are drawn on this, never on the source."""
+        if scale == 1.0:
+            return self.image.copy()
+        level = self.level_for_scale(scale)
+        h, w = self.level_shape(level)[:2]
+        pixels = self.read_level(level, 0, 0, w, h)
+        h, w = self.image.shape[:2]
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        return cv2.resize(pixels, size, interpolation=interpolation)
+
+    def image_bytes(self):
+        if self.image is None:
+            return 0
+        return self.image.nbytes + sum(level.nbytes for level in self.zoom_levels)
+
+    def track(self, name, buffer):
+        """Count buffer (an array, or anything with ``nbytes``) against this session. Returns it."""
+        self.tracked[name] = buffer
+        return buffer
+
+    def memory(self):
+        """{name: bytes} for the image and every tracked buffer."""
+        usage = {"image": self.image_bytes()}
+        for name, buffer in self.tracked.items():
+            usage[name] = int(getattr(buffer, "nbytes", 0))
+        return usage
+
+    def loading_note(self):
+        """Suffix for a viewer's title describing how the pixels on screen were obtained."""
+        return ""
+
+    def mark_first_paint(self):
+        """Record time from open to the first frame on screen (only the first call counts). Returns ms."""
+        if self.first_paint_ms is None:
+            self.first_paint_ms = (time.perf_counter() - self.opened_at) * 1000
+        return self.first_paint_ms
+
+    def describe(self):
+        usage = self.memory()
+        parts = ", ".join(f"{name} {n / 1048576:.1f} MB" for name, n in usage.items())
+        return f"{sum(usage.values()) / 1048576:.1f} MB ({parts})"
+
+
+class ProgressiveSession(ImageSession):
+    """Reduced decode first, full resolution from a background thread.
+
+    Level 1 is the preview and level 0 full resolution. Until the full decode
+    lands, renders use the preview (upscaled if the user zooms past it);
+    ``full_ready`` is set once it has, and anything that needs exact pixels
+    (``region``, level 0 reads) waits for it.
+    """
+
+    def __init__(self, path, preview, factor, full_size, opened_at=None):
+        self.preview = preview
+        self.preview.setflags(write=False)
+        self.factor = factor
+        self.full_shape = (full_size[1], full_size[0], 3)
+        self.full = None
+        self.failed = False
+        super().__init__(path, image=preview, opened_at=opened_at)
+        self.full_ready.clear()
+        threading.Thread(target=self._decode_full, daemon=True).start()
+
+    def _decode_full(self):
+        full = cv2.imread(self.path)
+        if full is None:
+            # readable at reduced size only (e.g. a truncated file): say so, then serve the preview scaled up
+            print(f"Full-resolution decode failed for {self.path}; showing the 1/{self.factor} preview")
+            self.failed = True
+            h, w = self.full_shape[:2]
+            full = cv2.resize(self.preview, (w, h), interpolation=cv2.INTER_LINEAR)
+        elif full.shape[:2] != self.full_shape[:2]:
+            # the file changed since the preview was read; the decoded image is the truth
+            print(f"{self.path}: expected {self.full_shape[1]}x{self.full_shape[0]}, "
+                  f"decoded {full.shape[1]}x{full.shape[0]}")
+            self.full_shape = full.shape
+        full.setflags(write=False)
+        self.full = self.image = full
+        self.full_ready.set()
+
+    @property
+    def shape(self):
+        return self.full_shape
+
+    def level_count(self):
+        return 2
+
+    def level_shape(self, level):
+        return self.full_shape if level == 0 else self.preview.shape
+
+    def read_level(self, level, x1, y1, x2, y2):
+        if level == 1:
+            return self.preview[y1:y2, x1:x2]
+        self.full_ready.wait()
+        return self.full[y1:y2, x1:x2]
+
+    def level_for_scale(self, scale):
+        if not self.full_ready.is_set():
+            return 1
+        return super().level_for_scale(scale)
+
+    def scaled(self, scale, interpolation=cv2.INTER_LINEAR):
+        level = self.level_for_scale(scale)
+        h, w = self.level_shape(level)[:2]
+        pixels = self.read_level(level, 0, 0, w, h)
+        size = (max(1, int(round(self.full_shape[1] * scale))), max(1, int(round(self.full_shape[0] * scale))))
+        return cv2.resize(pixels, size, interpolation=interpolation)
+
+    def image_bytes(self):
+        return self.preview.nbytes + (self.full.nbytes if self.full is not None else 0)
+
+    def loading_note(self):
+        return f", preview 1/{self.factor}" + (", full decode failed" if self.failed else "")
+
+
+def fit_scale(image_size, view_size):
+    """Zoom that fits an image of (w, h) into a view of (w, h), never enlarging."""
+    (w, h), (view_w, view_h) = image_size, view_size
+    return min(1.0, view_w / w, view_h / h)
+
+
+def preview_factor(size, fit):
+    """Largest DCT reduction whose result still has as many pixels as the fitted view shows, or None."""
+    if size is None or fit is None:
+        return None
+    scale = fit_scale(size, fit)
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if factor * scale <= 1.0:
+            return factor, flag
+    return None
+
+
+def preview_size(size, preview, factor):
+    """Full (w, h) that a reduced decode agrees with: the header size, swapped if the decoder applied a
+    rotation the header did not show. None if the preview is missing or matches neither."""
+    if preview is None:
+        return None
+    reduced = (preview.shape[1], preview.shape[0])
+    for w, h in (size, size[::-1]):
+        if (-(-w // factor), -(-h // factor)) == reduced:
+            return w, h
+    return None
+
+
+def open_session(path, fit=None):
+    """Open path the cheapest way that still shows it correctly.
+
+    Images too large to decode whole get a tiled session. With ``fit`` (the
+    view's (w, h)), a JPEG bigger than the view gets a progressive session
+    that paints from a reduced decode first. Everything else is an
+    ImageSession.
+    """
+    from tiled_image import open_tiled, needs_tiling
+    opened_at = time.perf_counter()
+    if needs_tiling(path):
+        session = open_tiled(path)
+        if session is not None:
+            session.opened_at = opened_at
+            return session
+    if path.lower().endswith(PREVIEW_EXTS):
+        size = read_image_size(path)
+        reduction = preview_factor(size, fit)
+        if reduction is not None:
+            preview = cv2.imread(path, reduction[1])
+            size = preview_size(size, preview, reduction[0])
+            if size is not None:
+                return ProgressiveSession(path, preview, reduction[0], size, opened_at=opened_at)
+    return ImageSession(path, opened_at=opened_at)
+
+
+def total_memory():
+    """Bytes held by all live sessions."""
+    return sum(sum(s.memory().values()) for s in list(_live_sessions))
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1048576 if sys.platform == "darwin" else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and render one image through a session and report memory")
+    parser.add_argument("image")
+    parser.add_argument("--scale", type=float, default=0.25)
+    args = parser.parse_args()
+
+    session = open_session(args.image)
+    session.full_ready.wait()
+    if not session.loaded:
+        sys.exit(f"Cannot open image: {args.image}")
+    session.track("mask", np.zeros(session.shape[:2], dtype=np.uint8))
+    rendered = session.render_view(0, 0, 0, 0, 1920, 1080, args.scale)[0]
+    print(f"{args.image}: {session.shape[1]}x{session.shape[0]} ({type(session).__name__})")
+    print(f"  session: {session.describe()}")
+    print(f"  1920x1080 view at {args.scale}: {rendered.nbytes / 1048576:.1f} MB")
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"  peak RSS: {rss:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""Record labeling sessions as input traces and replay them without a display.
+
+Set ``LABELER_TRACE`` to a file path before starting a labeler and every
+canvas event (press, drag, release, wheel, pan, window resize) plus every
+action that is not a canvas event (image changes, class and mode choices,
+delete, undo/redo, save) is appended to it as one JSON object per line. The
+first line records which labeler it was and its folder; image events carry
+the view size the image was fitted to.
+
+Replay feeds the events to the same pointer handlers the labelers call
+(``label_core``), back to back, rendering a frame after each one, and
+reports per-event latency percentiles and peak memory. Labels and masks
+saved during replay go to a scratch folder, so the project is never
+modified.
+
+Usage::
+
+    LABELER_TRACE=session.trace python login_page.py         # record
+    python input_trace.py session.trace [--folder PROJECT] [--out result.json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from image_session import FAST_INTERPOLATION, fit_scale, idle_interpolation, open_session, peak_rss_mb
+from annotation_store import AnnotationStore, has_store, store_path
+from label_core import BoxAnnotator, BoxArray, MaskAnnotator, read_classes_file
+from mask_tiles import TiledMaskStore, has_tiles, load_mask, tiles_path
+from prelabel import PROPOSALS_FOLDER
+
+TRACE_ENV = "LABELER_TRACE"
+TRACE_VERSION = 1
+FLUSH_EVERY = 50
+LABELS_FOLDER = "Box_labels"
+
+BOX_BINDINGS = {
+    "<ButtonPress-1>": "press", "<B1-Motion>": "drag", "<ButtonRelease-1>": "release",
+    "<ButtonPress-3>": "right", "<MouseWheel>": "wheel",
+    "<ButtonPress-2>": "pan_start", "<B2-Motion>": "pan",
+}
+MASK_BINDINGS = {
+    "<ButtonPress-1>": "press", "<B1-Motion>": "drag", "<ButtonRelease-1>": "release",
+    "<Double-Button-1>": "double", "<MouseWheel>": "wheel",
+    "<ButtonPress-3>": "pan_start", "<B3-Motion>": "pan",
+}
+# events that move the view or a shape under the pointer; rendered with the fast filter
+INTERACTIVE = {"drag", "wheel", "pan"}
+# events after which the labelers do not redraw
+NO_REDRAW = {"pan_start", "resize"}
+
+
+# ---------------- recording ----------------
+class TraceRecorder:
+    """Appends events to a trace file. With no path every call is a no-op, so callers need no checks."""
+
+    def __init__(self, path=None, labeler=None, folder=None, canvas=None):
+        self.file = None
+        if path is None:
+            return
+        self.file = open(path, "w", encoding="utf-8")
+        self.started = time.perf_counter()
+        self.unflushed = 0
+        self._write({"trace": TRACE_VERSION, "labeler": labeler, "folder": os.path.abspath(folder),
+                     "created": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        bindings = BOX_BINDINGS if labeler == "box" else MASK_BINDINGS
+        for sequence, kind in bindings.items():
+            # add="+" keeps the labeler's own handler; this one runs after it
+            canvas.bind(sequence, lambda e, kind=kind: self.record(kind, x=e.x, y=e.y, delta=e.delta), add="+")
+        canvas.bind("<Configure>", lambda e: self.record("resize", w=e.width, h=e.height), add="+")
+        canvas.bind("<Destroy>", lambda e: self.close() if e.widget is canvas else None, add="+")
+
+    def record(self, kind, **fields):
+        if self.file is None:
+            return
+        self._write(dict(t=round(time.perf_counter() - self.started, 4), e=kind, **fields))
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.unflushed += 1
+        if self.unflushed >= FLUSH_EVERY:
+            self.file.flush()
+            self.unflushed = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def open_trace(labeler, folder, canvas):
+    """Recorder for the path in LABELER_TRACE, or a disabled one if it is not set."""
+    path = os.environ.get(TRACE_ENV)
+    return TraceRecorder(path, labeler, folder, canvas) if path else TraceRecorder()
+
+
+def read_trace(path):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("trace") != TRACE_VERSION:
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} input trace")
+    return lines[0], lines[1:]
+
+
+# ---------------- replay ----------------
+class BoxReplay:
+    """Applies recorded events to a BoxAnnotator the way BoundingBoxLabeler's handlers do."""
+
+    def __init__(self, folder, scratch):
+        self.annotator = BoxAnnotator()
+        self.folder = folder
+        self.scratch = scratch
+        self.canvas = None
+        self.stem = None
+        self.pan_start = None
+        self.store = AnnotationStore(store_path(folder)) if has_store(folder) else None
+
+    def prepare(self, ev):
+        return ev
+
+    def render(self, interactive):
+        a = self.annotator
+        if a.session is not None:
+            a.render(0, 0, self.canvas[0], self.canvas[1],
+                     FAST_INTERPOLATION if interactive else idle_interpolation(a.scale))
+
+    def save(self):
+        text, _ = self.annotator.format_labels()
+        with open(os.path.join(self.scratch, f"{self.stem}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def load(self, name, view):
+        a = self.annotator
+        a.class_names, a.class_colors = read_classes_file(os.path.join(self.folder, "classes.txt"))
+        self.canvas = view
+        session = open_session(os.path.join(self.folder, "images", name), fit=tuple(self.canvas))
+        if not session.loaded:
+            return False
+        a.session, a.bboxes, a.selected_box, a.showing_proposals = session, BoxArray(), None, False
+        a.scale, a.offset_x, a.offset_y = fit_scale(session.shape[1::-1], self.canvas), 0, 0
+        self.stem = os.path.splitext(name)[0]
+        text = self.store.get(self.stem) if self.store is not None else self.read_text(LABELS_FOLDER)
+        if text is None:
+            text = self.read_text(PROPOSALS_FOLDER)
+            a.showing_proposals = text is not None
+        if text is not None:
+            a.parse_labels(text)
+        return True
+
+    def read_text(self, sub):
+        path = os.path.join(self.folder, sub, f"{self.stem}.txt")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def apply(self, ev):
+        a, kind = self.annotator, ev["e"]
+        if kind == "image":
+            return self.load(ev["name"], ev["view"])
+        if kind == "resize":
+            self.canvas = [ev["w"], ev["h"]]
+            return True
+        if a.session is None:
+            return False
+        if kind == "class":
+            a.current_class = ev["name"]
+            # choosing a class while a box is selected relabels it, as in on_class_selected
+            if a.selected_box is not None:
+                a.set_box_class(a.selected_box, ev["name"])
+                self.save()
+        elif kind == "press":
+            a.pointer_press(ev["x"], ev["y"])
+        elif kind == "drag":
+            return a.pointer_drag(ev["x"], ev["y"])
+        elif kind == "release":
+            if a.pointer_release(ev["x"], ev["y"]):
+                self.save()
+        elif kind == "right":
+            a.select_at(ev["x"], ev["y"])
+        elif kind == "wheel":
+            a.zoom_at(ev["x"], ev["y"], ev["delta"] > 0)
+        elif kind == "pan_start":
+            self.pan_start = (ev["x"], ev["y"])
+        elif kind == "pan" and self.pan_start is not None:
+            a.pan_by(ev["x"] - self.pan_start[0], ev["y"] - self.pan_start[1])
+            self.pan_start = (ev["x"], ev["y"])
+        elif kind == "box_class" and a.selected_box is not None:
+            a.set_box_class(a.selected_box, ev["name"])
+            self.save()
+        elif kind == "delete":
+            if a.delete_selected():
+                self.save()
+        elif kind == "save":
+            self.save()
+        else:
+            return False
+        return True
+
+
+class MaskReplay:
+    """Applies recorded events to a MaskAnnotator the way SegmentationLabeler's handlers do."""
+
+    def __init__(self, folder, scratch):
+        self.annotator = MaskAnnotator()
+        self.folder = folder
+        self.scratch = scratch
+        self.canvas = None
+        self.stem = None
+        self.pan_start = None
+        self.superpixels = None
+
+    def render(self, interactive):
+        a = self.annotator
+        if a.session is not None:
+            a.render(self.canvas[0], self.canvas[1],
+                     FAST_INTERPOLATION if interactive else idle_interpolation(a.scale))
+
+    def load(self, name, view):
+        a = self.annotator
+        self.canvas = view
+        session = open_session(os.path.join(self.folder, name), fit=tuple(self.canvas))
+        if not session.loaded:
+            return False
+        a.session = session
+        self.stem = os.path.splitext(name)[0]
+        mask_folder = os.path.join(self.folder, "Segment_labels")
+        a.set_mask(load_mask(mask_folder, self.stem, session.shape), has_tiles(mask_folder, self.stem))
+        a.scale, a.offset_x, a.offset_y = fit_scale(session.shape[1::-1], self.canvas), 0, 0
+        self.superpixels = None
+        return True
+
+    def prepare(self, ev):
+        """Attach the superpixel index to clicks that need one. The labeler computes it in the
+        background before the user can click, so it is built here, outside the timed part."""
+        a = self.annotator
+        if ev["e"] not in ("press", "release", "double") or a.session is None \
+                or a.drawing_mode not in ("sp_click", "sp_rect"):
+            return ev
+        if self.superpixels is None:
+            from superpixels import MAX_SIDE, SuperpixelIndex, compute_superpixels
+            self.superpixels = SuperpixelIndex(compute_superpixels(a.session.level_for_side(MAX_SIDE)), a.session.shape)
+        return dict(ev, index=self.superpixels)
+
+    def apply(self, ev):
+        a, kind = self.annotator, ev["e"]
+        if kind == "image":
+            return self.load(ev["name"], ev["view"])
+        if kind == "resize":
+            self.canvas = [ev["w"], ev["h"]]
+            return True
+        if kind == "add_class":
+            a.class_colors[ev["name"]] = tuple(ev["color"])
+            a.current_class = ev["name"]
+            return True
+        if a.session is None:
+            return False
+        if kind == "class":
+            a.current_class = ev["name"]
+        elif kind == "mode":
+            a.drawing_mode = ev["name"]
+            a.polygon_points.clear()
+        elif kind == "press":
+            if not a.can_paint():
+                return False
+            a.pointer_press(ev["x"], ev["y"], ev.get("index"))
+        elif kind == "drag":
+            a.pointer_drag(ev["x"], ev["y"])
+        elif kind in ("release", "double"):
+            a.pointer_release(ev["x"], ev["y"], ev.get("index"))
+        elif kind == "wheel":
+            a.zoom_about(self.canvas[0] // 2, self.canvas[1] // 2, ev["delta"] > 0)
+        elif kind == "pan_start":
+            self.pan_start = (ev["x"], ev["y"])
+        elif kind == "pan" and self.pan_start is not None:
+            a.pan_by(ev["x"] - self.pan_start[0], ev["y"] - self.pan_start[1])
+            self.pan_start = (ev["x"], ev["y"])
+        elif kind == "undo":
+            a.undo_step()
+        elif kind == "redo":
+            a.redo_step()
+        elif kind == "save":
+            TiledMaskStore(tiles_path(self.scratch, self.stem)).write(a.display_mask.shape, a.tiles_to_save())
+        else:
+            return False
+        return True
+
+
+def replay(trace_path, folder=None):
+    """Replay a trace as fast as possible: latency stats per event kind, plus totals and memory."""
+    header, events = read_trace(trace_path)
+    folder = folder or header["folder"]
+    scratch = tempfile.mkdtemp(prefix="trace_replay_")
+    player = (BoxReplay if header["labeler"] == "box" else MaskReplay)(folder, scratch)
+    latencies = {}
+    try:
+        for ev in events:
+            ev = player.prepare(ev)
+            start = time.perf_counter()
+            if player.apply(ev):
+                if ev["e"] not in NO_REDRAW:
+                    player.render(ev["e"] in INTERACTIVE)
+                latencies.setdefault(ev["e"], []).append((time.perf_counter() - start) * 1000)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    stats = {}
+    for kind, samples in sorted(latencies.items()):
+        samples = np.asarray(samples)
+        stats[kind] = {"count": len(samples), "p50": round(float(np.percentile(samples, 50)), 3),
+                       "p95": round(float(np.percentile(samples, 95)), 3),
+                       "p99": round(float(np.percentile(samples, 99)), 3), "max": round(float(samples.max()), 3)}
+    session = player.annotator.session
+    return {
+        "trace": os.path.abspath(trace_path),
+        "labeler": header["labeler"],
+        "events": stats,
+        "total_ms": round(sum(sum(v) for v in latencies.values()), 1),
+        "session_mb": round(sum(session.memory().values()) / 1048576, 2) if session is not None else 0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded labeling session and report event latency")
+    parser.add_argument("trace")
+    parser.add_argument("--folder", help="project folder to replay against (default: the one recorded)")
+    parser.add_argument("--out", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        result = replay(args.trace, args.folder)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Cannot replay {args.trace}: {e}")
+    print(f"{result['trace']} ({result['labeler']} labeler)")
+    print(f"{'event':<10} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, s in result["events"].items():
+        print(f"{kind:<10} {s['count']:>6} {s['p50']:>8} {s['p95']:>8} {s['p99']:>8} {s['max']:>8}")
+    print(f"total {result['total_ms']} ms, session {result['session_mb']} MB, peak RSS {result['peak_rss_mb']:.0f} MB")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
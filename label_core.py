@@ -0,0 +1,567 @@
+"""Tk-free annotation state and rendering for the two labelers.
+
+``BoxAnnotator`` and ``MaskAnnotator`` hold everything the labelers edit and
+draw: the open image session, boxes or mask, selection and drag state, and
+the zoom/pan transform. They turn image coordinates into edits and render
+the visible part of the view into a BGR array. ``BoundingBoxLabeler`` and
+``SegmentationLabeler`` inherit from them and add only the widgets, dialogs
+and file side effects, so the same code can be driven and timed without a
+display (see benchmark.py).
+"""
+
+import io
+import os
+
+import cv2
+import numpy as np
+
+from mask_tiles import TileHistory, tile_slice, tiles_in_rect
+from perf_hud import PerfStats
+
+
+def draw_dashed_rect(image, p1, p2, color, dash=6):
+    """Dashed rectangle outline (cv2 has no dashed line type); used for unconfirmed proposals."""
+    (x1, y1), (x2, y2) = p1, p2
+    h, w = image.shape[:2]
+    step = dash * 2
+    # start at the first dash inside the image so zoomed-in boxes don't loop over off-screen dashes
+    start_x = x1 + max(0, -x1) // step * step
+    start_y = y1 + max(0, -y1) // step * step
+    for x in range(start_x, min(x2, w), step):
+        cv2.line(image, (x, y1), (min(x + dash, x2), y1), color, 1)
+        cv2.line(image, (x, y2), (min(x + dash, x2), y2), color, 1)
+    for y in range(start_y, min(y2, h), step):
+        cv2.line(image, (x1, y), (x1, min(y + dash, y2)), color, 1)
+        cv2.line(image, (x2, y), (x2, min(y + dash, y2)), color, 1)
+
+
+def read_classes_file(path):
+    """(names in index order, {name: (r, g, b)}) from a classes.txt of ``idx name r g b`` lines."""
+    names, colors = [], {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split()
+                if len(parts) >= 5:
+                    # index is ignored; the order in the file is the class index
+                    name = " ".join(parts[1:-3])
+                    names.append(name)
+                    colors[name] = tuple(map(int, parts[-3:]))
+    return names, colors
+
+
+def write_classes_file(path, names, colors):
+    with open(path, "w", encoding="utf-8") as f:
+        for idx, name in enumerate(names):
+            r, g, b = colors.get(name, (0, 255, 0))
+            f.write(f"{idx} {name} {r} {g} {b}\n")
+
+
+def read_yolo_rows(text, columns=5):
+    """Lines of YOLO label text with exactly ``columns`` numbers, as an N x columns float array."""
+    if not text.strip():
+        return np.zeros((0, columns))
+    try:
+        rows = np.loadtxt(io.StringIO(text), ndmin=2)
+    except ValueError:
+        # ragged or malformed lines: keep only the well-formed ones, like the line-by-line parser did
+        lines = [line for line in text.splitlines() if len(line.split()) == columns]
+        rows = np.loadtxt(io.StringIO("\n".join(lines)), ndmin=2) if lines else np.zeros((0, columns))
+    return rows if rows.shape[1] == columns else np.zeros((0, columns))
+
+
+class BoxArray:
+    """Boxes as columns: class indices (int32, N) and x1, y1, x2, y2 in image pixels (int32, N x 4).
+
+    Indexing gives and takes (class index, x1, y1, x2, y2) tuples, so single-box
+    edits read like list code; loading, saving, hit testing and drawing work
+    on the whole columns at once.
+    """
+
+    def __init__(self, cls=None, xyxy=None):
+        self.cls = np.zeros(0, np.int32) if cls is None else np.asarray(cls, np.int32).reshape(-1)
+        self.xyxy = np.zeros((0, 4), np.int32) if xyxy is None else np.asarray(xyxy, np.int32).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.cls)
+
+    def __getitem__(self, i):
+        return (int(self.cls[i]), *self.xyxy[i].tolist())
+
+    def __setitem__(self, i, box):
+        self.cls[i] = box[0]
+        self.xyxy[i] = box[1:]
+
+    def __delitem__(self, i):
+        self.cls = np.delete(self.cls, i)
+        self.xyxy = np.delete(self.xyxy, i, axis=0)
+
+    def __iter__(self):
+        for c, xyxy in zip(self.cls.tolist(), self.xyxy.tolist()):
+            yield (c, *xyxy)
+
+    def append(self, box):
+        self.cls = np.append(self.cls, np.int32(box[0]))
+        self.xyxy = np.vstack([self.xyxy, np.asarray(box[1:], np.int32)])
+
+    def hit(self, ix, iy, th=1):
+        """Index of the topmost (last) box that contains the point or has a corner within th, else None."""
+        x1, y1, x2, y2 = self.xyxy.T
+        near_corner = (((abs(ix - x1) <= th) | (abs(ix - x2) <= th))
+                       & ((abs(iy - y1) <= th) | (abs(iy - y2) <= th)))
+        inside = (x1 <= ix) & (ix <= x2) & (y1 <= iy) & (iy <= y2)
+        hits = np.flatnonzero(near_corner | inside)
+        return int(hits[-1]) if len(hits) else None
+
+
+class BoxAnnotator:
+    """Boxes of one image (a BoxArray indexing class_names), plus edit and view state."""
+
+    def __init__(self):
+        self.class_names = []              # list of class names in order -> index
+        self.class_colors = {}             # class_name -> (r,g,b)
+        self.current_class = None
+        self.session = None
+        self.bboxes = BoxArray()
+        self.showing_proposals = False     # current boxes came from the model and are unconfirmed
+        self.classes_added = False         # a box got a class missing from classes.txt
+
+        # selection / interaction state
+        self.selected_box = None
+        self.drawing = False
+        self.dragging = False
+        self.resizing = False
+        self.resize_corner = None  # 'tl','tr','bl','br'
+        self.start_x_image = self.start_y_image = None
+        self.end_x_image = self.end_y_image = None
+        self.prev_mouse_x = self.prev_mouse_y = None
+
+        # view transform (image -> canvas)
+        self.scale = 1.0
+        self.offset_x = 0
+        self.offset_y = 0
+        self.perf = PerfStats()            # stage timings, off unless a viewer turns them on
+
+    # ---------------- label text ----------------
+    def parse_labels(self, text):
+        """Replace the boxes with those in YOLO label text. Unknown class indices get placeholder names."""
+        h, w = self.session.shape[:2]
+        rows = read_yolo_rows(text)
+        cls = rows[:, 0].astype(np.int32)
+        cx, cy, bw, bh = rows[:, 1:].T
+        # truncate toward zero, as int() did
+        xyxy = np.trunc(np.column_stack([(cx - bw/2) * w, (cy - bh/2) * h, (cx + bw/2) * w, (cy + bh/2) * h]))
+        # pad class_names with placeholders up to the highest index, so indices survive a save
+        for idx in range(len(self.class_names), int(cls.max(initial=-1)) + 1):
+            self.class_names.append(f"class_{idx}")
+            self.class_colors.setdefault(f"class_{idx}", (0,255,0))
+        for idx in np.unique(cls[cls < 0]).tolist():
+            cls[cls == idx] = self.class_index(f"class_{idx}")
+        self.classes_added = False  # placeholders are not written to classes.txt
+        self.bboxes = BoxArray(cls, xyxy)
+
+    def format_labels(self):
+        """(YOLO label text for the boxes, True if a class had to be added to class_names)."""
+        added, self.classes_added = self.classes_added, False
+        h, w = self.session.shape[:2]
+        # clamp, drop boxes that collapse to nothing, then normalize
+        x = np.clip(self.bboxes.xyxy[:, 0::2], 0, w - 1)
+        y = np.clip(self.bboxes.xyxy[:, 1::2], 0, h - 1)
+        keep = (x[:, 1] > x[:, 0]) & (y[:, 1] > y[:, 0])
+        x, y = x[keep], y[keep]
+        rows = np.column_stack([self.bboxes.cls[keep], (x[:, 0] + x[:, 1]) / 2 / w, (y[:, 0] + y[:, 1]) / 2 / h,
+                                (x[:, 1] - x[:, 0]) / w, (y[:, 1] - y[:, 0]) / h])
+        # one formatting call for the whole file
+        return ("%d %.6f %.6f %.6f %.6f\n" * len(rows)) % tuple(rows.ravel().tolist()), added
+
+    def class_index(self, name):
+        """Index of a class name, appending it to class_names (and flagging the addition) if missing."""
+        if name not in self.class_names:
+            self.class_names.append(name)
+            self.class_colors.setdefault(name, (0, 255, 0))
+            self.classes_added = True
+        return self.class_names.index(name)
+
+    def box_class_name(self, i):
+        return self.class_names[self.bboxes.cls[i]]
+
+    def set_box_class(self, i, name):
+        self.bboxes.cls[i] = self.class_index(name)
+
+    # ---------------- coordinate transforms ----------------
+    def canvas_to_image(self, cx, cy):
+        """Canvas coords -> image pixel coords (ints), clamped to the image."""
+        ix = int(round((cx - self.offset_x) / self.scale))
+        iy = int(round((cy - self.offset_y) / self.scale))
+        if self.session is not None:
+            H,W = self.session.shape[:2]
+            ix = max(0, min(W-1, ix))
+            iy = max(0, min(H-1, iy))
+        return ix, iy
+
+    def image_to_canvas(self, ix, iy):
+        """Image pixel -> canvas coords (ints)."""
+        cx = int(ix * self.scale + self.offset_x)
+        cy = int(iy * self.scale + self.offset_y)
+        return cx, cy
+
+    # ---------------- hit testing ----------------
+    def find_box_at(self, ix, iy):
+        """Return topmost box index containing point (image coords) or (None, corner) if near corner."""
+        # the topmost (last drawn) box wins
+        i = self.bboxes.hit(ix, iy, th=1)
+        if i is None:
+            return None, None
+        return i, self.get_near_corner(ix, iy, *self.bboxes[i][1:], th=1)
+
+    def get_near_corner(self, x, y, x1,y1,x2,y2, th=1):
+        """Return corner name if (x,y) near any corner (in image pixels)"""
+        corners = {"tl":(x1,y1), "tr":(x2,y1), "bl":(x1,y2), "br":(x2,y2)}
+        for name,(cx,cy) in corners.items():
+            if abs(x-cx) <= th and abs(y-cy) <= th:
+                return name
+        return None
+
+    # ---------------- pointer handlers (canvas coordinates) ----------------
+    def pointer_press(self, cx, cy):
+        """Left press: grab the box under the pointer, or start drawing one.
+
+        Returns False if there is nothing to draw with (no classes at all).
+        """
+        ix, iy = self.canvas_to_image(cx, cy)
+        if self.grab_box(ix, iy):
+            return True
+        if not self.current_class:
+            if not self.class_names:
+                return False
+            # if no explicit selection, pick first class
+            self.current_class = self.class_names[0]
+        self.start_box(ix, iy)
+        return True
+
+    def pointer_drag(self, cx, cy):
+        return self.drag_to(*self.canvas_to_image(cx, cy))
+
+    def pointer_release(self, cx, cy):
+        return self.finish_edit(*self.canvas_to_image(cx, cy))
+
+    def select_at(self, cx, cy):
+        """Select the box under the pointer (or clear the selection). Returns True if a box was hit."""
+        self.selected_box, _ = self.find_box_at(*self.canvas_to_image(cx, cy))
+        return self.selected_box is not None
+
+    # ---------------- editing ----------------
+    def grab_box(self, ix, iy):
+        """Select the box under the point and start moving it (or resizing, at a corner). False if none."""
+        idx, corner = self.find_box_at(ix, iy)
+        if idx is None:
+            return False
+        self.selected_box = idx
+        if corner:
+            self.resizing = True
+            self.resize_corner = corner
+        else:
+            self.dragging = True
+        self.prev_mouse_x, self.prev_mouse_y = ix, iy
+        return True
+
+    def start_box(self, ix, iy):
+        self.drawing = True
+        self.start_x_image, self.start_y_image = ix, iy
+        self.end_x_image, self.end_y_image = ix, iy
+        self.selected_box = None
+
+    def drag_to(self, ix, iy):
+        """Continue the current draw, move or resize. Returns True if anything changed."""
+        if self.drawing:
+            self.end_x_image, self.end_y_image = ix, iy
+            return True
+        H, W = self.session.shape[:2]
+        if self.dragging and self.selected_box is not None and self.prev_mouse_x is not None:
+            dx = ix - self.prev_mouse_x
+            dy = iy - self.prev_mouse_y
+            cls, x1,y1,x2,y2 = self.bboxes[self.selected_box]
+            nx1, ny1, nx2, ny2 = x1+dx, y1+dy, x2+dx, y2+dy
+            nx1, ny1 = max(0,int(nx1)), max(0,int(ny1))
+            nx2, ny2 = min(W-1,int(nx2)), min(H-1,int(ny2))
+            self.bboxes[self.selected_box] = (cls, nx1, ny1, nx2, ny2)
+            self.prev_mouse_x, self.prev_mouse_y = ix, iy
+            return True
+        if self.resizing and self.selected_box is not None:
+            cls, sx1, sy1, sx2, sy2 = self.bboxes[self.selected_box]
+            if self.resize_corner == "tl":
+                nx1, ny1, nx2, ny2 = ix, iy, sx2, sy2
+            elif self.resize_corner == "tr":
+                nx1, ny1, nx2, ny2 = sx1, iy, ix, sy2
+            elif self.resize_corner == "bl":
+                nx1, ny1, nx2, ny2 = ix, sy1, sx2, iy
+            else:  # br
+                nx1, ny1, nx2, ny2 = sx1, sy1, ix, iy
+            # normalize
+            nx1, nx2 = min(nx1,nx2), max(nx1,nx2)
+            ny1, ny2 = min(ny1,ny2), max(ny1,ny2)
+            nx1, ny1 = max(0,int(nx1)), max(0,int(ny1))
+            nx2, ny2 = min(W-1,int(nx2)), min(H-1,int(ny2))
+            self.bboxes[self.selected_box] = (cls, nx1, ny1, nx2, ny2)
+            return True
+        return False
+
+    def finish_edit(self, ix, iy):
+        """End the current draw, move or resize. Returns True if the boxes changed and should be saved."""
+        if self.drawing:
+            x1, x2 = sorted([int(self.start_x_image), int(ix)])
+            y1, y2 = sorted([int(self.start_y_image), int(iy)])
+            self.drawing = False
+            self.start_x_image = self.start_y_image = self.end_x_image = self.end_y_image = None
+            # ignore tiny
+            if abs(x2-x1) > 5 and abs(y2-y1) > 5:
+                self.bboxes.append((self.class_index(self.current_class), x1, y1, x2, y2))
+                self.selected_box = len(self.bboxes) - 1
+                return True
+            return False
+        if self.dragging:
+            self.dragging = False
+            self.prev_mouse_x = self.prev_mouse_y = None
+            return True
+        if self.resizing:
+            self.resizing = False
+            self.resize_corner = None
+            return True
+        return False
+
+    def delete_selected(self):
+        if self.selected_box is None:
+            return False
+        del self.bboxes[self.selected_box]
+        self.selected_box = None
+        return True
+
+    # ---------------- view ----------------
+    def zoom_at(self, mx, my, zoom_in):
+        """Zoom by 15% keeping the image point under (mx, my) in place."""
+        ix, iy = self.canvas_to_image(mx, my)
+        self.scale *= 1.15 if zoom_in else 1/1.15
+        self.offset_x = mx - int(ix * self.scale)
+        self.offset_y = my - int(iy * self.scale)
+
+    def pan_by(self, dx, dy):
+        self.offset_x += dx
+        self.offset_y += dy
+
+    def render(self, view_x, view_y, view_w, view_h, interpolation=cv2.INTER_LINEAR):
+        """Visible part of the image with boxes drawn on it: (pixels, canvas_x, canvas_y), or None."""
+        # only the visible part is resampled; the full-size image is never copied
+        s = self.scale
+        with self.perf.stage("resize"):
+            view = self.session.render_view(self.offset_x, self.offset_y, view_x, view_y, view_w, view_h, s,
+                                            interpolation)
+        if view is None:
+            return None
+        resized, view_cx, view_cy, _ = view
+        # box coordinates on the rendered view, truncated like int() so edges land on the same pixels
+        dx, dy = self.offset_x - view_cx, self.offset_y - view_cy
+        with self.perf.stage("composite"):
+            xyxy = np.trunc(self.bboxes.xyxy * s + (dx, dy, dx, dy)).astype(np.int32)
+            h, w = resized.shape[:2]
+            visible = (xyxy[:, 2] >= 0) & (xyxy[:, 0] < w) & (xyxy[:, 3] >= 0) & (xyxy[:, 1] < h)
+            if self.selected_box is not None:
+                visible[self.selected_box] = False
+            colors = [self.class_colors.get(name, (0, 255, 0)) for name in self.class_names]
+            if self.showing_proposals:
+                for c, (x1, y1, x2, y2) in zip(self.bboxes.cls[visible].tolist(), xyxy[visible].tolist()):
+                    draw_dashed_rect(resized, (x1, y1), (x2, y2), colors[c])
+            else:
+                # one polyline call per class colour instead of one rectangle call per box
+                corners = xyxy[visible][:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+                cls = self.bboxes.cls[visible]
+                for c in np.unique(cls).tolist():
+                    cv2.polylines(resized, list(corners[cls == c]), True, colors[c], 1)
+            if self.selected_box is not None:
+                x1, y1, x2, y2 = xyxy[self.selected_box].tolist()
+                color = colors[self.bboxes.cls[self.selected_box]]
+                roi = resized[max(0, y1):max(0, y2 + 1), max(0, x1):max(0, x2 + 1)]
+                if roi.size:
+                    cv2.addWeighted(np.full_like(roi, color), 0.3, roi, 0.7, 0, roi)
+                cv2.rectangle(resized, (x1, y1), (x2, y2), color, 1)
+        return resized, view_cx, view_cy
+
+
+class MaskAnnotator:
+    """Class-index mask of one image (0 = background), its undo history, edit and view state."""
+
+    def __init__(self):
+        self.class_colors = {}             # class name -> BGR colour, in class index order
+        self.current_class = None
+        self.drawing_mode = "pen"
+        self.drawing = False
+        self.pen_thickness = 2
+
+        self.scale = 1.0
+        self.offset_x = 0
+        self.offset_y = 0
+
+        self.start_x = self.start_y = self.end_x = self.end_y = None
+        self.polygon_points = []
+
+        self.session = None
+        self.display_mask = None
+        self.dirty_tiles = set()
+        self.needs_full_save = False
+        self.history = TileHistory()
+        self.perf = PerfStats()
+
+    def set_mask(self, mask, saved):
+        """Start editing mask (None for a blank one). saved: whether it is already stored as tiles."""
+        if mask is None:
+            mask = np.zeros(self.session.shape[:2], dtype=np.uint8)
+        self.display_mask = mask
+        self.session.track("mask", self.display_mask)
+        self.session.track("history", self.history)
+        self.dirty_tiles = set()
+        # legacy .txt masks and unsaved images are written out in full once
+        self.needs_full_save = not saved
+        self.history.clear()
+
+    def class_value(self):
+        """Mask value the current tool paints: the class index + 1, or 0 when erasing."""
+        if self.drawing_mode == "erase":
+            return 0
+        return list(self.class_colors.keys()).index(self.current_class) + 1
+
+    def canvas_to_image_coords(self, x, y):
+        return int((x - self.offset_x) / self.scale), int((y - self.offset_y) / self.scale)
+
+    # ---------------- pointer handlers (canvas coordinates) ----------------
+    def can_paint(self):
+        return bool(self.current_class) or self.drawing_mode == "erase"
+
+    def pointer_press(self, cx, cy, index=None):
+        """Left press in the current mode. index: the image's SuperpixelIndex, needed for "sp_click"."""
+        x, y = self.canvas_to_image_coords(cx, cy)
+        if self.drawing_mode in ["pen", "erase"]:
+            self.polygon_points = [(x, y)]
+        elif self.drawing_mode in ("rect", "sp_rect"):
+            self.start_x, self.start_y = x, y
+            self.drawing = True
+        elif self.drawing_mode == "sp_click" and index is not None:
+            self.fill_superpixels(index, index.segment_at(x, y))
+
+    def pointer_drag(self, cx, cy):
+        x, y = self.canvas_to_image_coords(cx, cy)
+        if self.drawing_mode in ["pen", "erase"] and self.polygon_points:
+            self.stroke_to(x, y)
+        elif self.drawing_mode in ("rect", "sp_rect") and self.drawing:
+            self.end_x, self.end_y = x, y
+
+    def pointer_release(self, cx, cy, index=None):
+        """Left release: apply a rectangle tool, then close the undo step. True if the mask changed."""
+        x2, y2 = self.canvas_to_image_coords(cx, cy)
+        if self.drawing_mode == "rect" and self.drawing:
+            self.threshold_fill(self.start_x, self.start_y, x2, y2)
+        elif self.drawing_mode == "sp_rect" and self.drawing and index is not None:
+            self.fill_superpixels(index, index.segments_in_rect(self.start_x, self.start_y, x2, y2))
+        return self.end_step()
+
+    # ---------------- editing ----------------
+    def stroke_to(self, x, y):
+        """Extend the pen/eraser stroke to (x, y), painting the new segment into the mask."""
+        self.polygon_points.append((x, y))
+        (px, py), pad = self.polygon_points[-2], self.pen_thickness
+        keys = tiles_in_rect(min(px, x) - pad, min(py, y) - pad, max(px, x) + pad, max(py, y) + pad,
+                             self.display_mask.shape)
+        self.history.touch(keys, self.display_mask)
+        self.dirty_tiles |= keys
+        cv2.line(self.display_mask, self.polygon_points[-2], self.polygon_points[-1], self.class_value(),
+                 thickness=self.pen_thickness)
+
+    def threshold_fill(self, x1, y1, x2, y2):
+        """Fill the dark (below 128) pixels of the rectangle with the current class."""
+        x1, x2 = sorted((max(0, x1), max(0, x2)))
+        y1, y2 = sorted((max(0, y1), max(0, y2)))
+        region = self.session.region(x1, y1, x2, y2)
+        if region.size == 0:
+            return
+        gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+        _, binary = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)
+        keys = tiles_in_rect(x1, y1, x2, y2, self.display_mask.shape)
+        self.history.touch(keys, self.display_mask)
+        self.display_mask[y1:y1 + binary.shape[0], x1:x1 + binary.shape[1]][binary == 0] = self.class_value()
+        self.dirty_tiles |= keys
+
+    def fill_superpixels(self, index, segments):
+        region = index.region(segments)
+        if region is None:
+            return
+        (x1, y1, x2, y2), selected = region
+        keys = tiles_in_rect(x1, y1, x2 - 1, y2 - 1, self.display_mask.shape)
+        self.history.touch(keys, self.display_mask)
+        self.display_mask[y1:y2, x1:x2][selected] = self.class_value()
+        self.dirty_tiles |= keys
+
+    def end_step(self):
+        """Close the current edit as one undo step. Returns True if it changed the mask."""
+        self.drawing = False
+        self.polygon_points.clear()
+        return self.history.commit(self.display_mask)
+
+    def undo_step(self):
+        self.dirty_tiles |= self.history.undo(self.display_mask)
+
+    def redo_step(self):
+        self.dirty_tiles |= self.history.redo(self.display_mask)
+
+    def tiles_to_save(self):
+        """{(row, col): tile copy} for everything changed since the last call, and mark it clean."""
+        shape = self.display_mask.shape
+        keys = tiles_in_rect(0, 0, shape[1] - 1, shape[0] - 1, shape) if self.needs_full_save else self.dirty_tiles
+        tiles = {}
+        for key in keys:
+            tile = self.display_mask[tile_slice(key)]
+            # a first save starts from an empty store, so background tiles need not be sent
+            if not self.needs_full_save or tile.any():
+                tiles[key] = tile.copy()
+        self.dirty_tiles = set()
+        self.needs_full_save = False
+        return tiles
+
+    # ---------------- view ----------------
+    def zoom_about(self, cx, cy, zoom_in):
+        """Zoom by 10% keeping the image point at canvas (cx, cy) in place."""
+        image_x, image_y = self.canvas_to_image_coords(cx, cy)
+        if zoom_in:
+            self.scale *= 1.1
+        else:
+            self.scale /= 1.1
+        self.offset_x = cx - int(image_x * self.scale)
+        self.offset_y = cy - int(image_y * self.scale)
+
+    def pan_by(self, dx, dy):
+        self.offset_x += dx
+        self.offset_y += dy
+
+    def render(self, canvas_width, canvas_height, interpolation=cv2.INTER_NEAREST):
+        """Visible part of the image with the mask coloured in: (pixels, canvas_x, canvas_y), or None."""
+        s = self.scale
+        h, w = self.session.shape[:2]
+        # an unpanned view is centred on the canvas
+        self.offset_x = (canvas_width - int(round(w * s))) // 2 if self.offset_x == 0 else self.offset_x
+        self.offset_y = (canvas_height - int(round(h * s))) // 2 if self.offset_y == 0 else self.offset_y
+
+        # the mask is always zoomed nearest-neighbour so class edges stay exact, and coloured at display size
+        with self.perf.stage("resize"):
+            view = self.session.render_view(self.offset_x, self.offset_y, 0, 0, max(1, canvas_width),
+                                            max(1, canvas_height), s, interpolation)
+        if view is None:
+            return None
+        resized, view_x, view_y, (x1, y1, x2, y2) = view
+        with self.perf.stage("composite"):
+            mask = cv2.resize(self.display_mask[y1:y2, x1:x2], (resized.shape[1], resized.shape[0]),
+                              interpolation=cv2.INTER_NEAREST)
+            for idx, color in enumerate(self.class_colors.values(), 1):
+                resized[mask == idx] = color
+
+        if self.drawing_mode in ("rect", "sp_rect") and self.drawing and self.start_x and self.start_y and self.end_x and self.end_y:
+            dx, dy = self.offset_x - view_x, self.offset_y - view_y
+            cv2.rectangle(resized, (int(self.start_x * s + dx), int(self.start_y * s + dy)),
+                          (int(self.end_x * s + dx), int(self.end_y * s + dy)), (0, 255, 255), 1)
+        return resized, view_x, view_y
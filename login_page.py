@@ -1,15 +1,18 @@
 import tkinter as tk
 from tkinter import messagebox, filedialog
 import os
-import subprocess
 import datetime
 import json
 import ctypes
-import shutil
-import numpy as np
+import threading
 import tkinter.colorchooser as colorchooser
-from Bounding_box import run_bounding_box
-from Segment_label import run_segment_label
+from tkinter import ttk
+from startup import TIMER, warm_imports
+from image_import import ImportJob, IMPORT_MODES, MANIFEST_NAME
+from annotation_store import AnnotationStore, store_path, STORE_NAME
+
+# Bounding_box / Segment_label (and with them cv2, numpy, PIL) are imported
+# lazily when a labeling mode opens; App warms them in the background.
 
 # Secure hidden file path
 def get_user_file_path():
@@ -58,9 +61,18 @@ class App(tk.Tk):
         self.show_frame(LoginPage)
         self.current_user = None
 
+        # start warming heavy imports once the login window has painted
+        self.after_idle(self.on_first_paint)
+
+    def on_first_paint(self):
+        TIMER.mark("login_painted")
+        warm_imports()
+
     def show_frame(self, page):
         frame = self.frames[page]
         frame.tkraise()
+        if hasattr(frame, "on_show"):
+            frame.on_show()
 
 
 class LoginPage(tk.Frame):
@@ -189,14 +201,44 @@ class ActionSelectionPage(tk.Frame):
         tk.Button(frame, text="Logout", width=20, height=2,
                   command=lambda: controller.show_frame(LoginPage)).pack(pady=10)
 
+        self.model_preloader = None
+        self.preload_thread = None
+
+    def on_show(self):
+        # import torch/Test_mode and load the last-used model while the user picks an action
+        if self.preload_thread is None:
+            self.preload_thread = threading.Thread(target=self.preload_test_mode, daemon=True)
+            self.preload_thread.start()
+
+    def preload_test_mode(self):
+        try:
+            Test_mode = TIMER.timed_import("Test_mode")
+            self.model_preloader = Test_mode.preload_last_model()
+        except Exception as e:
+            print(f"Test mode preload failed: {e}")
+
     def launch_test_mode(self):
         folder = filedialog.askdirectory(title="Select Image Folder for Test Mode")
         if folder:
             try:
-                subprocess.Popen(["python", "Test_mode.py", folder])
-                self.controller.destroy()
+                from Test_mode import YOLOApp
             except Exception as e:
-                messagebox.showerror("Error", f"Could not launch Test_mode.py: {e}")
+                messagebox.showerror("Error", f"Could not load Test mode: {e}")
+                return
+            if self.preload_thread is not None:
+                self.preload_thread.join()
+
+            window = tk.Toplevel(self.controller)
+            window.geometry("1000x700")
+            self.controller.withdraw()
+            self.test_app = YOLOApp(window, image_folder=folder, preloader=self.model_preloader,
+                                    on_close=self.on_test_mode_closed)
+
+    def on_test_mode_closed(self):
+        # keep whichever model Test mode ended with warm for the next launch
+        self.model_preloader = self.test_app.preloader
+        self.test_app = None
+        self.controller.deiconify()
 
 class ProjectCreationPage(tk.Frame):
     
@@ -225,7 +267,16 @@ class ProjectCreationPage(tk.Frame):
      tk.Radiobutton(project_frame, text="Detection", variable=self.mode_var, value="detection").grid(row=1, column=1, sticky="w")
      tk.Radiobutton(project_frame, text="Segmentation", variable=self.mode_var, value="segmentation").grid(row=1, column=1, sticky="e")
 
-     tk.Button(project_frame, text="Select Image Folder", width=25, command=self.select_folder).grid(row=2, column=0, columnspan=2, pady=10)
+     tk.Label(project_frame, text="Import Images By:", font=("Arial", 11)).grid(row=2, column=0, sticky="w", pady=5)
+     self.import_mode_var = tk.StringVar(value="auto")
+     ttk.Combobox(project_frame, textvariable=self.import_mode_var, state="readonly",
+                  values=IMPORT_MODES, width=15).grid(row=2, column=1, sticky="w")
+
+     self.use_store_var = tk.BooleanVar(value=False)
+     tk.Checkbutton(project_frame, text="Keep labels in one file (annotations.db)",
+                    variable=self.use_store_var).grid(row=3, column=0, columnspan=2, sticky="w")
+
+     tk.Button(project_frame, text="Select Image Folder", width=25, command=self.select_folder).grid(row=4, column=0, columnspan=2, pady=10)
 
      # Class Creation Frame
      class_frame = tk.LabelFrame(self, text="Add Classes Before Creating Project", padx=15, pady=15, font=("Arial", 12, "bold"))
@@ -273,17 +324,48 @@ class ProjectCreationPage(tk.Frame):
         os.makedirs(images_folder, exist_ok=True)
         os.makedirs(labels_folder, exist_ok=True)
 
-        # Copy images
-        supported_exts = (".jpg", ".jpeg", ".png", ".bmp")
-        copied_count = 0
-        for img_file in os.listdir(self.selected_folder):
-            if img_file.lower().endswith(supported_exts):
-                src_path = os.path.join(self.selected_folder, img_file)
-                dst_path = os.path.join(images_folder, img_file)
-                if not os.path.exists(dst_path):
-                    shutil.copy2(src_path, dst_path)
-                    copied_count += 1
-
+        # Import images in the background; only new or changed files are processed
+        job = ImportJob(self.selected_folder, images_folder,
+                        os.path.join(project_folder, MANIFEST_NAME), mode=self.import_mode_var.get())
+        self.show_import_progress(job, lambda: self.finish_project(project_name, project_folder))
+        job.start()
+
+    def show_import_progress(self, job, on_done):
+        top = tk.Toplevel(self)
+        top.title("Importing Images")
+        top.geometry("420x140")
+        top.transient(self.controller)
+        top.grab_set()
+
+        status = tk.Label(top, text="Scanning folder...")
+        status.pack(pady=(15, 5))
+        bar = ttk.Progressbar(top, length=360, mode="determinate")
+        bar.pack(pady=5)
+        tk.Button(top, text="Cancel", width=15, command=job.cancel).pack(pady=5)
+        top.protocol("WM_DELETE_WINDOW", job.cancel)
+
+        def poll():
+            if job.total:
+                bar["maximum"] = job.total
+                bar["value"] = job.done
+                status.config(text=f"{job.done} / {job.total} images  (skipped unchanged: {job.skipped})")
+            if not job.finished:
+                top.after(100, poll)
+                return
+            top.grab_release()
+            top.destroy()
+            if job.errors:
+                messagebox.showwarning("Import", f"{len(job.errors)} images failed to import:\n"
+                                       + "\n".join(job.errors[:10]))
+            if job.cancelled:
+                messagebox.showinfo("Import Cancelled",
+                                    "Import cancelled. Create the project again to resume where it stopped.")
+                return
+            on_done()
+
+        poll()
+
+    def finish_project(self, project_name, project_folder):
         # Save metadata
         project_file_path = os.path.join(project_folder, "project.txt")
         username = getattr(self.controller, "current_user", "UnknownUser")
@@ -297,6 +379,11 @@ class ProjectCreationPage(tk.Frame):
             f.write(f"Labeling Mode: {mode_selected}\n")
             f.write(f"Image Folder: images\n")
             f.write(f"Labels Folder: Box_labels\n")
+            if self.use_store_var.get():
+                f.write(f"Label Store: {STORE_NAME}\n")
+
+        if self.use_store_var.get():
+            AnnotationStore(store_path(project_folder)).close()
 
         # Save classes.txt
         classes_file = os.path.join(project_folder, "classes.txt")
@@ -312,8 +399,10 @@ class ProjectCreationPage(tk.Frame):
         # Launch labeling tool
         self.controller.destroy()
         if mode_selected.lower() == "detection":
+            from Bounding_box import run_bounding_box
             run_bounding_box(project_folder)
         else:
+            from Segment_label import run_segment_label
             run_segment_label(project_folder)
 
     def browse_project(self):
@@ -325,6 +414,7 @@ class ProjectCreationPage(tk.Frame):
             messagebox.showerror("Error", "This folder does not contain a valid project.")
             return
         self.controller.destroy()
+        from Bounding_box import run_bounding_box
         run_bounding_box(folder_selected)
 
     def hex_to_rgb(hex_color):
@@ -0,0 +1,167 @@
+"""Convert SegmentationLabeler masks into polygon annotations.
+
+Masks are the per-pixel class maps saved under ``<folder>/Segment_labels``
+(tiled, see mask_tiles.py, or legacy dense .txt; 0 = background, k = k-th
+class). For every class present, the outer
+contours found with ``cv2.findContours`` become instance polygons,
+optionally simplified with ``cv2.approxPolyDP``. Output:
+
+    yolo-seg  <out>/labels/<stem>.txt with ``cls x1 y1 x2 y2 ...`` normalized
+    coco      <out>/instances.json with polygon segmentation (or RLE with --rle)
+
+Masks are converted in a process pool; each worker returns only the small
+polygon lists.
+
+Usage::
+
+    python mask_polygons.py FOLDER OUT_FOLDER [--format coco] [--epsilon 1.0] [--rle]
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from catalog import open_catalog
+from label_core import read_classes_file
+from mask_tiles import load_mask
+
+MASK_FOLDER = "Segment_labels"
+
+
+def saved_mask_stems(mask_folder):
+    """Stems of every saved mask, tiled (<stem>.tiles/) or legacy (<stem>.txt)."""
+    stems = set()
+    with os.scandir(mask_folder) as it:
+        for entry in it:
+            if entry.name.endswith(".tiles") and entry.is_dir():
+                stems.add(entry.name[:-6])
+            elif entry.name.endswith(".txt"):
+                stems.add(entry.name[:-4])
+    return sorted(stems)
+
+
+def mask_to_rle(binary):
+    """Uncompressed COCO RLE (column-major run lengths, starting with a zero run)."""
+    pixels = np.asfortranarray(binary).ravel(order="F").astype(np.uint8)
+    changes = np.flatnonzero(np.diff(np.concatenate(([0], pixels, [0]))))
+    runs = np.diff(np.concatenate(([0], changes, [pixels.size])))
+    return {"counts": runs.tolist(), "size": list(binary.shape)}
+
+
+def extract_instances(mask, epsilon=1.0, min_area=4.0, rle=False):
+    """Return [(class_value, polygon [[x, y], ...], area, bbox, rle or None)] for one mask."""
+    instances = []
+    for value in np.unique(mask):
+        if value == 0:
+            continue
+        binary = (mask == value).astype(np.uint8)
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area < min_area:
+                continue
+            if epsilon > 0:
+                contour = cv2.approxPolyDP(contour, epsilon, True)
+            if len(contour) < 3:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            instance_rle = None
+            if rle:
+                filled = np.zeros_like(binary)
+                cv2.drawContours(filled, [contour], -1, 1, thickness=-1)
+                instance_rle = mask_to_rle(filled & binary)
+            instances.append((int(value), contour.reshape(-1, 2).tolist(), float(area),
+                              [int(x), int(y), int(w), int(h)], instance_rle))
+    return instances
+
+
+def _convert_one(args):
+    mask_folder, stem, epsilon, rle = args
+    try:
+        mask = load_mask(mask_folder, stem)
+    except (OSError, ValueError) as e:
+        return stem, None, str(e)
+    if mask is None:
+        return stem, None, "no readable mask"
+    return stem, (mask.shape, extract_instances(mask, epsilon, rle=rle)), None
+
+
+def load_class_names(folder):
+    # classes.txt sits next to the images or in the project folder above them
+    for candidate in (folder, os.path.dirname(os.path.abspath(folder))):
+        path = os.path.join(candidate, "classes.txt")
+        if os.path.exists(path):
+            return read_classes_file(path)[0]
+    return []
+
+
+def convert_folder(folder, out_folder, fmt="yolo-seg", epsilon=1.0, rle=False, workers=None):
+    """Convert every mask under folder/Segment_labels. Returns (converted, failed) counts."""
+    mask_folder = os.path.join(folder, MASK_FOLDER)
+    stems = saved_mask_stems(mask_folder)
+    images_by_stem = {os.path.splitext(f)[0]: f for f in open_catalog(folder).files}
+    class_names = load_class_names(folder)
+    os.makedirs(out_folder, exist_ok=True)
+
+    labels_folder = os.path.join(out_folder, "labels")
+    if fmt == "yolo-seg":
+        os.makedirs(labels_folder, exist_ok=True)
+    coco = {"images": [], "annotations": [], "categories": []}
+    max_class = 0
+    converted = failed = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = ((mask_folder, stem, epsilon, rle) for stem in stems)
+        for stem, result, error in pool.map(_convert_one, jobs, chunksize=8):
+            if result is None:
+                print(f"Skipping {stem}: {error}")
+                failed += 1
+                continue
+            (h, w), instances = result
+            converted += 1
+            if fmt == "yolo-seg":
+                with open(os.path.join(labels_folder, f"{stem}.txt"), "w", encoding="utf-8") as f:
+                    for value, polygon, _, _, _ in instances:
+                        coords = " ".join(f"{x / w:.6f} {y / h:.6f}" for x, y in polygon)
+                        f.write(f"{value - 1} {coords}\n")
+                continue
+
+            image_id = len(coco["images"]) + 1
+            coco["images"].append({"id": image_id, "file_name": images_by_stem.get(stem, f"{stem}.png"),
+                                   "width": w, "height": h})
+            for value, polygon, area, bbox, instance_rle in instances:
+                max_class = max(max_class, value)
+                coco["annotations"].append({
+                    "id": len(coco["annotations"]) + 1, "image_id": image_id, "category_id": value,
+                    "segmentation": instance_rle if rle else [[c for point in polygon for c in point]],
+                    "area": area, "bbox": bbox, "iscrowd": 0})
+
+    if fmt == "coco":
+        count = max(max_class, len(class_names))
+        coco["categories"] = [{"id": i + 1, "name": class_names[i] if i < len(class_names) else f"class_{i + 1}"}
+                              for i in range(count)]
+        with open(os.path.join(out_folder, "instances.json"), "w", encoding="utf-8") as f:
+            json.dump(coco, f)
+    return converted, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export segmentation masks as polygons")
+    parser.add_argument("folder", help="folder holding the images and Segment_labels")
+    parser.add_argument("out_folder")
+    parser.add_argument("--format", choices=("yolo-seg", "coco"), default="yolo-seg")
+    parser.add_argument("--epsilon", type=float, default=1.0, help="approxPolyDP tolerance in pixels (0 = off)")
+    parser.add_argument("--rle", action="store_true", help="COCO only: write RLE instead of polygons")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    converted, failed = convert_folder(args.folder, args.out_folder, args.format, args.epsilon, args.rle, args.workers)
+    print(f"Converted {converted} masks ({failed} failed) to {args.out_folder}")
+
+
+if __name__ == "__main__":
+    main()
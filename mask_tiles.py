@@ -0,0 +1,245 @@
+"""Tile-chunked storage for segmentation masks.
+
+A mask is kept as ``Segment_labels/<stem>.tiles/``: fixed-size tiles, each
+zlib-compressed in its own file, plus ``manifest.json`` mapping tile
+coordinates to file names. Background-only tiles have no file at all.
+
+Saving writes only the tiles the annotator touched. Tile files are never
+overwritten: each save writes its tiles under a new version number and then
+atomically replaces the manifest, so a reader always sees one complete
+version. Files retired by a save are deleted afterwards; a reader that loses
+that race simply re-reads the manifest.
+
+Masks saved before this format (``Segment_labels/<stem>.txt``) are still
+read, and are converted to tiles on their next save.
+"""
+
+import json
+import os
+import queue
+import threading
+import zlib
+
+import numpy as np
+
+TILE_SIZE = 256
+MANIFEST_NAME = "manifest.json"
+
+
+def tiles_path(mask_folder, stem):
+    return os.path.join(mask_folder, f"{stem}.tiles")
+
+
+def has_tiles(mask_folder, stem):
+    return os.path.exists(os.path.join(tiles_path(mask_folder, stem), MANIFEST_NAME))
+
+
+def tiles_in_rect(x1, y1, x2, y2, shape, tile=TILE_SIZE):
+    """Tile keys (row, col) overlapping the pixel rectangle [x1, x2] x [y1, y2], clipped to shape."""
+    h, w = shape[:2]
+    x1, x2 = max(0, min(x1, x2)), min(w - 1, max(x1, x2))
+    y1, y2 = max(0, min(y1, y2)), min(h - 1, max(y1, y2))
+    if x1 > x2 or y1 > y2:
+        return set()
+    return {(r, c) for r in range(y1 // tile, y2 // tile + 1) for c in range(x1 // tile, x2 // tile + 1)}
+
+
+def tile_slice(key, tile=TILE_SIZE):
+    r, c = key
+    return slice(r * tile, (r + 1) * tile), slice(c * tile, (c + 1) * tile)
+
+
+class TiledMaskStore:
+    """One mask on disk. ``read()`` returns the full array; ``write()`` persists a set of tiles."""
+
+    def __init__(self, path, tile=TILE_SIZE):
+        self.path = path
+        self.tile = tile
+        self.manifest = None
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, MANIFEST_NAME))
+
+    def load_manifest(self):
+        with open(os.path.join(self.path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def read(self, retries=5):
+        for _ in range(retries):
+            manifest = self.load_manifest()
+            tile = manifest["tile"]
+            mask = np.zeros((manifest["height"], manifest["width"]), dtype=np.uint8)
+            try:
+                for key, name in manifest["tiles"].items():
+                    r, c = map(int, key.split(","))
+                    with open(os.path.join(self.path, name), "rb") as f:
+                        data = zlib.decompress(f.read())
+                    rows, cols = tile_slice((r, c), tile)
+                    view = mask[rows, cols]
+                    view[...] = np.frombuffer(data, dtype=np.uint8).reshape(view.shape)
+            except FileNotFoundError:
+                continue  # a newer save retired a tile mid-read; start over from its manifest
+            self.manifest = manifest
+            return mask
+        raise OSError(f"Mask at {self.path} kept changing while being read")
+
+    def write(self, shape, tiles):
+        """Persist {(row, col): tile array}. Tiles not given keep their stored version."""
+        os.makedirs(self.path, exist_ok=True)
+        if self.manifest is None:
+            self.manifest = self.load_manifest() if self.exists() else None
+        retired = []
+        if self.manifest is None or self.manifest["height"] != shape[0] or self.manifest["width"] != shape[1]:
+            if self.manifest is not None:
+                retired.extend(self.manifest["tiles"].values())
+            version = self.manifest["version"] if self.manifest else 0
+            self.manifest = {"version": version, "height": shape[0], "width": shape[1], "tile": self.tile, "tiles": {}}
+
+        version = self.manifest["version"] + 1
+        entries = dict(self.manifest["tiles"])
+        for (r, c), data in tiles.items():
+            key = f"{r},{c}"
+            if key in entries:
+                retired.append(entries.pop(key))
+            if data.any():
+                name = f"{r}_{c}.{version}.z"
+                with open(os.path.join(self.path, name), "wb") as f:
+                    f.write(zlib.compress(np.ascontiguousarray(data).tobytes(), 1))
+                entries[key] = name
+
+        manifest = dict(self.manifest, version=version, tiles=entries)
+        tmp = os.path.join(self.path, f"{MANIFEST_NAME}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, os.path.join(self.path, MANIFEST_NAME))
+        self.manifest = manifest
+
+        for name in retired:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+        return len(tiles)
+
+
+def load_mask(mask_folder, stem, shape=None):
+    """Read a saved mask in either format, or return None if there is none (or its shape differs)."""
+    store = TiledMaskStore(tiles_path(mask_folder, stem))
+    mask = None
+    if store.exists():
+        mask = store.read()
+    else:
+        legacy = os.path.join(mask_folder, f"{stem}.txt")
+        if os.path.exists(legacy):
+            mask = np.loadtxt(legacy, dtype=np.uint8, ndmin=2)
+    if mask is not None and shape is not None and mask.shape != tuple(shape[:2]):
+        return None
+    return mask
+
+
+class MaskSaver(threading.Thread):
+    """Writes tile snapshots on a background thread so saving never blocks the UI."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.jobs = queue.Queue()
+        self.error = None
+        self.start()
+
+    def save(self, mask_folder, stem, shape, tiles):
+        """Queue {(row, col): tile copy}. The caller must pass copies, not views of a live mask."""
+        self.jobs.put((mask_folder, stem, shape, tiles))
+
+    def flush(self):
+        self.jobs.join()
+
+    def run(self):
+        while True:
+            mask_folder, stem, shape, tiles = self.jobs.get()
+            try:
+                TiledMaskStore(tiles_path(mask_folder, stem)).write(shape, tiles)
+                legacy = os.path.join(mask_folder, f"{stem}.txt")
+                if os.path.exists(legacy):
+                    os.remove(legacy)
+            except Exception as e:
+                # a corrupt manifest or tile must not end the loop, or later saves are lost and flush() hangs
+                self.error = f"{stem}: {e}"
+            finally:
+                self.jobs.task_done()
+
+
+class TileHistory:
+    """Undo/redo for a mask, storing only the tiles each step changed.
+
+    Call ``touch(keys, mask)`` before modifying those tiles: the first touch of
+    a tile within a step saves a copy of its current content. ``commit()``
+    closes the step, dropping tiles that ended up unchanged. Oldest steps are
+    discarded once the history exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.undo_steps = []
+        self.redo_steps = []
+        self.pending = None
+        self.nbytes = 0
+
+    def clear(self):
+        self.undo_steps, self.redo_steps, self.pending, self.nbytes = [], [], None, 0
+
+    def touch(self, keys, mask):
+        if self.pending is None:
+            self.pending = {}
+        for key in keys:
+            if key not in self.pending:
+                self.pending[key] = mask[tile_slice(key)].copy()
+
+    def commit(self, mask):
+        step, self.pending = self.pending, None
+        if not step:
+            return False
+        step = {k: old for k, old in step.items() if not np.array_equal(old, mask[tile_slice(k)])}
+        if not step:
+            return False
+        self._drop(self.redo_steps)
+        self.redo_steps = []
+        self._push(self.undo_steps, step)
+        while self.nbytes > self.max_bytes and len(self.undo_steps) > 1:
+            self._drop([self.undo_steps.pop(0)])
+        return True
+
+    def undo(self, mask):
+        """Restore the previous step into mask. Returns the tile keys changed."""
+        return self._swap(mask, self.undo_steps, self.redo_steps)
+
+    def redo(self, mask):
+        return self._swap(mask, self.redo_steps, self.undo_steps)
+
+    def _swap(self, mask, source, target):
+        if self.pending:
+            self.commit(mask)
+        if not source:
+            return set()
+        step = source.pop()
+        self.nbytes -= self._size(step)
+        current = {}
+        for key, data in step.items():
+            view = mask[tile_slice(key)]
+            current[key] = view.copy()
+            view[...] = data
+        self._push(target, current)
+        return set(step)
+
+    def _push(self, steps, step):
+        steps.append(step)
+        self.nbytes += self._size(step)
+
+    def _drop(self, steps):
+        self.nbytes -= sum(self._size(step) for step in steps)
+
+    @staticmethod
+    def _size(step):
+        return sum(data.nbytes for data in step.values())
+
+    def describe(self):
+        return f"Undo: {len(self.undo_steps)}  Redo: {len(self.redo_steps)}  ({self.nbytes / 1048576:.1f} MB)"
@@ -0,0 +1,156 @@
+"""Stage timing for the GUI hot paths and the on-screen performance HUD.
+
+The viewers time the stages a slow frame or image change can come from:
+``decode`` (opening an image), ``labels`` (reading or writing boxes and
+masks), ``resize`` (resampling the visible region), ``composite`` (drawing
+boxes or colouring the mask), ``photo`` (building the Tk ``PhotoImage``) and
+``frame`` (one whole redraw). Each stage keeps its last ``WINDOW`` samples,
+from which the HUD shows rolling percentiles and the report a histogram.
+
+Collection is off unless asked for; a disabled ``stage()`` returns a shared
+no-op context, so the instrumented code costs one attribute check. Press F3
+in a viewer to toggle the HUD (collection starts with it), set
+``LABELER_PERF=1`` to collect from start-up, and set
+``LABELER_PERF_REPORT=<path>`` to also write the stats as JSON when the
+viewer closes.
+"""
+
+import contextlib
+import json
+import os
+import time
+from collections import deque
+
+PERF_ENV = "LABELER_PERF"
+REPORT_ENV = "LABELER_PERF_REPORT"
+WINDOW = 512
+BUCKETS_MS = (0.5, 1, 2, 4, 8, 16, 33, 66, 133, 250, 500, 1000)
+HUD_REFRESH = 0.25  # seconds between recomputing the HUD text
+HUD_TAG = "perf_hud"
+
+_DISABLED = contextlib.nullcontext()
+
+
+class _StageTimer:
+    __slots__ = ("stats", "name", "started")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.stats.add(self.name, (time.perf_counter() - self.started) * 1000)
+
+
+class PerfStats:
+    """Rolling per-stage timings in milliseconds. Created disabled unless told otherwise."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.samples = {}   # stage -> deque of the last WINDOW samples
+        self.totals = {}    # stage -> [count, sum] since collection started
+        self.counters = {}  # name -> callable returning {counter: value}, e.g. the render scheduler's
+
+    def stage(self, name):
+        """Context manager timing one run of a stage (a shared no-op while disabled)."""
+        return _StageTimer(self, name) if self.enabled else _DISABLED
+
+    def add(self, name, ms):
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=WINDOW)
+            self.totals[name] = [0, 0.0]
+        self.samples[name].append(ms)
+        total = self.totals[name]
+        total[0] += 1
+        total[1] += ms
+
+    def summary(self, name):
+        window = sorted(self.samples[name])
+        pick = lambda q: round(window[min(len(window) - 1, int(q * len(window)))], 3)
+        count, total = self.totals[name]
+        return {"count": count, "mean": round(total / count, 3), "p50": pick(0.5), "p95": pick(0.95),
+                "p99": pick(0.99), "max": round(window[-1], 3)}
+
+    def histogram(self, name):
+        """Counts of the windowed samples per bucket, keyed by the bucket's upper edge in ms."""
+        counts = dict.fromkeys([f"<={edge}" for edge in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"], 0)
+        for ms in self.samples[name]:
+            edge = next((e for e in BUCKETS_MS if ms <= e), None)
+            counts[f"<={edge}" if edge is not None else f">{BUCKETS_MS[-1]}"] += 1
+        return counts
+
+    def report(self):
+        return {name: dict(self.summary(name), histogram=self.histogram(name)) for name in self.samples}
+
+    def write_report(self, path, label=None):
+        counters = {name: read() for name, read in self.counters.items()}
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"viewer": label, "window": WINDOW, "stages_ms": self.report(), "counters": counters},
+                          f, indent=2)
+        except OSError as e:
+            print(f"Could not write performance report: {e}")
+
+
+def open_perf():
+    """Stats for one viewer, enabled from the start if LABELER_PERF or LABELER_PERF_REPORT is set."""
+    return PerfStats(enabled=bool(os.environ.get(PERF_ENV) or os.environ.get(REPORT_ENV)))
+
+
+class PerfHud:
+    """Frame time and per-stage breakdown drawn in the corner of a canvas; F3 toggles it."""
+
+    def __init__(self, stats, root, canvas, name):
+        self.stats = stats
+        self.canvas = canvas
+        self.name = name
+        self.visible = False
+        self.text = ""
+        self.refreshed = 0.0
+        root.bind("<F3>", lambda e: self.toggle(), add="+")
+        canvas.bind("<Destroy>", self._closed, add="+")
+
+    def toggle(self):
+        self.visible = not self.visible
+        if self.visible:
+            self.stats.enabled = True
+            self.refreshed = 0.0
+            self.draw()
+        else:
+            self.canvas.delete(HUD_TAG)
+
+    def draw(self):
+        """Redraw the overlay; the viewers call this after every frame."""
+        if not self.visible:
+            return
+        now = time.perf_counter()
+        if now - self.refreshed >= HUD_REFRESH:
+            self.refreshed = now
+            self.text = self.describe()
+        self.canvas.delete(HUD_TAG)
+        x, y = self.canvas.canvasx(0) + 8, self.canvas.canvasy(0) + 8
+        text = self.canvas.create_text(x + 4, y + 4, text=self.text, anchor="nw", fill="#ffe066",
+                                       font=("Courier", 9), tags=HUD_TAG)
+        self.canvas.create_rectangle(self.canvas.bbox(text), fill="#000000", outline="", tags=HUD_TAG)
+        self.canvas.tag_raise(text)
+
+    def describe(self):
+        if "frame" not in self.stats.samples:
+            return "waiting for a frame (F3 hides)"
+        frame = self.stats.summary("frame")
+        lines = [f"{'frame':<9}{frame['p50']:6.1f} ms  p95 {frame['p95']:7.1f}  max {frame['max']:.1f}"]
+        for name in sorted(self.stats.samples):
+            if name != "frame":
+                s = self.stats.summary(name)
+                lines.append(f"{name:<9}{s['p50']:6.1f} ms  p95 {s['p95']:7.1f}  n {s['count']}")
+        for name, read in self.stats.counters.items():
+            lines.append(f"{name:<9}" + "  ".join(f"{k} {v}" for k, v in read().items()))
+        return "\n".join(lines)
+
+    def _closed(self, event):
+        path = os.environ.get(REPORT_ENV)
+        if event.widget is self.canvas and path and self.stats.samples:
+            self.stats.write_report(path, self.name)
@@ -0,0 +1,229 @@
+"""Throughput metrics for batch detection runs.
+
+A ``PipelineMetrics`` counts images and boxes, accumulates the seconds spent
+in each stage of the per-image pipeline (``STAGES``), tracks queue depth,
+and tracks how much of its wall time the worker spent busy rather than
+waiting for work. A ``MetricsWriter`` thread snapshots it every
+``interval`` seconds into two files in the metrics folder, named after the
+worker:
+
+* ``<worker>.prom``: Prometheus text format, replaced atomically, so a node
+  exporter textfile collector pointed at the folder picks up every worker.
+* ``<worker>.csv``: one row per snapshot, cumulative, for plotting a run
+  afterwards.
+
+``stop()`` writes a last CSV row and removes the ``.prom`` file, so the
+collector stops exporting a worker once it has finished. Queue workers are
+named by host and slot (``<host>-worker<n>``), so a worker that dies
+without stopping leaves a file that the next run in that slot replaces.
+
+``run_yolo_detection`` and the ``detection_queue`` workers write metrics
+when given a metrics folder (``--metrics-dir``, or ``DETECTION_METRICS_DIR``).
+"""
+
+import contextlib
+import csv
+import os
+import socket
+import threading
+import time
+
+METRICS_ENV = "DETECTION_METRICS_DIR"
+METRICS_INTERVAL = 15.0
+STAGES = ("decode", "preprocess", "forward", "nms", "draw", "write")
+QUEUES = ("images", "pending_chunks", "leased_chunks")
+
+_DISABLED = contextlib.nullcontext()
+
+
+def metrics_dir(explicit=None):
+    return explicit or os.environ.get(METRICS_ENV)
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.name, time.perf_counter() - self.started)
+
+
+class PipelineMetrics:
+    """Counters for one worker. Safe to update from the pipeline while a writer reads snapshots."""
+
+    def __init__(self, worker=None):
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.host = socket.gethostname()
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.stage_calls = dict.fromkeys(STAGES, 0)
+        self.images = 0
+        self.unreadable = 0
+        self.boxes = 0
+        self.busy_seconds = 0.0
+        self.queue_depth = dict.fromkeys(QUEUES, 0)
+
+    def stage(self, name):
+        return _StageTimer(self, name)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.stage_seconds[name] += seconds
+            self.stage_calls[name] += 1
+
+    @contextlib.contextmanager
+    def busy(self):
+        """Wrap the handling of one image; time outside it counts as idle."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.busy_seconds += time.perf_counter() - started
+
+    def image_done(self, boxes):
+        """Record one processed image; boxes is None if the image could not be read."""
+        with self.lock:
+            if boxes is None:
+                self.unreadable += 1
+            else:
+                self.images += 1
+                self.boxes += boxes
+            self.queue_depth["images"] = max(0, self.queue_depth["images"] - 1)
+
+    def set_queue(self, **depths):
+        with self.lock:
+            self.queue_depth.update(depths)
+
+    def snapshot(self):
+        with self.lock:
+            uptime = time.perf_counter() - self.started
+            return {
+                "timestamp": round(time.time(), 3),
+                "uptime_seconds": round(uptime, 3),
+                "images": self.images,
+                "unreadable": self.unreadable,
+                "boxes": self.boxes,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "utilization": round(self.busy_seconds / uptime, 4) if uptime > 0 else 0.0,
+                "stage_seconds": {k: round(v, 4) for k, v in self.stage_seconds.items()},
+                "stage_calls": dict(self.stage_calls),
+                "queue_depth": dict(self.queue_depth),
+            }
+
+
+def stage_of(metrics, name):
+    """metrics.stage(name), or a no-op context when metrics is None."""
+    return metrics.stage(name) if metrics is not None else _DISABLED
+
+
+def busy_of(metrics):
+    return metrics.busy() if metrics is not None else _DISABLED
+
+
+def prometheus_text(metrics, snap):
+    labels = f'worker="{metrics.worker}",host="{metrics.host}"'
+    lines = [
+        "# HELP detection_images_total Images processed, by result.",
+        "# TYPE detection_images_total counter",
+        f'detection_images_total{{{labels},result="ok"}} {snap["images"]}',
+        f'detection_images_total{{{labels},result="unreadable"}} {snap["unreadable"]}',
+        "# HELP detection_boxes_total Detections kept after NMS.",
+        "# TYPE detection_boxes_total counter",
+        f"detection_boxes_total{{{labels}}} {snap['boxes']}",
+        "# HELP detection_stage_seconds_total Time spent in each pipeline stage.",
+        "# TYPE detection_stage_seconds_total counter",
+    ]
+    lines += [f'detection_stage_seconds_total{{{labels},stage="{s}"}} {snap["stage_seconds"][s]}' for s in STAGES]
+    lines += ["# HELP detection_stage_calls_total Runs of each pipeline stage.",
+              "# TYPE detection_stage_calls_total counter"]
+    lines += [f'detection_stage_calls_total{{{labels},stage="{s}"}} {snap["stage_calls"][s]}' for s in STAGES]
+    lines += ["# HELP detection_queue_depth Work waiting: images in this run or chunk, chunks in the shared queue.",
+              "# TYPE detection_queue_depth gauge"]
+    lines += [f'detection_queue_depth{{{labels},queue="{q}"}} {snap["queue_depth"][q]}' for q in QUEUES]
+    lines += [
+        "# HELP detection_worker_busy_seconds_total Time spent handling images.",
+        "# TYPE detection_worker_busy_seconds_total counter",
+        f"detection_worker_busy_seconds_total{{{labels}}} {snap['busy_seconds']}",
+        "# HELP detection_worker_uptime_seconds Time since the worker started.",
+        "# TYPE detection_worker_uptime_seconds gauge",
+        f"detection_worker_uptime_seconds{{{labels}}} {snap['uptime_seconds']}",
+        "# HELP detection_worker_utilization Busy fraction of uptime.",
+        "# TYPE detection_worker_utilization gauge",
+        f"detection_worker_utilization{{{labels}}} {snap['utilization']}",
+        "# HELP detection_metrics_timestamp_seconds When this file was written.",
+        "# TYPE detection_metrics_timestamp_seconds gauge",
+        f"detection_metrics_timestamp_seconds{{{labels}}} {snap['timestamp']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+CSV_FIELDS = (["timestamp", "uptime_seconds", "images", "unreadable", "boxes", "busy_seconds", "utilization"]
+              + [f"{s}_seconds" for s in STAGES] + [f"queue_{q}" for q in QUEUES])
+
+
+def csv_row(snap):
+    row = {k: snap[k] for k in CSV_FIELDS[:7]}
+    row.update({f"{s}_seconds": snap["stage_seconds"][s] for s in STAGES})
+    row.update({f"queue_{q}": snap["queue_depth"][q] for q in QUEUES})
+    return row
+
+
+class MetricsWriter(threading.Thread):
+    """Writes the .prom file and appends a CSV row every interval; stop() appends a last row and removes the .prom."""
+
+    def __init__(self, metrics, folder, interval=METRICS_INTERVAL):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.interval = interval
+        self.stop_event = threading.Event()
+        os.makedirs(folder, exist_ok=True)
+        self.prom_path = os.path.join(folder, f"{metrics.worker}.prom")
+        self.csv_path = os.path.join(folder, f"{metrics.worker}.csv")
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        snap = self.metrics.snapshot()
+        try:
+            tmp = f"{self.prom_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(prometheus_text(self.metrics, snap))
+            os.replace(tmp, self.prom_path)
+            new_file = not os.path.exists(self.csv_path)
+            with open(self.csv_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(csv_row(snap))
+        except OSError as e:
+            print(f"Could not write detection metrics: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.write()
+        try:
+            os.remove(self.prom_path)
+        except OSError:
+            pass
+
+
+def start_metrics(folder, worker=None, interval=METRICS_INTERVAL):
+    """(metrics, writer) for a metrics folder, or (None, None) when folder is not set."""
+    if not folder:
+        return None, None
+    metrics = PipelineMetrics(worker)
+    writer = MetricsWriter(metrics, folder, interval)
+    writer.start()
+    return metrics, writer
@@ -0,0 +1,171 @@
+"""Background model-assisted pre-labeling for BoundingBoxLabeler.
+
+The worker walks unlabeled images outward from the annotator's current
+position (upcoming images first, then earlier ones) and writes YOLO txt
+proposals into ``<project>/Proposals``. A proposal file uses exactly the
+``cls cx cy w h`` layout of ``Box_labels``; living in ``Proposals`` is what
+marks its boxes as unconfirmed. Saving the image in the labeler writes the
+(corrected) boxes to ``Box_labels`` and removes the proposal.
+
+The raw predictions, with confidences, are also cached in
+``<project>/Predictions`` for uncertainty ranking (see active_learning.py).
+"""
+
+import os
+import threading
+import time
+import uuid
+
+PROPOSALS_FOLDER = "Proposals"
+PREDICTIONS_FOLDER = "Predictions"
+
+
+def make_yolo_detector(model_path, conf_thres=0.3, iou_thres=0.4):
+    """Return detect(image_path) -> (image_shape, [(x1, y1, x2, y2, conf, class_id, label)])."""
+    from Test_mode import load_yolo_model, detect_image
+
+    model = load_yolo_model(model_path, conf_thres, iou_thres)
+
+    def detect(image_path):
+        img, detections = detect_image(model, image_path, iou_thres, draw=False)
+        if img is None:
+            return None, []
+        return img.shape, detections
+
+    return detect
+
+
+def write_proposals(path, detections, img_shape, class_names, with_conf=False, warned=None):
+    """Write detections as YOLO lines indexed by the project's ``class_names``.
+
+    Detections whose label is not a project class are skipped: the model's
+    own class_id means nothing in classes.txt. Each unknown label is
+    reported once per ``warned`` set.
+    """
+    h, w = img_shape[:2]
+    lines = []
+    warned = set() if warned is None else warned
+    for x1, y1, x2, y2, conf, class_id, label in detections:
+        if label not in class_names:
+            if label not in warned:
+                warned.add(label)
+                print(f"Pre-label: skipping '{label}' detections, not in classes.txt")
+            continue
+        cls_idx = class_names.index(label)
+        cx = ((x1 + x2) / 2) / w
+        cy = ((y1 + y2) / 2) / h
+        bw = (x2 - x1) / w
+        bh = (y2 - y1) / h
+        line = f"{cls_idx} {cx:.6f} {cy:.6f} {bw:.6f} {bh:.6f}"
+        lines.append(f"{line} {conf:.5f}\n" if with_conf else f"{line}\n")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(tmp_path, path)
+
+
+class PreLabelWorker(threading.Thread):
+    """Computes proposals for unlabeled images, nearest to ``get_index()`` first.
+
+    ``get_files()`` returns the labeler's current image order, so the walk
+    follows the list even after it is re-sorted. Only plain counters are
+    shared with the UI thread; the labeler polls ``queue_depth`` /
+    ``throughput`` from a Tk ``after`` callback.
+    """
+
+    def __init__(self, image_folder, labels_folder, proposals_folder, get_files,
+                 get_index, get_class_names, detector_factory, predictions_folder=None,
+                 labeled=None, is_labeled=None):
+        super().__init__(daemon=True)
+        self.image_folder = image_folder
+        self.labels_folder = labels_folder
+        self.proposals_folder = proposals_folder
+        self.predictions_folder = predictions_folder
+        self.get_files = get_files
+        self.get_index = get_index
+        self.get_class_names = get_class_names
+        self.detector_factory = detector_factory
+        self.is_labeled = is_labeled or (
+            lambda stem: os.path.exists(os.path.join(labels_folder, f"{stem}.txt")))
+        self.stop_event = threading.Event()
+
+        os.makedirs(proposals_folder, exist_ok=True)
+        if predictions_folder:
+            os.makedirs(predictions_folder, exist_ok=True)
+        if labeled is None:
+            labeled = {os.path.splitext(f)[0] for f in os.listdir(labels_folder)}
+        proposed = {os.path.splitext(f)[0] for f in os.listdir(proposals_folder) if f.endswith(".txt")}
+        self.total = len(get_files())
+        self.done = {f for f in get_files()
+                     if os.path.splitext(f)[0] in labeled or os.path.splitext(f)[0] in proposed}
+
+        self.queue_depth = self.total - len(self.done)
+        self.processed = 0
+        self.last_proposed = None
+        self.throughput = 0.0  # images / second, smoothed
+        self.status = "loading model"
+        self.error = None
+        self.unknown_labels = set()
+
+    def mark_labeled(self, fname):
+        if fname not in self.done:
+            self.done.add(fname)
+            self.queue_depth = self.total - len(self.done)
+
+    def next_file(self):
+        files = self.get_files()
+        n = len(files)
+        start = min(max(self.get_index(), 0), n - 1)
+        # upcoming images first, then walk backwards from the current one
+        for i in range(start, n):
+            if files[i] not in self.done:
+                return files[i]
+        for i in range(start - 1, -1, -1):
+            if files[i] not in self.done:
+                return files[i]
+        return None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        try:
+            detect = self.detector_factory()
+        except Exception as e:
+            self.error = str(e)
+            self.status = "model failed to load"
+            return
+
+        self.status = "running"
+        while not self.stop_event.is_set():
+            fname = self.next_file()
+            if fname is None:
+                self.status = "idle"
+                self.stop_event.wait(1.0)
+                continue
+
+            self.status = "running"
+            stem = os.path.splitext(fname)[0]
+            started = time.perf_counter()
+            try:
+                shape, detections = detect(os.path.join(self.image_folder, fname))
+            except Exception as e:
+                print(f"Pre-label failed for {fname}: {e}")
+                shape, detections = None, []
+            # the annotator may have saved real labels while we were running
+            if shape is not None and not self.is_labeled(stem):
+                write_proposals(os.path.join(self.proposals_folder, f"{stem}.txt"),
+                                detections, shape, self.get_class_names(),
+                                warned=self.unknown_labels)
+            if shape is not None and self.predictions_folder:
+                write_proposals(os.path.join(self.predictions_folder, f"{stem}.txt"),
+                                detections, shape, self.get_class_names(), with_conf=True,
+                                warned=self.unknown_labels)
+            self.mark_labeled(fname)
+
+            elapsed = max(time.perf_counter() - started, 1e-6)
+            rate = 1.0 / elapsed
+            self.throughput = rate if self.processed == 0 else 0.8 * self.throughput + 0.2 * rate
+            self.processed += 1
+            if shape is not None:
+                self.last_proposed = fname
@@ -0,0 +1,119 @@
+"""Frame coalescing for canvas redraws.
+
+Tk delivers motion and wheel events faster than a full redraw completes, so
+redrawing from each handler lets events pile up and the view trails the
+mouse. Handlers instead update their state and call ``request()``; the
+scheduler runs the redraw at most once per frame interval, from an idle
+callback, after Tk has drained the pending events. All requests made in
+between collapse into that one redraw.
+
+Requests made while the user zooms or pans pass ``interactive=True``: the
+render callback sees ``interacting`` set and can use a cheap filter, and
+once no interactive request has arrived for ``settle_ms`` the scheduler
+renders one more frame with ``interacting`` cleared, for full quality.
+
+Given a ``PerfHud``, each redraw is timed as the ``frame`` stage, the HUD
+is drawn on top of it, and the frame counters (``counts()``) appear in the
+HUD and the performance report. With ``LABELER_PERF`` set, a named
+scheduler also prints them when its widget is destroyed.
+"""
+
+import os
+import time
+
+from perf_hud import PERF_ENV
+
+FRAME_MS = 16
+SETTLE_MS = 150
+
+
+class RenderScheduler:
+    """Runs ``render`` for the latest state at most once per ``interval_ms``."""
+
+    def __init__(self, widget, render, interval_ms=FRAME_MS, settle_ms=SETTLE_MS, name=None, hud=None):
+        self.widget = widget
+        self.render = render
+        self.hud = hud
+        self.interval = interval_ms / 1000
+        self.settle_ms = settle_ms
+        self.name = name
+        self.pending = None
+        self.settle = None
+        self.interacting = False
+        self.last_render = 0.0
+        self.requested = 0
+        self.rendered = 0
+        if hud is not None:
+            hud.stats.counters["redraws"] = self.counts
+        widget.bind("<Destroy>", self._destroyed, add="+")
+
+    def request(self, interactive=False):
+        """Mark the view dirty; the redraw happens on the next frame."""
+        if interactive:
+            self.interacting = True
+            self.cancel_settle()
+            self.settle = self.widget.after(self.settle_ms, self._settled)
+        self.requested += 1
+        if self.pending is not None:
+            return
+        wait = self.interval - (time.perf_counter() - self.last_render)
+        if wait > 0:
+            self.pending = self.widget.after(int(wait * 1000) + 1, self._idle)
+        else:
+            self.pending = self.widget.after_idle(self._run)
+
+    def render_now(self):
+        """Redraw immediately (e.g. after loading an image), replacing any scheduled frame."""
+        self.requested += 1
+        self.cancel()
+        self._run()
+
+    def _settled(self):
+        self.settle = None
+        self.interacting = False
+        self.request()
+
+    def cancel(self):
+        if self.pending is not None:
+            self.widget.after_cancel(self.pending)
+            self.pending = None
+
+    def cancel_settle(self):
+        if self.settle is not None:
+            self.widget.after_cancel(self.settle)
+            self.settle = None
+
+    def _idle(self):
+        # the interval has passed; still wait until Tk has handled queued input
+        self.pending = self.widget.after_idle(self._run)
+
+    def _run(self):
+        self.pending = None
+        self.last_render = time.perf_counter()
+        self.rendered += 1
+        if self.hud is None:
+            self.render()
+            return
+        with self.hud.stats.stage("frame"):
+            self.render()
+        self.hud.draw()
+
+    @property
+    def dropped(self):
+        """Requests that were folded into a later frame instead of rendering on their own."""
+        return self.requested - self.rendered - (1 if self.pending is not None else 0)
+
+    def counts(self):
+        return {"requested": self.requested, "rendered": self.rendered, "dropped": self.dropped}
+
+    def describe(self):
+        return f"rendered {self.rendered} frames, dropped {self.dropped} of {self.requested} redraw requests"
+
+    def _destroyed(self, event):
+        if event.widget is not self.widget:
+            return
+        # a frame or settle render still scheduled would draw on the destroyed canvas
+        self.cancel()
+        self.cancel_settle()
+        if self.name and self.requested and os.environ.get(PERF_ENV):
+            print(f"{self.name}: {self.describe()}")
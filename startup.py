@@ -0,0 +1,84 @@
+"""Startup timing and background warm-up of the heavy labeling modules.
+
+The login window only needs tkinter. cv2, numpy, PIL and the labeling
+modules are imported on a background thread while the user types
+credentials; if a labeling mode is opened before the warm-up finishes, the
+normal import simply waits on the import lock for the module in progress.
+
+Set ``LABELER_STARTUP_REPORT=<path>`` (or pass ``--startup-report <path>``)
+to write the measured times as JSON, so cold-start regressions are visible.
+"""
+
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+PROCESS_START = time.perf_counter()
+
+# imported in this order; later entries reuse what earlier ones already loaded
+WARM_MODULES = ("numpy", "cv2", "PIL.Image", "PIL.ImageTk", "Bounding_box", "Segment_label")
+
+
+class StartupTimer:
+    def __init__(self):
+        self.marks = {}
+        self.imports = {}
+        self.lock = threading.Lock()
+
+    def mark(self, name):
+        with self.lock:
+            self.marks[name] = round(time.perf_counter() - PROCESS_START, 4)
+
+    def timed_import(self, name):
+        started = time.perf_counter()
+        already_loaded = name in sys.modules
+        module = importlib.import_module(name)
+        with self.lock:
+            self.imports.setdefault(name, round(0.0 if already_loaded else time.perf_counter() - started, 4))
+        return module
+
+    def report(self):
+        with self.lock:
+            return {"frozen": bool(getattr(sys, "frozen", False)),
+                    "marks_seconds": dict(self.marks),
+                    "imports_seconds": dict(self.imports)}
+
+    def write_report(self, path=None):
+        path = path or report_path()
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.report(), f, indent=2)
+        except OSError as e:
+            print(f"Could not write startup report: {e}")
+
+
+def report_path():
+    if "--startup-report" in sys.argv:
+        idx = sys.argv.index("--startup-report")
+        if idx + 1 < len(sys.argv):
+            return sys.argv[idx + 1]
+    return os.environ.get("LABELER_STARTUP_REPORT")
+
+
+TIMER = StartupTimer()
+
+
+def warm_imports(modules=WARM_MODULES):
+    """Import modules on a daemon thread. Failures are left for the real import to report."""
+    def worker():
+        for name in modules:
+            try:
+                TIMER.timed_import(name)
+            except Exception as e:
+                print(f"Warm-up import of {name} failed: {e}")
+        TIMER.mark("warm_imports_done")
+        TIMER.write_report()
+
+    thread = threading.Thread(target=worker, name="import-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,164 @@
+"""Superpixel index for the segmentation labeler's smart-fill tools.
+
+Each image is over-segmented once, in the background, when it is loaded or
+prefetched. SLIC from opencv-contrib (``cv2.ximgproc``) is used when it is
+installed; otherwise a watershed grown from grid seeds gives edge-following
+regions of the same size. Large images are segmented at a reduced working
+resolution (longest side ``MAX_SIDE``) and fills are mapped back to full
+resolution, so the index stays small even for very large images.
+"""
+
+import threading
+import queue
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from image_session import open_session
+
+REGION_SIZE = 24
+MAX_SIDE = 2048
+
+
+def _slic(image, region_size):
+    slic = cv2.ximgproc.createSuperpixelSLIC(cv2.cvtColor(image, cv2.COLOR_BGR2LAB),
+                                             algorithm=cv2.ximgproc.SLICO, region_size=region_size)
+    slic.iterate(10)
+    slic.enforceLabelConnectivity()
+    return slic.getLabels()
+
+
+def _grid_watershed(image, region_size):
+    h, w = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8))
+    # one seed per grid cell, nudged to the flattest pixel nearby so seeds avoid edges
+    local_min = cv2.erode(gradient, np.ones((5, 5), np.uint8))
+    markers = np.zeros((h, w), np.int32)
+    label = 1
+    for y in range(region_size // 2, h, region_size):
+        for x in range(region_size // 2, w, region_size):
+            y1, x1 = max(0, y - 2), max(0, x - 2)
+            window = gradient[y1:y + 3, x1:x + 3]
+            dy, dx = np.unravel_index(np.argmin(window), window.shape)
+            if window[dy, dx] <= local_min[y, x] + 2:
+                y, x = y1 + dy, x1 + dx
+            markers[y, x] = label
+            label += 1
+    cv2.watershed(image, markers)
+    # watershed marks boundaries with -1: give them a neighbouring region's label
+    boundary = markers < 1
+    if boundary.any():
+        grown = cv2.dilate(markers.astype(np.float32), np.ones((3, 3), np.uint8)).astype(np.int32)
+        markers[boundary] = grown[boundary]
+    return markers
+
+
+def compute_superpixels(image, region_size=REGION_SIZE, max_side=MAX_SIDE):
+    """Label image (int32, working resolution) for a BGR image."""
+    h, w = image.shape[:2]
+    factor = min(1.0, max_side / max(h, w))
+    if factor < 1.0:
+        image = cv2.resize(image, (max(1, int(w * factor)), max(1, int(h * factor))), interpolation=cv2.INTER_AREA)
+    if hasattr(cv2, "ximgproc"):
+        return _slic(image, region_size)
+    return _grid_watershed(image, region_size)
+
+
+class SuperpixelIndex:
+    """Superpixel labels plus per-segment sizes and boxes, mapped onto a full-resolution image."""
+
+    def __init__(self, labels, full_shape):
+        _, inverse = np.unique(labels, return_inverse=True)
+        self.labels = inverse.reshape(labels.shape).astype(np.int32)
+        self.full_h, self.full_w = full_shape[:2]
+        self.low_h, self.low_w = self.labels.shape
+        flat = self.labels.ravel()
+        order = np.argsort(flat, kind="stable")
+        self.sizes = np.bincount(flat)
+        starts = np.concatenate(([0], np.cumsum(self.sizes)[:-1]))
+        ys, xs = np.divmod(order, self.low_w)
+        self.y_min = np.minimum.reduceat(ys, starts)
+        self.y_max = np.maximum.reduceat(ys, starts)
+        self.x_min = np.minimum.reduceat(xs, starts)
+        self.x_max = np.maximum.reduceat(xs, starts)
+
+    def _to_low(self, x, y):
+        x = min(max(int(x), 0), self.full_w - 1)
+        y = min(max(int(y), 0), self.full_h - 1)
+        return x * self.low_w // self.full_w, y * self.low_h // self.full_h
+
+    def segment_at(self, x, y):
+        lx, ly = self._to_low(x, y)
+        return np.array([self.labels[ly, lx]])
+
+    def segments_in_rect(self, x1, y1, x2, y2, min_overlap=0.5):
+        """Segments with at least min_overlap of their area inside the full-resolution rectangle."""
+        lx1, ly1 = self._to_low(min(x1, x2), min(y1, y2))
+        lx2, ly2 = self._to_low(max(x1, x2), max(y1, y2))
+        inside = np.bincount(self.labels[ly1:ly2 + 1, lx1:lx2 + 1].ravel(), minlength=len(self.sizes))
+        return np.flatnonzero(inside >= min_overlap * self.sizes)
+
+    def region(self, segments):
+        """Full-resolution bounding box (x1, y1, x2, y2), exclusive end, and the boolean selection inside it."""
+        if len(segments) == 0:
+            return None
+        ly1, ly2 = self.y_min[segments].min(), self.y_max[segments].max() + 1
+        lx1, lx2 = self.x_min[segments].min(), self.x_max[segments].max() + 1
+        # full-res pixel y belongs to working row y * low_h // full_h
+        y1 = -(-ly1 * self.full_h // self.low_h)
+        y2 = -(-ly2 * self.full_h // self.low_h)
+        x1 = -(-lx1 * self.full_w // self.low_w)
+        x2 = -(-lx2 * self.full_w // self.low_w)
+        selected = np.isin(self.labels[ly1:ly2, lx1:lx2], segments)
+        rows = np.arange(y1, y2) * self.low_h // self.full_h - ly1
+        cols = np.arange(x1, x2) * self.low_w // self.full_w - lx1
+        return (int(x1), int(y1), int(x2), int(y2)), selected[rows][:, cols]
+
+
+class SuperpixelCache(threading.Thread):
+    """Computes indexes on a background thread and keeps the most recent few."""
+
+    def __init__(self, keep=4):
+        super().__init__(daemon=True)
+        self.keep = keep
+        self.jobs = queue.Queue()
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+        self.start()
+
+    def request(self, image_path, session=None):
+        """Queue image_path; pass its already-open session to avoid reading it twice."""
+        with self.lock:
+            if image_path in self.indexes:
+                self.indexes.move_to_end(image_path)
+                return
+        self.jobs.put((image_path, session))
+
+    def get(self, image_path):
+        with self.lock:
+            return self.indexes.get(image_path)
+
+    def run(self):
+        while True:
+            image_path, session = self.jobs.get()
+            if self.get(image_path) is not None:
+                continue
+            if session is None:
+                session = open_session(image_path)
+                if not session.loaded:
+                    continue
+            try:
+                # large images are segmented from a reduced pyramid level, never decoded whole
+                image = session.level_for_side(MAX_SIDE)
+                if image is None:
+                    continue  # a very large image that could not be converted
+                index = SuperpixelIndex(compute_superpixels(image), session.shape)
+            except cv2.error as e:
+                print(f"Superpixels failed for {image_path}: {e}")
+                continue
+            with self.lock:
+                self.indexes[image_path] = index
+                while len(self.indexes) > self.keep:
+                    self.indexes.popitem(last=False)
@@ -0,0 +1,14 @@
+import numpy as np
+
+from active_learning import score_predictions
+
+
+def test_empty_prediction_file_ranks_as_most_uncertain():
+    # image 0: one confident box, image 1: no boxes, image 2: one unsure box
+    pred = np.array([[0, 0, 0.5, 0.5, 0.2, 0.2, 0.99],
+                     [2, 0, 0.5, 0.5, 0.2, 0.2, 0.7]])
+
+    scores = score_predictions(pred, 3)
+
+    assert scores[1] == 1.0
+    assert list(np.argsort(-scores)) == [1, 2, 0]
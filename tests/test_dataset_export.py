@@ -0,0 +1,53 @@
+import json
+import struct
+
+import cv2
+import numpy as np
+
+from dataset_export import export_dataset
+
+
+def rotated_jpeg(path, width, height, orientation):
+    """A width x height JPEG whose EXIF says to rotate it on display."""
+    ok, data = cv2.imencode(".jpg", np.zeros((height, width, 3), np.uint8))
+    ifd = struct.pack("<H", 1) + struct.pack("<HHIHH", 0x0112, 3, 1, orientation, 0) + struct.pack("<I", 0)
+    exif = b"Exif\x00\x00" + b"II*\x00" + struct.pack("<I", 8) + ifd
+    data = data.tobytes()
+    with open(path, "wb") as f:
+        f.write(data[:2] + b"\xff\xe1" + struct.pack(">H", len(exif) + 2) + exif + data[2:])
+
+
+def test_coco_sizes_follow_exif_orientation(tmp_path):
+    project = tmp_path / "project"
+    (project / "images").mkdir(parents=True)
+    (project / "Box_labels").mkdir()
+    image_path = project / "images" / "phone.jpg"
+    rotated_jpeg(str(image_path), 40, 30, 6)
+    (project / "Box_labels" / "phone.txt").write_text("0 0.5 0.25 0.2 0.1\n")
+    (project / "classes.txt").write_text("0 car 255 0 0\n")
+
+    counts = export_dataset(str(project), str(tmp_path / "out"), "coco", ratios=(1.0, 0.0, 0.0))
+
+    assert counts["train"] == 1
+    coco = json.loads((tmp_path / "out" / "instances_train.json").read_text())
+    image = coco["images"][0]
+    decoded_h, decoded_w = cv2.imread(str(image_path)).shape[:2]
+    assert (image["width"], image["height"]) == (decoded_w, decoded_h) == (30, 40)
+    assert coco["annotations"][0]["bbox"] == [12.0, 8.0, 6.0, 4.0]
+
+
+def test_coco_counts_images_of_unknown_size_as_skipped(tmp_path, capsys):
+    project = tmp_path / "project"
+    (project / "images").mkdir(parents=True)
+    (project / "Box_labels").mkdir()
+    cv2.imwrite(str(project / "images" / "good.png"), np.zeros((10, 20, 3), np.uint8))
+    (project / "images" / "broken.jpg").write_bytes(b"not an image")
+    for stem in ("good", "broken"):
+        (project / "Box_labels" / f"{stem}.txt").write_text("0 0.5 0.5 0.2 0.2\n")
+    (project / "classes.txt").write_text("0 car 255 0 0\n")
+
+    counts = export_dataset(str(project), str(tmp_path / "out"), "coco", ratios=(1.0, 0.0, 0.0))
+
+    assert counts["train"] == 1
+    assert counts["skipped"] == 1
+    assert "broken.jpg" in capsys.readouterr().out
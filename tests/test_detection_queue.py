@@ -0,0 +1,68 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from detection_queue import init_queue, output_paths, queue_status, run_worker
+
+
+def make_images(folder, names):
+    os.makedirs(folder, exist_ok=True)
+    for name in names:
+        cv2.imwrite(os.path.join(folder, name), np.zeros((8, 8, 3), np.uint8))
+
+
+def test_worker_drops_a_chunk_re_leased_to_someone_else(tmp_path):
+    images = tmp_path / "images"
+    make_images(images, ["a.png", "b.png"])
+    queue = str(tmp_path / "queue")
+    init_queue(queue, str(images), chunk_size=10, lease_seconds=1)
+    leased_path = os.path.join(queue, "leased", "chunk_000000.json")
+    calls = []
+
+    def process(image_path, output_dir):
+        calls.append(image_path)
+        if len(calls) == 1:
+            # the chunk was reclaimed and another worker leased it meanwhile
+            with open(leased_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            manifest["owner"] = "someone-else"
+            with open(leased_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+        return []
+
+    committed = run_worker(queue, process, "w1", poll_seconds=0.05)
+
+    assert committed == 1
+    assert len(calls) == 4  # first lease abandoned, chunk redone after it expired
+    assert queue_status(queue)["done"] == 1
+
+
+def test_outputs_mirror_the_image_sub_folders(tmp_path):
+    images, out = str(tmp_path / "images"), str(tmp_path / "out")
+    a = output_paths(os.path.join(images, "cam1", "0001.jpg"), images, out)
+    b = output_paths(os.path.join(images, "cam2", "0001.jpg"), images, out)
+
+    assert a == (os.path.join(out, "cam1", "0001.jpg"), os.path.join(out, "labels", "cam1", "0001.txt"))
+    assert a != b
+
+
+def test_a_failing_image_does_not_abort_the_chunk(tmp_path):
+    images = tmp_path / "images"
+    make_images(images, ["a.png", "b.png", "c.png"])
+    queue = str(tmp_path / "queue")
+    init_queue(queue, str(images), chunk_size=10)
+
+    def process(image_path, output_dir):
+        if image_path.endswith("b.png"):
+            raise RuntimeError("corrupt")
+        return [[0, 0, 1, 1, 0.9, 0, "x"]]
+
+    assert run_worker(queue, process, "w1", poll_seconds=0.05) == 1
+    with open(os.path.join(queue, "results", "chunk_000000.json"), "r", encoding="utf-8") as f:
+        result = json.load(f)
+    by_name = {os.path.basename(k): v for k, v in result["detections"].items()}
+    assert by_name["b.png"] is None
+    assert by_name["a.png"] and by_name["c.png"]
+    assert [os.path.basename(k) for k in result["errors"]] == ["b.png"]
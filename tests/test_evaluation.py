@@ -0,0 +1,39 @@
+import numpy as np
+
+from evaluation import confusion_matrix, evaluate
+
+
+def write_labels(folder, stem, rows):
+    folder.mkdir(exist_ok=True)
+    (folder / f"{stem}.txt").write_text("".join(" ".join(str(v) for v in row) + "\n" for row in rows))
+
+
+def test_confident_prediction_wins_over_higher_iou(tmp_path):
+    write_labels(tmp_path / "gt", "a", [(0, 0.5, 0.5, 0.2, 0.2)])
+    # the confident prediction overlaps at IoU ~0.9, the unconfident one exactly
+    write_labels(tmp_path / "pred", "a", [(0, 0.505, 0.505, 0.2, 0.2, 0.9), (0, 0.5, 0.5, 0.2, 0.2, 0.1)])
+
+    report = evaluate(str(tmp_path / "gt"), str(tmp_path / "pred"), ["car"])
+
+    assert report["per_class"]["car"]["tp"] == 1
+    assert report["map50"] == 1.0
+
+
+def test_second_best_overlap_is_still_matched(tmp_path):
+    write_labels(tmp_path / "gt", "a", [(0, 0.20, 0.5, 0.1, 0.1), (0, 0.24, 0.5, 0.1, 0.1)])
+    write_labels(tmp_path / "pred", "a", [(0, 0.20, 0.5, 0.1, 0.1, 0.9), (0, 0.215, 0.5, 0.1, 0.1, 0.8)])
+
+    report = evaluate(str(tmp_path / "gt"), str(tmp_path / "pred"), ["car"])
+
+    car = report["per_class"]["car"]
+    assert (car["tp"], car["fp"], car["fn"]) == (2, 0, 0)
+
+
+def test_confusion_matrix_matches_by_confidence():
+    gt = np.array([[0, 1, 0.5, 0.5, 0.2, 0.2]])
+    pred = np.array([[0, 1, 0.505, 0.505, 0.2, 0.2, 0.9], [0, 0, 0.5, 0.5, 0.2, 0.2, 0.1]])
+
+    matrix = confusion_matrix(gt, pred, 2)
+
+    assert matrix[1, 1] == 1  # the confident, correctly classed box matched
+    assert matrix[0, 2] == 1  # the other is a background false positive
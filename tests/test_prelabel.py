@@ -0,0 +1,17 @@
+from prelabel import write_proposals
+
+
+def test_unknown_labels_are_skipped_not_reindexed(tmp_path, capsys):
+    path = tmp_path / "a.txt"
+    detections = [
+        (0, 0, 50, 50, 0.9, 0, "person"),   # model index 0, project index 1
+        (50, 50, 100, 100, 0.8, 1, "dog"),  # not a project class
+        (0, 50, 50, 100, 0.7, 1, "dog"),
+    ]
+    warned = set()
+    write_proposals(path, detections, (100, 100, 3), ["car", "person"], warned=warned)
+
+    lines = path.read_text().splitlines()
+    assert lines == ["1 0.250000 0.250000 0.500000 0.500000"]
+    assert warned == {"dog"}
+    assert capsys.readouterr().out.count("'dog'") == 1
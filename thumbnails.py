@@ -0,0 +1,364 @@
+"""Persistent thumbnail cache and the thumbnail grid used to browse a folder.
+
+Thumbnails for a folder live in ``<folder>/.thumbnails/``: every thumbnail is
+a small JPEG appended to one packed file (``thumbs_<size>.bin``), and
+``thumbs_<size>.json`` maps each image name to its offset and length plus
+the size and mtime the image had when it was rendered. An image whose size
+or mtime changed gets a fresh thumbnail appended; the stale bytes are
+reclaimed by compaction when the cache is closed. Images that cannot be
+read are indexed with length 0, so they are not retried until they change.
+
+Browsers get the cache through ``acquire_cache()``: one ``ThumbnailCache``
+per folder is shared by every open browser and closed in the background
+when the last one releases it. Reopening a browser waits for that close to
+finish, so two caches never write the same files.
+
+Missing thumbnails are rendered by a small pool of worker threads (JPEGs
+use a 1/8 DCT-scaled decode). The grid asks for the visible cells first,
+and only visible rows hold Tk images, so folders of many thousands of
+images scroll smoothly.
+"""
+
+import io
+import json
+import math
+import os
+import threading
+
+import cv2
+import numpy as np
+import tkinter as tk
+from PIL import Image, ImageTk
+
+from catalog import open_catalog
+
+THUMB_FOLDER = ".thumbnails"
+THUMB_SIZE = 128
+SAVE_EVERY = 200
+
+_caches = {}  # (folder, size) -> ThumbnailCache
+_caches_lock = threading.Lock()
+
+
+def render_thumbnail(path, size=THUMB_SIZE):
+    """JPEG bytes of a thumbnail fitting size x size, or None if the image cannot be read."""
+    from tiled_image import needs_tiling
+    if needs_tiling(path):
+        from image_session import open_session
+        session = open_session(path)
+        image = session.level_for_side(size) if session.loaded else None  # waits for a conversion
+        image = None if image is None else np.asarray(image)
+    else:
+        image = None
+        if path.lower().endswith((".jpg", ".jpeg")):
+            image = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_8)
+            if image is not None and max(image.shape[:2]) < size:
+                image = None  # too small after reduction; decode normally
+        if image is None:
+            image = cv2.imread(path)
+    if image is None:
+        return None
+    h, w = image.shape[:2]
+    scale = min(1.0, size / max(h, w))
+    image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return data.tobytes() if ok else None
+
+
+class ThumbnailCache:
+    """Packed thumbnail file plus index for one folder, filled by background workers."""
+
+    def __init__(self, folder, size=THUMB_SIZE, workers=4):
+        self.folder = folder
+        self.size = size
+        self.catalog = open_catalog(folder)
+        cache_dir = os.path.join(folder, THUMB_FOLDER)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.data_path = os.path.join(cache_dir, f"thumbs_{size}.bin")
+        self.index_path = os.path.join(cache_dir, f"thumbs_{size}.json")
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.index = self._load_index()
+        if not os.path.exists(self.data_path):
+            open(self.data_path, "wb").close()
+        self.data = open(self.data_path, "r+b")
+        self.pending = []        # names to render, most urgent last
+        self.queued = set()
+        self.ready = []          # names in the order they were rendered; browsers keep their own position
+        self.unsaved = 0
+        self.closed = False
+        self.users = 0
+        self.closing = None      # thread running close() once the last browser released the cache
+        self.workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    # ---------------- index ----------------
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        # caller holds the lock; data is flushed first so the index never points past it
+        self.data.flush()
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+        self.unsaved = 0
+
+    def _stamp(self, name):
+        try:
+            st = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def is_fresh(self, name):
+        entry = self.index.get(name)
+        return entry is not None and entry[2:4] == self._stamp(name)
+
+    # ---------------- access ----------------
+    def get(self, name):
+        """Thumbnail JPEG bytes if a fresh one is cached, else None (also for unreadable images)."""
+        with self.lock:
+            if not self.is_fresh(name):
+                return None
+            offset, length = self.index[name][:2]
+            if not length:
+                return None
+            self.data.seek(offset)
+            return self.data.read(length)
+
+    def request(self, names):
+        """Render the given names soon, ahead of anything requested earlier."""
+        with self.lock:
+            todo = [n for n in names if not self.is_fresh(n)]
+            for name in reversed(todo):
+                if name in self.queued:
+                    self.pending.remove(name)
+                self.pending.append(name)
+                self.queued.add(name)
+            self.wakeup.notify_all()
+
+    def ready_since(self, seen):
+        """Names rendered after the first ``seen``, and the new count to pass next time."""
+        with self.lock:
+            return self.ready[seen:], len(self.ready)
+
+    # ---------------- workers ----------------
+    def _work(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.wakeup.wait()
+                if self.closed:
+                    return
+                name = self.pending.pop()
+                self.queued.discard(name)
+            blob = render_thumbnail(os.path.join(self.folder, name), self.size) or b""
+            with self.lock:
+                if self.closed:
+                    return
+                offset = self.data.seek(0, os.SEEK_END)
+                self.data.write(blob)
+                # an empty entry marks an unreadable image until it changes
+                self.index[name] = [offset, len(blob)] + (self._stamp(name) or [0, 0])
+                self.ready.append(name)
+                self.unsaved += 1
+                if self.unsaved >= SAVE_EVERY:
+                    self._save_index()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify_all()
+        for worker in self.workers:
+            worker.join(timeout=5)
+        with self.lock:
+            self._save_index()
+            live = sum(entry[1] for name, entry in self.index.items() if name in self.catalog.images)
+            if self.data.seek(0, os.SEEK_END) > 2 * live + 1024 * 1024:
+                self._compact()
+            self.data.close()
+
+    def _compact(self):
+        """Rewrite the packed file with only thumbnails of images still in the folder."""
+        tmp = f"{self.data_path}.tmp"
+        index = {}
+        with open(tmp, "wb") as out:
+            for name, (offset, length, *stamp) in self.index.items():
+                if name not in self.catalog.images:
+                    continue
+                self.data.seek(offset)
+                index[name] = [out.tell(), length] + stamp
+                out.write(self.data.read(length))
+        self.data.close()
+        os.replace(tmp, self.data_path)
+        self.data = open(self.data_path, "r+b")
+        self.index = index
+        self._save_index()
+
+
+def acquire_cache(folder, size=THUMB_SIZE):
+    """The shared cache for folder, opened if no browser holds it. Give it back with release_cache()."""
+    key = (os.path.abspath(folder), size)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is not None and cache.closing is not None:
+            cache.closing.join()  # the last browser's close may still be compacting these files
+            cache = None
+        if cache is None:
+            cache = _caches[key] = ThumbnailCache(folder, size)
+        cache.users += 1
+        return cache
+
+
+def release_cache(cache):
+    """Drop one browser's hold; the last one closes (and maybe compacts) the cache off the UI thread."""
+    with _caches_lock:
+        cache.users -= 1
+        if cache.users == 0:
+            cache.closing = threading.Thread(target=cache.close)
+            cache.closing.start()
+
+
+class ThumbnailBrowser:
+    """Scrollable thumbnail grid. Clicking a cell calls on_select(file name)."""
+
+    def __init__(self, parent, folder, files, on_select, current=None, size=THUMB_SIZE):
+        self.files = list(files)
+        self.on_select = on_select
+        self.current = current
+        self.size = size
+        self.cell = size + 28
+        self.cache = acquire_cache(folder, size)
+        self.seen = len(self.cache.ready)
+        self.closed = False
+        self.items = {}  # index -> (photo or None, [canvas item ids])
+
+        self.top = tk.Toplevel(parent)
+        self.top.title(f"Thumbnails - {len(self.files)} images")
+        self.top.geometry("900x700")
+        self.canvas = tk.Canvas(self.top, bg="#202020", highlightthickness=0)
+        scrollbar = tk.Scrollbar(self.top, orient="vertical", command=self.on_scroll)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", lambda e: self.layout())
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.scroll_units(-3))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll_units(3))
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.top.protocol("WM_DELETE_WINDOW", self.close)
+        self.columns = 1
+        self.top.after(100, self.poll)
+
+    # ---------------- layout ----------------
+    def layout(self):
+        columns = max(1, self.canvas.winfo_width() // self.cell)
+        if columns != self.columns:
+            self.columns = columns
+            self.clear_items()
+        rows = math.ceil(len(self.files) / self.columns)
+        self.canvas.configure(scrollregion=(0, 0, self.columns * self.cell, rows * self.cell))
+        if self.current in self.files and not self.items:
+            row = self.files.index(self.current) // self.columns
+            self.canvas.yview_moveto(max(0, row - 1) / max(1, rows))
+        self.refresh()
+
+    def visible_range(self, margin_rows=1):
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first_row = max(0, int(top // self.cell) - margin_rows)
+        last_row = int(bottom // self.cell) + margin_rows
+        return first_row * self.columns, min(len(self.files), (last_row + 1) * self.columns)
+
+    def refresh(self):
+        start, end = self.visible_range()
+        for index in [i for i in self.items if not start <= i < end]:
+            self.drop_item(index)
+        missing = []
+        for index in range(start, end):
+            if index not in self.items or self.items[index][0] is None:
+                if not self.draw_item(index):
+                    missing.append(self.files[index])
+        if missing:
+            self.cache.request(missing)
+
+    def draw_item(self, index):
+        """Draw cell index; returns False if its thumbnail is not cached yet (a placeholder is drawn)."""
+        if index in self.items:
+            self.drop_item(index)
+        name = self.files[index]
+        x = (index % self.columns) * self.cell + self.cell // 2
+        y = (index // self.columns) * self.cell
+        ids = []
+        blob = self.cache.get(name)
+        photo = ImageTk.PhotoImage(Image.open(io.BytesIO(blob))) if blob else None
+        if name == self.current:
+            ids.append(self.canvas.create_rectangle(x - self.cell // 2 + 2, y + 2, x + self.cell // 2 - 2,
+                                                    y + self.cell - 2, outline="#3d8bfd", width=2))
+        if photo is not None:
+            ids.append(self.canvas.create_image(x, y + 4 + self.size // 2, image=photo))
+        else:
+            ids.append(self.canvas.create_rectangle(x - self.size // 2, y + 4, x + self.size // 2, y + 4 + self.size,
+                                                    fill="#333333", outline=""))
+        label = os.path.basename(name)
+        if len(label) > 20:
+            label = label[:9] + "..." + label[-8:]
+        ids.append(self.canvas.create_text(x, y + self.size + 14, text=label, fill="#dddddd", font=("Arial", 8)))
+        self.items[index] = (photo, ids)
+        return photo is not None
+
+    def drop_item(self, index):
+        _, ids = self.items.pop(index)
+        for item in ids:
+            self.canvas.delete(item)
+
+    def clear_items(self):
+        for index in list(self.items):
+            self.drop_item(index)
+
+    # ---------------- events ----------------
+    def on_scroll(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def scroll_units(self, units):
+        self.canvas.yview_scroll(units, "units")
+        self.refresh()
+
+    def on_wheel(self, event):
+        self.scroll_units(-3 if event.delta > 0 else 3)
+
+    def on_click(self, event):
+        col = int(self.canvas.canvasx(event.x) // self.cell)
+        row = int(self.canvas.canvasy(event.y) // self.cell)
+        index = row * self.columns + col
+        if col < self.columns and 0 <= index < len(self.files):
+            self.on_select(self.files[index])
+            self.close()
+
+    def poll(self):
+        if self.closed:
+            return
+        ready, self.seen = self.cache.ready_since(self.seen)
+        ready = set(ready)
+        if ready:
+            start, end = self.visible_range()
+            for index in range(start, end):
+                if self.files[index] in ready:
+                    self.draw_item(index)
+        self.top.after(100, self.poll)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        release_cache(self.cache)
+        self.top.destroy()
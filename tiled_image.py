@@ -0,0 +1,450 @@
+"""Out-of-core image sources for very large images (aerial mosaics and the like).
+
+Images above ``TILED_MIN_PIXELS`` are never decoded into RAM by the labelers.
+Instead they are opened as a tiled session with the ``ImageSession``
+interface, whose ``render_view()`` reads only the viewport at the pyramid
+level that matches the zoom:
+
+* Tiled TIFF files are read tile by tile, straight from the file, using the
+  file's own reduced-resolution levels when it has them. This needs the
+  optional ``tifffile`` package; without it TIFFs are converted like any
+  other format.
+* Anything else is converted once into a pyramid cache next to the image
+  (``.pyramids/<file name>/level_<n>.npy``): full resolution plus 2x
+  downsampled levels, each memory-mapped, so the OS pages in only what is
+  on screen. The cache is rebuilt when the source's size or mtime changes.
+  Conversion decodes straight into the memory-mapped full-resolution level:
+  TIFFs strip by strip or tile by tile (with ``tifffile``), other formats
+  through ``cv2.imread`` into the mapped buffer (OpenCV 4.11+), so the
+  decoded image is never held in anonymous memory. Only when neither works
+  (older OpenCV, EXIF-rotated files) is the image decoded whole first.
+
+Conversion runs on a background thread. Until it finishes, the image opens
+as a ``ConvertingSession`` that shows a grey placeholder and reports
+``progress``; its ``full_ready`` is set once the pyramid is in place, as for
+progressive JPEG sessions. Every opener of the same image shares one
+conversion.
+
+Coordinates passed to and returned from sessions are always full-resolution
+pixels.
+"""
+
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from catalog import read_image_size
+from image_session import ImageSession
+
+TILED_MIN_PIXELS = 8192 * 8192
+PYRAMID_FOLDER = ".pyramids"
+MIN_LEVEL_SIDE = 512
+STRIP_ROWS = 1024
+PLACEHOLDER_SIDE = 1024
+PLACEHOLDER_GRAY = 96
+
+
+def needs_tiling(path):
+    size = read_image_size(path)
+    return size is not None and size[0] * size[1] >= TILED_MIN_PIXELS
+
+
+def pyramid_path(image_path):
+    folder, name = os.path.split(os.path.abspath(image_path))
+    return os.path.join(folder, PYRAMID_FOLDER, name)
+
+
+# ---------------- memory-mapped pyramid cache ----------------
+def _source_stamp(image_path):
+    st = os.stat(image_path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _to_bgr(pixels):
+    """BGR copy of a decoded TIFF segment (grey or RGB samples)."""
+    if pixels.shape[2] == 1:
+        return cv2.cvtColor(pixels, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(pixels[:, :, :3], cv2.COLOR_RGB2BGR)
+
+
+def _downsample_into(src, dst, progress=None):
+    """Area-downsample src into dst a strip at a time, so neither is ever fully resident."""
+    src_h, dst_h = src.shape[0], dst.shape[0]
+    for y in range(0, dst_h, STRIP_ROWS):
+        y2 = min(dst_h, y + STRIP_ROWS)
+        sy1, sy2 = y * src_h // dst_h, min(src_h, -(-y2 * src_h // dst_h))
+        dst[y:y2] = cv2.resize(np.asarray(src[sy1:sy2]), (dst.shape[1], y2 - y), interpolation=cv2.INTER_AREA)
+        if progress:
+            progress(y2 - y)
+
+
+def _decode_tiff_segments(image_path, level, progress):
+    """Decode a TIFF into level one strip or tile at a time. False if tifffile or the file's layout does not allow it."""
+    try:
+        import tifffile
+    except ImportError:
+        return False
+    h, w = level.shape[:2]
+    try:
+        with tifffile.TiffFile(image_path) as tif:
+            page = tif.pages[0]
+            orientation = page.tags.get(274)
+            if (page.dtype != np.uint8 or page.planarconfig != 1 or page.photometric not in (1, 2, 6)
+                    or (page.imagelength, page.imagewidth) != (h, w)
+                    or (orientation is not None and orientation.value != 1)):
+                return False
+            total = len(page.dataoffsets)
+            # one decoder and a small read buffer, so only a few segments are ever in memory
+            for n, (segment, index, shape) in enumerate(page.segments(maxworkers=1, buffersize=1 << 24), 1):
+                if segment is not None:
+                    y, x = index[-3], index[-2]
+                    pixels = segment.reshape(shape)[0][:h - y, :w - x]
+                    level[y:y + pixels.shape[0], x:x + pixels.shape[1]] = _to_bgr(pixels)
+                progress(n / total)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def _decode_into(image_path, level):
+    """cv2.imread straight into the mapped level. False if this OpenCV cannot (no dst overload, or the decode
+    would not match level's shape, e.g. an EXIF rotation)."""
+    try:
+        decoded = cv2.imread(image_path, level, cv2.IMREAD_COLOR)
+    except (TypeError, cv2.error):
+        return False
+    return decoded is not None and np.may_share_memory(decoded, level)
+
+
+def build_pyramid(image_path, progress=None):
+    """Convert image_path into its pyramid cache. Returns the cache folder, or None if it cannot be decoded.
+
+    ``progress(fraction)`` is called as the conversion advances: decoding is the first half, the
+    downsampled levels the second.
+    """
+    target = pyramid_path(image_path)
+    size = read_image_size(image_path)
+    if size is None:
+        return None
+    report = progress or (lambda fraction: None)
+    tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp)
+    try:
+        level_path = os.path.join(tmp, "level_0.npy")
+        shape = (size[1], size[0], 3)
+        level = np.lib.format.open_memmap(level_path, mode="w+", dtype=np.uint8, shape=shape)
+        decoded = (image_path.lower().endswith((".tif", ".tiff"))
+                   and _decode_tiff_segments(image_path, level, lambda f: report(f / 2)))
+        if not decoded and not _decode_into(image_path, level):
+            image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+            if image is None:
+                del level
+                return None
+            if image.shape != level.shape:
+                del level
+                level = np.lib.format.open_memmap(level_path, mode="w+", dtype=np.uint8, shape=image.shape)
+            level[:] = image
+            del image
+        report(0.5)
+
+        shapes = [level.shape]
+        while max(shapes[-1][:2]) > MIN_LEVEL_SIDE:
+            shapes.append(((shapes[-1][0] + 1) // 2, (shapes[-1][1] + 1) // 2, 3))
+        rows = [0, sum(s[0] for s in shapes[1:])]
+
+        def level_rows(n):
+            rows[0] += n
+            report(0.5 + rows[0] / rows[1] / 2)
+
+        for i, shape in enumerate(shapes[1:], 1):
+            smaller = np.lib.format.open_memmap(os.path.join(tmp, f"level_{i}.npy"), mode="w+",
+                                                dtype=np.uint8, shape=shape)
+            _downsample_into(level, smaller, level_rows)
+            level.flush()
+            level = smaller
+        level.flush()
+        del level
+        with open(os.path.join(tmp, "pyramid.json"), "w", encoding="utf-8") as f:
+            json.dump({"source": _source_stamp(image_path), "levels": [list(s) for s in shapes]}, f)
+        if os.path.exists(target):
+            shutil.rmtree(target, ignore_errors=True)
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            pass  # another opener (e.g. the prefetcher) finished first; use theirs
+    finally:
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def _load_pyramid(image_path):
+    target = pyramid_path(image_path)
+    try:
+        with open(os.path.join(target, "pyramid.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["source"] != _source_stamp(image_path):
+            return None
+        return [np.load(os.path.join(target, f"level_{i}.npy"), mmap_mode="r") for i in range(len(meta["levels"]))]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class PyramidSession(ImageSession):
+    """Session over a memory-mapped pyramid; ``image`` is the full-resolution map."""
+
+    def __init__(self, path, levels):
+        self.levels = levels
+        super().__init__(path, image=levels[0])
+
+    def level_count(self):
+        return len(self.levels)
+
+    def level_shape(self, level):
+        return self.levels[level].shape
+
+    def read_level(self, level, x1, y1, x2, y2):
+        return self.levels[level][y1:y2, x1:x2]
+
+    def image_bytes(self):
+        return 0  # mapped from disk, paged in and out by the OS
+
+    def scaled(self, scale, interpolation=cv2.INTER_LINEAR):
+        level = self.levels[self.level_for_scale(scale)]
+        h, w = self.shape[:2]
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        return cv2.resize(np.asarray(level), size, interpolation=interpolation)
+
+
+# ---------------- background conversion ----------------
+_builds = {}
+_builds_lock = threading.Lock()
+
+
+class PyramidBuild(threading.Thread):
+    """One background conversion of an image into its pyramid cache; ``done`` is set when it ends."""
+
+    def __init__(self, path):
+        super().__init__(daemon=True)
+        self.path = path
+        self.progress = 0.0
+        self.levels = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            # a build that finished since the caller looked may already have left a cache
+            self.levels = _load_pyramid(self.path)
+            if self.levels is None and build_pyramid(self.path, self._report) is not None:
+                self.levels = _load_pyramid(self.path)
+            if self.levels is None:
+                print(f"Could not convert {self.path} into a pyramid")
+        except Exception as e:
+            print(f"Could not convert {self.path} into a pyramid: {e}")
+        finally:
+            with _builds_lock:
+                _builds.pop(os.path.abspath(self.path), None)
+            self.done.set()
+
+    def _report(self, fraction):
+        self.progress = fraction
+
+
+def start_build(path):
+    """The running conversion of path, started if there is none."""
+    key = os.path.abspath(path)
+    with _builds_lock:
+        build = _builds.get(key)
+        if build is None:
+            build = _builds[key] = PyramidBuild(path)
+            build.start()
+    return build
+
+
+class ConvertingSession(ImageSession):
+    """Session for an image whose pyramid is still being built.
+
+    Until ``full_ready`` (the build's ``done``) is set, level 1 is a grey
+    placeholder and the session reports the build's ``progress``; afterwards it
+    reads the pyramid exactly like a ``PyramidSession``. Reads that need real
+    pixels (``region``, ``level_for_side``) wait for the build.
+    """
+
+    def __init__(self, path, build, size, opened_at=None):
+        self.build = build
+        self.full_shape = (size[1], size[0], 3)
+        factor = 1
+        while max(size) > PLACEHOLDER_SIDE * factor:
+            factor *= 2
+        self.placeholder = np.full((-(-size[1] // factor), -(-size[0] // factor), 3), PLACEHOLDER_GRAY, np.uint8)
+        super().__init__(path, image=self.placeholder, opened_at=opened_at)
+        self.full_ready = build.done
+
+    @property
+    def levels(self):
+        return self.build.levels
+
+    @property
+    def progress(self):
+        return self.build.progress
+
+    @property
+    def loaded(self):
+        return self.levels is not None or not self.full_ready.is_set()
+
+    @property
+    def shape(self):
+        return self.levels[0].shape if self.levels else self.full_shape
+
+    def loading_note(self):
+        if self.levels:
+            return ", converted"
+        return ", conversion failed" if self.full_ready.is_set() else f", converting {self.progress:.0%}"
+
+    def level_count(self):
+        return len(self.levels) if self.levels else 2
+
+    def level_shape(self, level):
+        if self.levels:
+            return self.levels[level].shape
+        return self.full_shape if level == 0 else self.placeholder.shape
+
+    def read_level(self, level, x1, y1, x2, y2):
+        if level == 0:
+            self.full_ready.wait()
+        if self.levels:
+            return self.levels[level][y1:y2, x1:x2]
+        if level == 0:  # conversion failed
+            return np.full((y2 - y1, x2 - x1, 3), PLACEHOLDER_GRAY, np.uint8)
+        return self.placeholder[y1:y2, x1:x2]
+
+    def level_for_scale(self, scale):
+        return super().level_for_scale(scale) if self.levels else 1
+
+    def level_for_side(self, max_side):
+        self.full_ready.wait()
+        return super().level_for_side(max_side) if self.levels else None
+
+    def image_bytes(self):
+        return self.placeholder.nbytes  # the pyramid is mapped from disk
+
+    def scaled(self, scale, interpolation=cv2.INTER_LINEAR):
+        level = self.level_for_scale(scale)
+        h, w = self.level_shape(level)[:2]
+        pixels = np.asarray(self.read_level(level, 0, 0, w, h))
+        h, w = self.shape[:2]
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        return cv2.resize(pixels, size, interpolation=interpolation)
+
+
+# ---------------- tiled TIFF ----------------
+class TiffSession(ImageSession):
+    """Reads a tiled TIFF's tiles on demand, keeping the most recent ones decoded."""
+
+    def __init__(self, path, tif, pages, cache_bytes=256 * 1024 * 1024):
+        self.tif = tif
+        self.pages = pages
+        self.lock = threading.Lock()
+        self.tiles = OrderedDict()
+        self.tile_bytes = 0
+        self.cache_bytes = cache_bytes
+        super().__init__(path)
+
+    def decode(self, path):
+        return None  # never materialised; tiles are read on demand
+
+    @property
+    def loaded(self):
+        return True
+
+    @property
+    def shape(self):
+        return self.level_shape(0)
+
+    def level_count(self):
+        return len(self.pages)
+
+    def level_shape(self, level):
+        page = self.pages[level]
+        return page.imagelength, page.imagewidth, 3
+
+    def _tile(self, level, row, col):
+        key = (level, row, col)
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+                return tile
+            page = self.pages[level]
+            across = -(-page.imagewidth // page.tilewidth)
+            index = row * across + col
+            fh = self.tif.filehandle
+            fh.seek(page.dataoffsets[index])
+            data = fh.read(page.databytecounts[index])
+        segment = page.decode(data, index, jpegtables=page.jpegtables)[0]
+        tile = _to_bgr(np.asarray(segment).reshape(page.tilelength, page.tilewidth, -1))
+        with self.lock:
+            self.tiles[key] = tile
+            self.tile_bytes += tile.nbytes
+            while self.tile_bytes > self.cache_bytes and len(self.tiles) > 1:
+                self.tile_bytes -= self.tiles.popitem(last=False)[1].nbytes
+        return tile
+
+    def read_level(self, level, x1, y1, x2, y2):
+        page = self.pages[level]
+        th, tw = page.tilelength, page.tilewidth
+        out = np.empty((y2 - y1, x2 - x1, 3), np.uint8)
+        for row in range(y1 // th, (y2 - 1) // th + 1):
+            for col in range(x1 // tw, (x2 - 1) // tw + 1):
+                tile = self._tile(level, row, col)
+                ty1, tx1 = row * th, col * tw
+                sy1, sy2 = max(y1, ty1), min(y2, ty1 + th)
+                sx1, sx2 = max(x1, tx1), min(x2, tx1 + tw)
+                out[sy1 - y1:sy2 - y1, sx1 - x1:sx2 - x1] = tile[sy1 - ty1:sy2 - ty1, sx1 - tx1:sx2 - tx1]
+        return out
+
+    def image_bytes(self):
+        return self.tile_bytes
+
+    def scaled(self, scale, interpolation=cv2.INTER_LINEAR):
+        h, w = self.shape[:2]
+        return self.render_view(0, 0, 0, 0, int(w * scale) + 1, int(h * scale) + 1, scale, interpolation)[0]
+
+
+def _open_tiff(path):
+    try:
+        import tifffile
+    except ImportError:
+        return None
+    try:
+        tif = tifffile.TiffFile(path)
+    except (OSError, ValueError):
+        return None
+    series = tif.series[0]
+    pages = [level.pages[0] for level in getattr(series, "levels", [series])]
+    if not all(page.is_tiled and page.planarconfig == 1 for page in pages):
+        tif.close()
+        return None
+    return TiffSession(path, tif, pages)
+
+
+def open_tiled(path):
+    """Tiled session for path: direct tiled-TIFF access if possible, else the pyramid cache.
+
+    Without a cache yet, returns a ``ConvertingSession`` while the pyramid is built in the background.
+    """
+    if path.lower().endswith((".tif", ".tiff")):
+        session = _open_tiff(path)
+        if session is not None:
+            return session
+    levels = _load_pyramid(path)
+    if levels:
+        return PyramidSession(path, levels)
+    size = read_image_size(path)
+    return ConvertingSession(path, start_build(path), size) if size else None
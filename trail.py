@@ -4,6 +4,8 @@ from PIL import Image, ImageTk
 import os
 import cv2
 import json
+from image_session import FAST_INTERPOLATION, idle_interpolation, open_session
+from render_scheduler import RenderScheduler
 
 class DetectionLabelApp:
     def __init__(self, root):
@@ -21,6 +23,7 @@ class DetectionLabelApp:
         self.drag_start = None
         self.editing_box = None
         self.resizing_corner = None
+        self.session = None
 
         self.setup_ui()
 
@@ -58,6 +61,7 @@ class DetectionLabelApp:
 
         self.canvas = tk.Canvas(self.main_frame, bg='gray', cursor="cross")
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.renderer = RenderScheduler(self.canvas, self.redraw, name="Detection view")
         self.canvas.bind("<Button-1>", self.on_left_click)
         self.canvas.bind("<Button-3>", self.on_right_click)
         self.canvas.bind("<B1-Motion>", self.on_drag)
@@ -103,24 +107,32 @@ class DetectionLabelApp:
     def load_image(self):
         filename = self.images[self.current_image_index]
         path = os.path.join(self.image_folder, filename)
-        self.image = Image.open(path)
-        self.original_image = self.image.copy()
-        self.canvas.delete("all")
+        session = open_session(path)
+        if not session.loaded:
+            messagebox.showerror("Error", f"Cannot open image: {path}")
+            return
+        self.session = session
         self.zoom_scale = 1.0
         self.offset_x = 0
         self.offset_y = 0
+        self.renderer.render_now()
+
+    def redraw(self):
+        self.canvas.delete("all")
         self.display_image()
         self.draw_boxes()
 
     def display_image(self):
-        w, h = int(self.image.width * self.zoom_scale), int(self.image.height * self.zoom_scale)
-        try:
-            resample_method = Image.Resampling.LANCZOS
-        except:
-            resample_method = Image.ANTIALIAS
-        resized = self.original_image.resize((w, h), resample_method)
-        self.tk_image = ImageTk.PhotoImage(resized)
-        self.canvas.create_image(self.offset_x, self.offset_y, anchor="nw", image=self.tk_image, tags="IMG")
+        # only the visible part is resampled, from the nearest zoom level: a cheap filter
+        # while zooming or panning, Lanczos/area once the view settles
+        interpolation = FAST_INTERPOLATION if self.renderer.interacting else idle_interpolation(self.zoom_scale)
+        view = self.session.render_view(self.offset_x, self.offset_y, 0, 0, max(1, self.canvas.winfo_width()),
+                                        max(1, self.canvas.winfo_height()), self.zoom_scale, interpolation)
+        if view is None:
+            return
+        pixels, x, y, _ = view
+        self.tk_image = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB)))
+        self.canvas.create_image(x, y, anchor="nw", image=self.tk_image, tags="IMG")
 
     def get_class_color(self, cls):
         index = self.classes.index(cls) if cls in self.classes else 0
@@ -144,8 +156,8 @@ class DetectionLabelApp:
         with open(json_path, 'w') as f:
             json.dump(data, f)
 
-        if data and self.original_image:
-            img_w, img_h = self.original_image.size
+        if data and self.session:
+            img_h, img_w = self.session.shape[:2]
             with open(txt_path, 'w') as f:
                 for x1, y1, x2, y2, cls in data:
                     class_id = self.classes.index(cls)
@@ -242,9 +254,7 @@ class DetectionLabelApp:
     def zoom(self, event):
         factor = 1.1 if event.delta > 0 else 0.9
         self.zoom_scale *= factor
-        self.canvas.delete("all")
-        self.display_image()
-        self.draw_boxes()
+        self.renderer.request(interactive=True)
 
     def start_pan(self, event):
         self.drag_start = (event.x, event.y)
@@ -256,9 +266,7 @@ class DetectionLabelApp:
             self.offset_x += dx
             self.offset_y += dy
             self.drag_start = (event.x, event.y)
-            self.canvas.delete("all")
-            self.display_image()
-            self.draw_boxes()
+            self.renderer.request(interactive=True)
 
 if __name__ == '__main__':
     root = tk.Tk()